@@ -3,6 +3,7 @@ import backgroundVideo from "../assets/video.mp4";
 import { FaThumbsUp } from 'react-icons/fa'; // Import Thumbs-Up icon
 import { useNavigate } from "react-router-dom";
 import Loading from "../Components/Loading.tsx"; // Import the Loading component
+import { saveSessionToken } from "../session";
 
 // Define types for form data and error state
 interface FormData {
@@ -140,6 +141,7 @@ const BuyerLogin: React.FC = () => {
         const loginData = await loginResponse.json();
 
         if (loginResponse.ok && loginData.message === "true") {
+          saveSessionToken(loginData.session_token, "buyer");
           // Step 3: If login is successful, navigate to the ExploreBuyer component
           navigate("/buyerlanding", { state: { user: loginData } });
         } else {
@@ -1,151 +1,25 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import logo from "../assets/logo5.png";
 import { Link, useNavigate } from 'react-router-dom';
 import { FaHeart, FaSignOutAlt, FaFilter, FaTimes, FaSearch } from 'react-icons/fa';
-
-interface Property {
-  id: number;
-  name: string;
-  location: string;
-  price: string;
-  images: string[];
-  size: string;
-  amenities: string[];
-}
+import { useExplore, PRICE_RANGE_MAX } from '../useExplore';
 
 const Explore: React.FC = () => {
-  const [properties, setProperties] = useState<Property[]>([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState('');
-
-  // Filter states
-  const [showFilterModal, setShowFilterModal] = useState(false);
-  const [selectedType, setSelectedType] = useState('');
-  const [selectedPriceRange, setSelectedPriceRange] = useState([0, 1000000]);
-  const [selectedLocation, setSelectedLocation] = useState('');
-  const [selectedSize, setSelectedSize] = useState('');
-  const [selectedAmenities, setSelectedAmenities] = useState<string[]>([]);
-  const [citySearch, setCitySearch] = useState('');
-  const [searchQuery, setSearchQuery] = useState('');
+  const {
+    properties, loading, error,
+    showFilterModal, setShowFilterModal, handleFilterClick, handleOkayClick,
+    selectedType, setSelectedType, selectedPriceRange, setSelectedPriceRange, setSelectedLocation,
+    selectedSize, setSelectedSize, selectedAmenities, setSelectedAmenities, handleAmenityChange,
+    amenitiesList, amenityCount, facets, largestBucket,
+    searchQuery, setSearchQuery, citySearch, setCitySearch, citySuggestions, handleCitySearchChange,
+    nextCursor, loadingMore, handleLoadMore,
+  } = useExplore();
 
   // Login modal state
   const [showLoginModal, setShowLoginModal] = useState(false);
 
-  // List of Indian cities and amenities for filters
-  const indianCities = [
-    "Mumbai, Maharashtra",
-    "Bangalore, Karnataka",
-    "Hyderabad, Telangana",
-    "Delhi, Delhi",
-    "Chennai, Tamil Nadu",
-    "Pune, Maharashtra",
-    "Kolkata, West Bengal",
-    "Ahmedabad, Gujarat",
-    "Jaipur, Rajasthan",
-    "Lucknow, Uttar Pradesh",
-  ];
-
-  const amenitiesList = ["Water", "Electricity", "Park", "Parking", "Pool", "Forest", "Gym", "Security"];
-
   const navigate = useNavigate();
 
-  // Fetch properties from API
-  useEffect(() => {
-    const fetchProperties = async () => {
-      try {
-        const response = await fetch('http://127.0.0.1:5000/explore');
-
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const data = await response.json();
-
-        // Access the properties array from the response
-        if (!data.properties || !Array.isArray(data.properties)) {
-          throw new Error('Expected properties array in response');
-        }
-
-        // Transform the properties data
-        const formattedProperties = data.properties.map((property: any) => ({
-          id: property.id,
-          name: property.name,
-          location: property.location,
-          price: property.price,
-          images: property.images || [],
-          size: property.size,
-          amenities: property.amenities || []
-        }));
-
-        setProperties(formattedProperties);
-      } catch (err) {
-        setError(err instanceof Error ? err.message : 'An unknown error occurred');
-      } finally {
-        setLoading(false);
-      }
-    };
-
-    fetchProperties();
-  }, []);
-
-  // Handle filter button click
-  const handleFilterClick = () => {
-    setShowFilterModal(true);
-  };
-
-  // Handle okay button click in filter modal
-  const handleOkayClick = () => {
-    if (selectedSize && isNaN(Number(selectedSize))) {
-      setError('Size must be a number');
-      return;
-    }
-    setError('');
-    setShowFilterModal(false);
-  };
-
-  // Handle amenity selection
-  const handleAmenityChange = (amenity: string) => {
-    if (selectedAmenities.includes(amenity)) {
-      setSelectedAmenities(selectedAmenities.filter((a) => a !== amenity));
-    } else {
-      setSelectedAmenities([...selectedAmenities, amenity]);
-    }
-  };
-
-  // Filter cities based on search
-  const filteredCities = indianCities.filter((city) =>
-    city.toLowerCase().includes(citySearch.toLowerCase())
-  );
-
-  // Filter properties based on selected filters
-  const filteredProperties = properties.filter((property) => {
-    // Filter by search query
-    if (
-      searchQuery &&
-      !property.name.toLowerCase().includes(searchQuery.toLowerCase()) &&
-      !property.location.toLowerCase().includes(searchQuery.toLowerCase())
-    ) {
-      return false;
-    }
-
-    // Filter by price range
-    const price = parseFloat(property.price.replace(/,/g, ''));
-    if (price < selectedPriceRange[0] || price > selectedPriceRange[1]) return false;
-
-    // Filter by location
-    if (selectedLocation && property.location !== selectedLocation) return false;
-
-    // Filter by size
-    if (selectedSize && property.size !== selectedSize) return false;
-
-    // Filter by amenities
-    if (selectedAmenities.length > 0 && !selectedAmenities.every((amenity) => property.amenities.includes(amenity))) {
-      return false;
-    }
-
-    return true;
-  });
-
   // Handle login navigation
   const handleLogin = () => {
     setShowLoginModal(false);
@@ -235,15 +109,16 @@ const Explore: React.FC = () => {
 
       {/* Property List Section */}
       <div className="max-w-7xl mx-auto p-6">
-        {filteredProperties.length === 0 ? (
+        {properties.length === 0 ? (
           <div className="text-center bg-white p-6 rounded-lg shadow-md">
             <p className="text-gray-500">No properties match the selected filters.</p>
             <button
               onClick={() => {
                 setSearchQuery('');
                 setSelectedType('');
-                setSelectedPriceRange([0, 100000000]);
+                setSelectedPriceRange([0, PRICE_RANGE_MAX]);
                 setSelectedLocation('');
+                setCitySearch('');
                 setSelectedSize('');
                 setSelectedAmenities([]);
               }}
@@ -254,7 +129,7 @@ const Explore: React.FC = () => {
           </div>
         ) : (
           <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4 gap-6">
-            {filteredProperties.map((property) => (
+            {properties.map((property) => (
               <div key={property.id} className="bg-white shadow-md rounded-2xl overflow-hidden flex flex-col">
                 {/* Display only the first image */}
                 <img
@@ -281,6 +156,17 @@ const Explore: React.FC = () => {
             ))}
           </div>
         )}
+        {nextCursor && (
+          <div className="flex justify-center mt-6">
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="px-6 py-2 bg-[#054a91] text-white rounded-full hover:bg-[#032b60] transition duration-300 disabled:opacity-50"
+            >
+              {loadingMore ? 'Loading...' : 'Load More'}
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Filter Modal */}
@@ -311,10 +197,22 @@ const Explore: React.FC = () => {
             {/* Price Range */}
             <div className="mb-3">
               <label className="block text-sm font-medium text-gray-700">Price Range</label>
+              {facets && (
+                <div className="flex items-end h-10 gap-px mt-1">
+                  {facets.price_histogram.map((bucket) => (
+                    <div
+                      key={bucket.min}
+                      title={`₹${bucket.min}${bucket.max ? ` – ₹${bucket.max}` : '+'}: ${bucket.count}`}
+                      className="flex-1 bg-[#054a91] opacity-60"
+                      style={{ height: `${(100 * bucket.count) / largestBucket}%` }}
+                    />
+                  ))}
+                </div>
+              )}
               <input
                 type="range"
                 min="0"
-                max="100000000"
+                max={PRICE_RANGE_MAX}
                 step="1000"
                 value={selectedPriceRange[0]}
                 onChange={(e) => setSelectedPriceRange([Number(e.target.value), selectedPriceRange[1]])}
@@ -323,7 +221,7 @@ const Explore: React.FC = () => {
               <input
                 type="range"
                 min="0"
-                max="100000000"
+                max={PRICE_RANGE_MAX}
                 step="1000"
                 value={selectedPriceRange[1]}
                 onChange={(e) => setSelectedPriceRange([selectedPriceRange[0], Number(e.target.value)])}
@@ -331,25 +229,26 @@ const Explore: React.FC = () => {
               />
               <div className="flex justify-between text-sm">
                 <span>₹{selectedPriceRange[0]}</span>
-                <span>₹{selectedPriceRange[1]}</span>
+                <span>{selectedPriceRange[1] < PRICE_RANGE_MAX ? `₹${selectedPriceRange[1]}` : "Any"}</span>
               </div>
             </div>
 
             {/* Location */}
             <div className="mb-3">
               <label className="block text-sm font-medium text-gray-700">Location</label>
-              <select
-                value={selectedLocation}
-                onChange={(e) => setSelectedLocation(e.target.value)}
+              <input
+                type="text"
+                list="city-suggestions"
+                value={citySearch}
+                onChange={(e) => handleCitySearchChange(e.target.value)}
+                placeholder="Search City"
                 className="w-full p-2 border rounded text-sm"
-              >
-                <option value="">Select City</option>
-                {indianCities.map((city, index) => (
-                  <option key={index} value={city}>
-                    {city}
-                  </option>
+              />
+              <datalist id="city-suggestions">
+                {citySuggestions.map((city) => (
+                  <option key={city} value={city} />
                 ))}
-              </select>
+              </datalist>
             </div>
 
             {/* Size/Area */}
@@ -377,7 +276,10 @@ const Explore: React.FC = () => {
                       onChange={() => handleAmenityChange(amenity)}
                       className="mr-2"
                     />
-                    <span>{amenity}</span>
+                    <span>
+                      {amenity}
+                      {facets && <span className="text-gray-400"> ({amenityCount(amenity)})</span>}
+                    </span>
                   </label>
                 ))}
               </div>
@@ -388,7 +290,7 @@ const Explore: React.FC = () => {
                 Cancel
               </button>
               <button onClick={handleOkayClick} className="px-4 py-2 bg-[#054a91] text-white rounded text-sm hover:bg-[#032b60]">
-                Apply
+                Apply{facets ? ` (${facets.total})` : ''}
               </button>
             </div>
           </div>
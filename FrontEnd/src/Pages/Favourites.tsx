@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
 import { FaTimes, FaArrowLeft, FaHeart } from 'react-icons/fa';
 import { Link, useLocation, useNavigate } from 'react-router-dom';
+import { authFetch } from '../session';
 
 const Favourites: React.FC = () => {
   const location = useLocation();
@@ -19,7 +20,7 @@ const Favourites: React.FC = () => {
           throw new Error('No buyer ID found');
         }
 
-        const response = await fetch('http://127.0.0.1:5000/cart', {
+        const response = await authFetch('http://127.0.0.1:5000/cart', {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -79,7 +80,7 @@ const Favourites: React.FC = () => {
   // Handle remove from favorites
   const handleRemoveFavourite = async (propertyId: number) => {
     try {
-      const response = await fetch(`http://127.0.0.1:5000/cart/${buyer_id}/${propertyId}`, {
+      const response = await authFetch(`http://127.0.0.1:5000/cart/${buyer_id}/${propertyId}`, {
         method: 'DELETE',
       });
 
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
 import { FaArrowLeft, FaHeart, FaTimes } from 'react-icons/fa';
 import { useLocation, useNavigate,Link} from 'react-router-dom';
+import { authFetch } from '../session';
 
 interface Property {
   id: number;
@@ -29,7 +30,7 @@ const Interested: React.FC = () => {
           throw new Error('Please login to view interested properties');
         }
 
-        const response = await fetch('http://127.0.0.1:5000/interest', {
+        const response = await authFetch('http://127.0.0.1:5000/interest', {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -62,14 +63,13 @@ const Interested: React.FC = () => {
   // Handle remove from interested list
   const handleRemoveInterested = async (id: number) => {
     try {
-      const response = await fetch(`http://127.0.0.1:5000/interest/remove`, {
-        method: 'DELETE',
+      const response = await authFetch(`http://127.0.0.1:5000/interest/batch`, {
+        method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          buyer_id: buyer_id,
-          property_id: id
+          remove: [id]
         }),
       });
 
@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { FaStar, FaHeart, FaTimes, FaChevronLeft, FaChevronRight } from 'react-icons/fa';
 import { motion } from 'framer-motion';
+import { authFetch } from '../session';
 
 interface PropertyData {
   id: number;
@@ -61,7 +62,7 @@ const Property: React.FC = () => {
   // Handle Add to Favorites with API call
   const handleAddToFavorites = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/cart/add', {
+      const response = await authFetch('http://127.0.0.1:5000/cart/add', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -107,7 +108,7 @@ const Property: React.FC = () => {
   // Handle I'm Interested with API call
   const handleImInterested = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/interest/add', {
+      const response = await authFetch('http://127.0.0.1:5000/interest/add', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -3,6 +3,7 @@ import backgroundVideo from "../assets/video.mp4";
 import { FaThumbsUp, FaEye, FaEyeSlash } from 'react-icons/fa';
 import { useNavigate } from "react-router-dom";
 import Loading from "../Components/Loading.tsx";
+import { saveSessionToken } from "../session";
 
 interface FormData {
   businessName: string;
@@ -140,10 +141,11 @@ const SellerLogin: React.FC = () => {
 
         const loginData = await loginResponse.json();
 
-        if (loginResponse.ok && loginData.message === "true") {
+        if (loginResponse.ok && loginData.session_token) {
+          saveSessionToken(loginData.session_token, "seller");
           navigate("/seller-dashboard", { state: { user: loginData } });
         } else {
-          setError(loginData.message || "Seller login failed.");
+          setError(loginData.error || "Seller login failed.");
         }
       } catch (error) {
         setError("Error during seller login: " + error);
@@ -7,7 +7,7 @@ import {
 } from "react-icons/fa";
 import { Link, useNavigate } from "react-router-dom";
 import logo from "../assets/logo5.png";
-import axios from "axios";
+import { authFetch } from "../session";
 
 const UploadProperty: React.FC = () => {
     const navigate = useNavigate();
@@ -25,6 +25,7 @@ const UploadProperty: React.FC = () => {
         contacts: "",
         type: "",
     });
+    const [photoProgress, setPhotoProgress] = useState("");
 
     const handleChange = (e: React.ChangeEvent<HTMLInputElement | HTMLTextAreaElement>) => {
         setFormData((prev) => ({
@@ -60,35 +61,54 @@ const UploadProperty: React.FC = () => {
         }));
     };
 
-    const uploadImagesToCloudinary = async () => {
-        const imageUrls: string[] = [];
-        const uploadPreset = "property_name"; // Replace with your Cloudinary upload preset
-        const cloudName = "dpqjpmqfr"; // Replace with your Cloudinary cloud name
-
-        for (const image of formData.images) {
+    const uploadImages = async () => {
+        // One request per image, all at once; the server stores each under its content hash
+        const uploads = formData.images.map(async (image) => {
             const formDataToUpload = new FormData();
-            formDataToUpload.append("file", image);
-            formDataToUpload.append("upload_preset", uploadPreset);
+            formDataToUpload.append("images", image);
 
             try {
-                const response = await axios.post(
-                    `https://api.cloudinary.com/v1_1/${cloudName}/image/upload`,
-                    formDataToUpload
-                );
-                const imageUrl = response.data.secure_url;
-
-                if (imageUrl.startsWith(`https://res.cloudinary.com/${cloudName}/`)) {
-                    imageUrls.push(imageUrl);
-                    console.log("Image uploaded successfully:", imageUrl);
-                } else {
-                    console.error("Invalid Cloudinary URL:", imageUrl);
+                const response = await authFetch("http://127.0.0.1:5000/images", {
+                    method: "POST",
+                    body: formDataToUpload,
+                });
+                const result = await response.json();
+                if (!response.ok) {
+                    console.error("Image upload failed:", result.error);
+                    return [];
                 }
+                return result.images as string[];
             } catch (error) {
                 console.error("Image upload failed:", error);
+                return [];
             }
-        }
+        });
+
+        return (await Promise.all(uploads)).flat();
+    };
 
-        return imageUrls;
+    const watchPhotoProgress = async (propertyId: number) => {
+        // The server sizes the photos in the background; poll until it's done with them
+        while (true) {
+            try {
+                const response = await authFetch(`http://127.0.0.1:5000/upload/progress/${propertyId}`);
+                const progress = await response.json();
+                if (!response.ok || progress.status === "done") {
+                    setPhotoProgress("");
+                    return;
+                }
+                if (progress.status === "failed") {
+                    setPhotoProgress(`Some photos couldn't be processed: ${progress.error}`);
+                    return;
+                }
+                setPhotoProgress(`Processing photos ${progress.done}/${progress.total}`);
+            } catch (error) {
+                console.error("Error checking photo progress:", error);
+                setPhotoProgress("");
+                return;
+            }
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+        }
     };
 
     const handleSubmit = async (e: React.FormEvent<HTMLFormElement>) => {
@@ -108,7 +128,7 @@ const UploadProperty: React.FC = () => {
             return;
         }
 
-        const uploadedImageUrls = await uploadImagesToCloudinary();
+        const uploadedImageUrls = await uploadImages();
         if (uploadedImageUrls.length === 0) {
             alert("Image upload failed. Please try again.");
             return;
@@ -120,14 +140,18 @@ const UploadProperty: React.FC = () => {
         };
 
         try {
-            const response = await fetch("http://127.0.0.1:5000/upload", {
+            const response = await authFetch("http://127.0.0.1:5000/upload", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify(propertyData),
             });
 
             if (response.ok) {
-                alert("Property uploaded successfully!");
+                const result = await response.json();
+                watchPhotoProgress(result.id);
+                alert(result.duplicate_of
+                    ? `Property uploaded, but it looks like a copy of listing #${result.duplicate_of}.`
+                    : "Property uploaded successfully!");
                 setFormData({
                     seller_id: 1,
                     name: "",
@@ -345,6 +369,9 @@ const UploadProperty: React.FC = () => {
                         >
                             Upload Property
                         </button>
+                        {photoProgress && (
+                            <p className="text-center text-gray-700">{photoProgress}</p>
+                        )}
                     </form>
                 </div>
             </div>
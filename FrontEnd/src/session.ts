@@ -0,0 +1,56 @@
+// Session token issued by the API at login, sent back as a Bearer token on buyer/seller requests
+const SESSION_TOKEN_KEY = 'session_token';
+const SESSION_ROLE_KEY = 'session_role';
+const SESSION_ISSUED_KEY = 'session_issued_at';
+
+// The API's tokens last an hour (SESSION_TOKEN_MAX_AGE); swap them for fresh ones once half of that is gone
+const REFRESH_AFTER_MS = 30 * 60 * 1000;
+
+type Role = 'buyer' | 'seller';
+
+const LOGIN_PAGES: Record<Role, string> = { buyer: '/buyerLogin', seller: '/sellerLogin' };
+
+export const saveSessionToken = (token: string | undefined, role: Role) => {
+  if (token) {
+    localStorage.setItem(SESSION_TOKEN_KEY, token);
+    localStorage.setItem(SESSION_ROLE_KEY, role);
+    localStorage.setItem(SESSION_ISSUED_KEY, String(Date.now()));
+  }
+};
+
+export const clearSession = () => {
+  localStorage.removeItem(SESSION_TOKEN_KEY);
+  localStorage.removeItem(SESSION_ROLE_KEY);
+  localStorage.removeItem(SESSION_ISSUED_KEY);
+};
+
+export const authHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem(SESSION_TOKEN_KEY);
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
+// Renew the token while it is still valid, so an active user stays signed in past its hour
+const refreshSession = async () => {
+  const issuedAt = Number(localStorage.getItem(SESSION_ISSUED_KEY));
+  const role = localStorage.getItem(SESSION_ROLE_KEY) as Role | null;
+  if (!role || !localStorage.getItem(SESSION_TOKEN_KEY) || Date.now() - issuedAt < REFRESH_AFTER_MS) return;
+  try {
+    const response = await fetch('http://127.0.0.1:5000/session/refresh', { method: 'POST', headers: authHeaders() });
+    if (response.ok) saveSessionToken((await response.json()).session_token, role);
+  } catch {
+    // Offline or the API is down: the current token is still good until it expires
+  }
+};
+
+// fetch() signed with the session token. A 401 means the session has expired or
+// was never there, so the token is dropped and the user sent back to log in.
+export const authFetch = async (url: string, init: RequestInit = {}) => {
+  await refreshSession();
+  const role = (localStorage.getItem(SESSION_ROLE_KEY) as Role | null) ?? 'buyer';
+  const response = await fetch(url, { ...init, headers: { ...(init.headers as Record<string, string>), ...authHeaders() } });
+  if (response.status === 401) {
+    clearSession();
+    window.location.assign(LOGIN_PAGES[role]);
+  }
+  return response;
+};
@@ -0,0 +1,217 @@
+import { useState, useEffect } from 'react';
+
+// Listing search shared by the public and buyer Explore pages: filter state, the
+// debounced search box, cursor paging, location autocomplete and the filter modal's counts
+
+export interface Property {
+  id: number;
+  name: string;
+  location: string;
+  price: string;
+  images: string[];
+  size: string;
+  amenities: string[];
+}
+
+interface FacetCount {
+  name: string;
+  count: number;
+}
+
+interface Facets {
+  total: number;
+  amenities: FacetCount[];
+  locations: FacetCount[];
+  price_histogram: { min: number; max: number | null; count: number }[];
+}
+
+// Top of the price slider in rupees (10 crore)
+export const PRICE_RANGE_MAX = 100000000;
+
+// How long typing must pause before the search box queries the server
+const SEARCH_DEBOUNCE_MS = 300;
+
+const AMENITIES = ["Water", "Electricity", "Park", "Parking", "Pool", "Forest", "Gym", "Security"];
+
+export const useExplore = () => {
+  const [properties, setProperties] = useState<Property[]>([]);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState('');
+
+  // Filter states
+  const [showFilterModal, setShowFilterModal] = useState(false);
+  const [selectedType, setSelectedType] = useState('');
+  const [selectedPriceRange, setSelectedPriceRange] = useState([0, PRICE_RANGE_MAX]);
+  const [selectedLocation, setSelectedLocation] = useState('');
+  const [selectedSize, setSelectedSize] = useState('');
+  const [selectedAmenities, setSelectedAmenities] = useState<string[]>([]);
+  const [citySearch, setCitySearch] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');
+  // The search text as last sent to the server, trailing the box while the user types
+  const [submittedQuery, setSubmittedQuery] = useState('');
+
+  // Location suggestions come from the server's autocomplete, most listings first
+  const [citySuggestions, setCitySuggestions] = useState<string[]>([]);
+
+  // Counts shown in the filter modal for the filters as they stand
+  const [facets, setFacets] = useState<Facets | null>(null);
+
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // Filtering, sorting and pagination happen server-side; send the active filters as query params
+  const buildQuery = (cursor?: string | null) => {
+    const params = new URLSearchParams();
+    if (submittedQuery) {
+      params.set('q', submittedQuery);
+      params.set('fuzzy', '1');  // Tolerate typos and alternate city names when nothing matches as typed
+    }
+    // A bound left at the end of the slider is no bound, so unpriced and dearer listings still show
+    if (selectedPriceRange[0] > 0) params.set('min_price', String(selectedPriceRange[0]));
+    if (selectedPriceRange[1] < PRICE_RANGE_MAX) params.set('max_price', String(selectedPriceRange[1]));
+    if (selectedLocation) params.set('location', selectedLocation);
+    if (selectedType) params.set('type', selectedType);
+    if (selectedSize) params.set('size', selectedSize);
+    if (selectedAmenities.length > 0) params.set('amenities', selectedAmenities.join(','));
+    if (cursor) params.set('cursor', cursor);
+    return params.toString();
+  };
+
+  // Fetch a page of properties from API
+  const fetchProperties = async (cursor?: string | null) => {
+    const response = await fetch(`http://127.0.0.1:5000/explore?${buildQuery(cursor)}`);
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const data = await response.json();
+
+    if (!data.properties || !Array.isArray(data.properties)) {
+      throw new Error('Expected properties array in response');
+    }
+
+    const formattedProperties: Property[] = data.properties.map((property: any) => ({
+      id: property.id,
+      name: property.name,
+      location: property.location,
+      price: property.price,
+      images: property.images || [],
+      size: property.size,
+      amenities: property.amenities || []
+    }));
+
+    return { properties: formattedProperties, nextCursor: data.next_cursor ?? null };
+  };
+
+  useEffect(() => {
+    const timer = setTimeout(() => setSubmittedQuery(searchQuery.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  // Reload the first page whenever a filter changes
+  useEffect(() => {
+    let cancelled = false;
+
+    fetchProperties()
+      .then((page) => {
+        if (cancelled) return;
+        setProperties(page.properties);
+        setNextCursor(page.nextCursor);
+      })
+      .catch((err) => {
+        if (!cancelled) setError(err instanceof Error ? err.message : 'An unknown error occurred');
+      })
+      .finally(() => {
+        if (!cancelled) setLoading(false);
+      });
+
+    return () => {
+      cancelled = true;
+    };
+  }, [submittedQuery, selectedPriceRange, selectedLocation, selectedType, selectedSize, selectedAmenities]);
+
+  // Append the next page using the cursor returned by the previous one
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchProperties(nextCursor);
+      setProperties((current) => [...current, ...page.properties]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'An unknown error occurred');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Handle filter button click
+  const handleFilterClick = () => {
+    setShowFilterModal(true);
+  };
+
+  // Handle okay button click in filter modal
+  const handleOkayClick = () => {
+    if (selectedSize && isNaN(Number(selectedSize))) {
+      setError('Size must be a number');
+      return;
+    }
+    setError('');
+    setShowFilterModal(false);
+  };
+
+  // Handle amenity selection
+  const handleAmenityChange = (amenity: string) => {
+    if (selectedAmenities.includes(amenity)) {
+      setSelectedAmenities(selectedAmenities.filter((a) => a !== amenity));
+    } else {
+      setSelectedAmenities([...selectedAmenities, amenity]);
+    }
+  };
+
+  // Suggest locations matching what has been typed in the location field
+  useEffect(() => {
+    if (!citySearch.trim()) {
+      setCitySuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    fetch(`http://127.0.0.1:5000/location/autocomplete?q=${encodeURIComponent(citySearch)}`, { signal: controller.signal })
+      .then((response) => (response.ok ? response.json() : { locations: [] }))
+      .then((data) => setCitySuggestions(data.locations.map((location: { name: string }) => location.name)))
+      .catch(() => {});
+    return () => controller.abort();
+  }, [citySearch]);
+
+  // Refresh the filter modal's counts while it is open
+  useEffect(() => {
+    if (!showFilterModal) return;
+    const controller = new AbortController();
+    fetch(`http://127.0.0.1:5000/explore/facets?${buildQuery()}`, { signal: controller.signal })
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => setFacets(data))
+      .catch(() => {});
+    return () => controller.abort();
+  }, [showFilterModal, submittedQuery, selectedPriceRange, selectedLocation, selectedType, selectedSize, selectedAmenities]);
+
+  const amenityCount = (amenity: string) => facets?.amenities.find((a) => a.name === amenity)?.count ?? 0;
+  const largestBucket = Math.max(1, ...(facets?.price_histogram.map((bucket) => bucket.count) ?? []));
+
+  // A typed location filters once it matches a suggestion exactly; clearing the field removes the filter
+  const handleCitySearchChange = (value: string) => {
+    setCitySearch(value);
+    if (!value) setSelectedLocation('');
+    else if (citySuggestions.includes(value)) setSelectedLocation(value);
+  };
+
+  return {
+    properties, loading, error, setError,
+    showFilterModal, setShowFilterModal, handleFilterClick, handleOkayClick,
+    selectedType, setSelectedType, selectedPriceRange, setSelectedPriceRange, setSelectedLocation,
+    selectedSize, setSelectedSize, selectedAmenities, setSelectedAmenities, handleAmenityChange,
+    amenitiesList: AMENITIES, amenityCount, facets, largestBucket,
+    searchQuery, setSearchQuery, citySearch, setCitySearch, citySuggestions, handleCitySearchChange,
+    nextCursor, loadingMore, handleLoadMore,
+  };
+};
@@ -1,20 +1,67 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, g, send_file
 from firebase_admin import auth
 from flask_sqlalchemy import SQLAlchemy
 import firebase_admin
 from firebase_admin import credentials
 from flask_migrate import Migrate
 from flask_cors import CORS
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import RequestEntityTooLarge
+from itertools import islice
+from parsing import parse_price_range, parse_size_sqft
+import search
+import geo
+import clusters
+import locations
+import fuzzy
+import bitmaps
+import changes
+import images
+import jobs
+import duplicates
+from compress import CompressionMiddleware
+from cache import ResponseCache, cached
+from serializers import request_body, respond
+from tokens import TokenCache
+import identity
+import storage
+from identity import Identity, IdentityCache, SessionTokens, login_required
+import base64
+import click
+import csv
+import json
 import os
 
 # Firebase Initialization
 cred = credentials.Certificate("firebase_credentials.json")
 firebase_admin.initialize_app(cred)
 
+# Verified ID-token claims, so repeat logins skip the signature check
+id_tokens = TokenCache()
+
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///terralink.db'
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///terralink.db')
+# Comma-separated read replicas; an SQLite replica is a file refreshed from the primary
+app.config['SQLALCHEMY_REPLICA_URIS'] = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+# Signs session tokens; set SECRET_KEY in production so tokens survive restarts and work across workers
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(32).hex()
+app.config['SESSION_TOKEN_MAX_AGE'] = 3600
+# Seconds a cached /explore or /search page is served before it is rebuilt (see explore_cache)
+app.config['EXPLORE_CACHE_TTL'] = 30
+# Directory of uploaded listing photos (see images.py); share it between workers and hosts
+app.config['IMAGE_STORE'] = os.environ.get('IMAGE_STORE') or os.path.join(app.instance_path, 'images')
+# Public URL of /images, which upload responses use; only listing photos under it are served and processed here
+app.config['IMAGE_BASE_URL'] = os.environ.get('IMAGE_BASE_URL', 'http://127.0.0.1:5000/images')
+storage.configure(app)
+db = SQLAlchemy(app, session_options={'class_': storage.RoutingSession})
+with app.app_context():
+    storage.install(app, db)
+    geo.install(db)
 CORS(app)
+# Compress JSON responses for clients that accept it; cached ones go out compressed already
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
 class Buyer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -32,21 +79,144 @@ class Seller(db.Model):
     properties = db.relationship('Property', backref='seller', lazy=True)  # Add this line
 
 
+class Amenity(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+
+# Which amenities each property has; (amenity_id, property_id) serves "has amenity A AND B" lookups
+property_amenity = db.Table(
+    'property_amenity',
+    db.Column('property_id', db.Integer, db.ForeignKey('property.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('amenity_id', db.Integer, db.ForeignKey('amenity.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_property_amenity_amenity_id_property_id', 'amenity_id', 'property_id'),
+)
+
+
 class Property(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # Unique Property ID
     seller_id = db.Column(db.Integer, db.ForeignKey('seller.id'), nullable=False)  # Seller who uploaded the property
     name = db.Column(db.String(255), nullable=False)
     owner_name = db.Column(db.String(255), nullable=False)
-    location = db.Column(db.String(255), nullable=False)
+    location = db.Column(db.String(255), nullable=False, index=True)
     address = db.Column(db.String(255), nullable=False, default="ggez")  # Fixed casing issue
     price_range = db.Column(db.String(255), nullable=False)
+    price_min = db.Column(db.Float, nullable=True, index=True)  # Parsed from price_range (rupees)
+    price_max = db.Column(db.Float, nullable=True, index=True)
     negotiable = db.Column(db.Boolean, default=False)
     size = db.Column(db.String(100), nullable=False)
+    size_sqft = db.Column(db.Float, nullable=True, index=True)  # Parsed from size
     property_type = db.Column(db.String(100), nullable=False)  # Fixed typo in 'nullable'
     description = db.Column(db.Text, nullable=False)
-    images = db.Column(db.String(500), nullable=True)  # Image file paths
-    amenities = db.Column(db.Text, nullable=True)  # New field to store amenities (comma-separated values)
     contacts = db.Column(db.String(100), nullable=False)  # New field to store contact info
+    latitude = db.Column(db.Float, nullable=True)  # Spatially indexed through geo.py
+    longitude = db.Column(db.Float, nullable=True)
+    # Near-duplicate detection (see duplicates.py): the text's MinHash signature, and the listing this one copies
+    minhash = db.Column(db.LargeBinary, nullable=True)
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('property.id', ondelete='SET NULL'), nullable=True, index=True)
+
+    amenities = db.relationship('Amenity', secondary=property_amenity, order_by='Amenity.name')
+    images = db.relationship('PropertyImage', order_by='PropertyImage.position',
+                             cascade='all, delete-orphan')
+    photo_job = db.relationship('PhotoJob', uselist=False, cascade='all, delete-orphan')
+
+    def set_price_and_size(self):
+        """Refresh the numeric price/size columns from the free-text fields."""
+        self.price_min, self.price_max = parse_price_range(self.price_range)
+        self.size_sqft = parse_size_sqft(self.size)
+
+    def set_images(self, urls):
+        self.images = [PropertyImage(url=url, position=i) for i, url in enumerate(urls)]
+        # Have the photo worker make the derivatives and measure the photos that are in the image store
+        if self.photo_job is None:
+            self.photo_job = PhotoJob()
+        self.photo_job.queue(sum(1 for url in urls if image_store.stored_name(url)))
+
+    @property
+    def amenity_names(self):
+        return [amenity.name for amenity in self.amenities]
+
+    @property
+    def image_urls(self):
+        return [image.url for image in self.images]
+
+
+class PropertyImage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)  # Display order, 0 is the cover image
+    url = db.Column(db.String(500), nullable=False)
+    # Filled in by the photo worker for images in the image store (see jobs.py)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    phash = db.Column(db.String(16), nullable=True)  # 64-bit perceptual hash in hex
+
+    __table_args__ = (db.Index('ix_property_image_property_id_position', 'property_id', 'position'),)
+
+
+class DuplicateBucket(db.Model):
+    """A locality-sensitive hash bucket a listing's text or photos fall in (see duplicates.py)."""
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id', ondelete='CASCADE'), primary_key=True)
+
+    __table_args__ = (db.Index('ix_duplicate_bucket_property_id', 'property_id'),)
+
+
+class PhotoJob(db.Model):
+    """A listing's photos waiting for, or being processed by, the photo worker (see jobs.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id', ondelete='CASCADE'), unique=True, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=jobs.QUEUED)
+    total = db.Column(db.Integer, nullable=False, default=0)  # Photos to process
+    done = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_at = db.Column(db.Float, nullable=True)  # Unix time a worker took the job; identifies that claim
+    error = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (db.Index('ix_photo_job_status_id', 'status', 'id'),)
+
+    def queue(self, total):
+        """(Re)start the job for `total` photos; with none there is nothing to do."""
+        self.status = jobs.QUEUED if total else jobs.DONE
+        self.total, self.done, self.attempts = total, 0, 0
+        self.claimed_at = self.error = None
+
+    def progress(self):
+        return {"status": self.status, "done": self.done, "total": self.total, "error": self.error}
+
+
+class ChangeCount(db.Model):
+    """The one row counting committed listing changes, for every process's in-memory indexes (see changes.py)."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class Location(db.Model):
+    """Every location some listing has, with how many do; maintained by locations.LocationIndex."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    listing_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SearchAlias(db.Model):
+    """Another name for a search word, e.g. "bengaluru" for "bangalore"; used both ways by fuzzy search."""
+    id = db.Column(db.Integer, primary_key=True)
+    alias = db.Column(db.String(64), unique=True, nullable=False)
+    canonical = db.Column(db.String(64), nullable=False)
+
+
+class MapCluster(db.Model):
+    """Listings aggregated per map grid cell and zoom level; maintained by clusters.ClusterGrid."""
+    level = db.Column(db.Integer, primary_key=True)
+    x = db.Column(db.Integer, primary_key=True)
+    y = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    latitude_sum = db.Column(db.Float, nullable=False)  # Centroid is the sums over count
+    longitude_sum = db.Column(db.Float, nullable=False)
+    price_min = db.Column(db.Float, nullable=True)
+    price_max = db.Column(db.Float, nullable=True)
+    first_property_id = db.Column(db.Integer, nullable=False)  # Lowest id in the cell: the listing itself when count is 1
 
 
 class Cart(db.Model):
@@ -68,13 +238,221 @@ class Interested(db.Model):
     __table_args__ = (db.UniqueConstraint('buyer_id', 'property_id', name='unique_interested_item'),)
 
 
-migrate = Migrate(app, db)
+def load_identity(role, user_id):
+    model = {'buyer': Buyer, 'seller': Seller}.get(role)
+    user = db.session.get(model, user_id) if model else None
+    return Identity(role, user.id, user.name) if user else None
+
+
+session_tokens = SessionTokens(app.config['SECRET_KEY'], max_age=app.config['SESSION_TOKEN_MAX_AGE'])
+identities = IdentityCache(load_identity)
+identities.forget_on_flush(db.session, {'buyer': Buyer, 'seller': Seller})
+identity.init_app(app, session_tokens, identities)
+
+
+def dialect_insert(model):
+    """An INSERT construct for the bound database, with its ON CONFLICT / RETURNING support."""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model.__table__)
+
+
+def save_for_buyer(model, buyer_id, property_id):
+    """Add a Cart/Interested row in a single INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Returns True if the row is new, False if the buyer already had it and
+    None if there is no such property. Only the latter two cost a second query.
+    """
+    existing_property = db.select(db.literal(buyer_id), Property.id).where(Property.id == property_id)
+    statement = (dialect_insert(model)
+                 .from_select(['buyer_id', 'property_id'], existing_property)
+                 .on_conflict_do_nothing(index_elements=['buyer_id', 'property_id'])
+                 .returning(model.id))
+    inserted = db.session.execute(statement).first()
+    db.session.commit()
+
+    if inserted is not None:
+        return True
+    if db.session.get(Property, property_id) is None:
+        return None
+    return False
+
+
+MAX_BATCH_SIZE = 500
+
+
+def batch_save_for_buyer(model, buyer_id, add_ids, remove_ids):
+    """Apply bulk adds/removes of Cart/Interested rows in one transaction.
+
+    The ids are validated with a single IN query, adds go out as one
+    multi-row INSERT ... ON CONFLICT DO NOTHING and removes as one DELETE.
+    An id both added and removed is removed, as if the removal came last.
+    """
+    requested = set(add_ids) | set(remove_ids)
+    existing = set(db.session.scalars(db.select(Property.id).where(Property.id.in_(requested))))
+
+    to_add = [property_id for property_id in dict.fromkeys(add_ids)
+              if property_id in existing and property_id not in remove_ids]
+    added = []
+    if to_add:
+        statement = (dialect_insert(model)
+                     .on_conflict_do_nothing(index_elements=['buyer_id', 'property_id'])
+                     .returning(model.property_id))
+        rows = db.session.execute(statement, [
+            {'buyer_id': buyer_id, 'property_id': property_id, 'count': False} for property_id in to_add
+        ])
+        added = [property_id for property_id, in rows]
+
+    removed = []
+    if remove_ids:
+        statement = (db.delete(model)
+                     .where(model.buyer_id == buyer_id, model.property_id.in_(set(remove_ids)))
+                     .returning(model.property_id))
+        removed = [property_id for property_id, in db.session.execute(statement)]
+
+    db.session.commit()
+    return {
+        "added": sorted(added),
+        "already_saved": sorted(set(to_add) - set(added)),
+        "removed": sorted(removed),
+        "not_found": sorted(requested - existing),
+    }
+
+
+def batch_ids(data, field):
+    """The list of property ids under `field`; raises ValueError if it isn't one."""
+    ids = data.get(field, [])
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError(f"'{field}' must be a list of property IDs")
+    return ids
+
+
+def batch_request(model):
+    """Handle a {"add": [property ids], "remove": [property ids]} body for the current buyer."""
+    data = request_body() or {}
+    try:
+        add_ids, remove_ids = batch_ids(data, 'add'), batch_ids(data, 'remove')
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    if not add_ids and not remove_ids:
+        return respond({"error": "Nothing to add or remove"}), 400
+    if len(add_ids) + len(remove_ids) > MAX_BATCH_SIZE:
+        return respond({"error": f"At most {MAX_BATCH_SIZE} properties per batch"}), 400
+
+    return respond(batch_save_for_buyer(model, g.identity.id, add_ids, remove_ids)), 200
+
+
+def get_amenities(names):
+    """Look up Amenity rows by name, adding any the dictionary doesn't have yet."""
+    names = list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+    existing = {a.name: a for a in Amenity.query.filter(Amenity.name.in_(names))} if names else {}
+    for name in names:
+        if name not in existing:
+            existing[name] = Amenity(name=name)
+            db.session.add(existing[name])
+    return [existing[name] for name in names]
+
+
+# Columns a listing summary needs; list endpoints select only these
+SUMMARY_COLUMNS = (Property.id, Property.name, Property.location, Property.price_range, Property.size)
+
+
+def amenities_by_property(property_ids):
+    """Map property id -> amenity names for all the given properties in one query."""
+    rows = (db.session.query(property_amenity.c.property_id, Amenity.name)
+            .join(Amenity, Amenity.id == property_amenity.c.amenity_id)
+            .filter(property_amenity.c.property_id.in_(property_ids))
+            .order_by(Amenity.name)
+            .all())
+    amenities = {}
+    for property_id, name in rows:
+        amenities.setdefault(property_id, []).append(name)
+    return amenities
+
+
+def images_by_property(property_ids):
+    """Map property id -> image urls, in display order, for all the given properties in one query."""
+    rows = (db.session.query(PropertyImage.property_id, PropertyImage.url)
+            .filter(PropertyImage.property_id.in_(property_ids))
+            .order_by(PropertyImage.property_id, PropertyImage.position)
+            .all())
+    images = {}
+    for property_id, url in rows:
+        images.setdefault(property_id, []).append(url)
+    return images
+
+
+def image_variants(urls, variant):
+    """Listing photo URLs pointing at their `variant` size (see images.VARIANTS) where the photo is ours."""
+    return [image_store.variant_url(url, variant) for url in urls]
+
+
+def property_summaries(rows, with_images=False):
+    """Build listing summaries from SUMMARY_COLUMNS rows, batching the amenity (and image) lookups."""
+    property_ids = [row.id for row in rows]
+    amenities = amenities_by_property(property_ids)
+    photos = images_by_property(property_ids) if with_images else None
+
+    summaries = []
+    for row in rows:
+        summary = {
+            "id": row.id,
+            "name": row.name,
+            "location": row.location,
+            "price": row.price_range,
+            "size": row.size,
+            "amenities": amenities.get(row.id, [])
+        }
+        if with_images:
+            summary["images"] = image_variants(photos.get(row.id, []), 'card')
+        summaries.append(summary)
+    return summaries
+
+
+# Counted before the indexes below are told of this process's commits, so they know which count those bring
+changes.register(ChangeCount.__table__)
+listing_changes = changes.ChangeCounter(ChangeCount.__table__)
+listing_changes.bump_on_flush(db.session, (Property, PropertyImage, Amenity, SearchAlias))
+
+search.register(Property)
+fuzzy.register(Property, SearchAlias.__table__)
+fuzzy_index = fuzzy.FuzzyIndex(SearchAlias.__table__, listing_changes)
+geo.register(Property)
+map_clusters = clusters.ClusterGrid(MapCluster.__table__, Property)
+map_clusters.maintain_on_flush(db.session, Property)
+location_index = locations.LocationIndex(Location.__table__, listing_changes)
+location_index.maintain_on_flush(db.session, Property)
+
+# Price bands in rupees, on a 1-2-5 scale from 1 lakh to 10 crore; the last band is open.
+# The bitmap index and the /explore/facets histogram bucket listings by price_min into these.
+PRICE_BUCKETS = [0, 100000, 200000, 500000, 1000000, 2000000, 5000000,
+                 10000000, 20000000, 50000000, 100000000]
+listing_index = bitmaps.BitmapIndex(Property, property_amenity, Amenity.__table__, PRICE_BUCKETS, listing_changes)
+listing_index.maintain_on_flush(db.session, Property)
+duplicate_index = duplicates.DuplicateIndex(DuplicateBucket.__table__, Property.__table__, PropertyImage.__table__)
+duplicate_index.maintain_on_flush(db.session, Property)
+
+# Encoded /explore and /search pages, dropped whenever this process commits a listing change.
+# Other workers and the CLI change listings too, and replicas may still serve the old listing
+# after a commit, so pages also expire.
+explore_cache_ttl = app.config['EXPLORE_CACHE_TTL']
+if app.config['SQLALCHEMY_REPLICA_URIS']:
+    explore_cache_ttl = min(explore_cache_ttl, app.config['REPLICA_CACHE_TTL'])
+explore_cache = ResponseCache(ttl=explore_cache_ttl)
+explore_cache.invalidate_on_commit(db.session, (Property, PropertyImage, Amenity))
+
+def include_object(*args):
+    """Keep autogenerate away from the search and spatial indexes the models don't describe."""
+    return search.include_object(*args) and geo.include_object(*args)
+
+
+migrate = Migrate(app, db, include_object=include_object)
 # ------------------------------
 # Buyer Authentication Routes
 # ------------------------------
 @app.route('/buyer/register', methods=['POST'])
 def buyer_register():
-    data = request.json
+    data = request_body()
     email, password, name, phone = data['email'], data['password'], data['name'], data['phone']
 
     try:
@@ -83,33 +461,34 @@ def buyer_register():
         db.session.add(new_buyer)
         db.session.commit()
 
-        return jsonify({"message": "Buyer registered successfully", "uid": user.uid}), 201
+        return respond({"message": "Buyer registered successfully", "uid": user.uid}), 201
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return respond({"error": str(e)}), 400
 
 
 @app.route('/buyer/login', methods=['POST'])
 def buyer_login():
-    data = request.json
+    data = request_body()
     id_token = data['idToken']  # Firebase ID Token
 
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = id_tokens.verify(id_token)
         firebase_uid = decoded_token['uid']
         buyer = Buyer.query.filter_by(firebase_uid=firebase_uid).first()
 
         if buyer:
-            return jsonify({"message": "true", "user_id": buyer.id, "Name": buyer.name, "Phone": buyer.phone}), 200
-        return jsonify({"error": "Buyer not found"}), 404
+            return respond({"message": "true", "user_id": buyer.id, "Name": buyer.name, "Phone": buyer.phone,
+                            "session_token": session_tokens.issue('buyer', buyer.id)}), 200
+        return respond({"error": "Buyer not found"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 401
+        return respond({"error": str(e)}), 401
     
 # ------------------------------
 # Seller Authentication Routes
 # ------------------------------
 @app.route('/seller/register', methods=['POST'])
 def seller_register():
-    data = request.json
+    data = request_body()
     email, password, name = data['email'], data['password'], data['name']
 
     try:
@@ -118,36 +497,38 @@ def seller_register():
         db.session.add(new_seller)
         db.session.commit()
 
-        return jsonify({"message": "Seller registered successfully", "uid": user.uid}), 201
+        return respond({"message": "Seller registered successfully", "uid": user.uid}), 201
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return respond({"error": str(e)}), 400
 
 @app.route('/seller/login', methods=['POST'])
 def seller_login():
-    data = request.json
-    id_token = data['id_token']
-
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        data = request_body()
+        id_token = data.get('idToken') or data.get('id_token')  # Firebase ID Token; id_token is the older name
+        if not id_token:
+            return respond({"error": "idToken is required"}), 400
+        decoded_token = id_tokens.verify(id_token)
         firebase_uid = decoded_token['uid']
         seller = Seller.query.filter_by(firebase_uid=firebase_uid).first()
 
         if seller:
-            return jsonify({"message": "Seller login successful", "user_id": seller.id}), 200
-        return jsonify({"error": "Seller not found"}), 404
+            return respond({"message": "Seller login successful", "user_id": seller.id,
+                            "session_token": session_tokens.issue('seller', seller.id)}), 200
+        return respond({"error": "Seller not found"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 401
+        return respond({"error": str(e)}), 401
 
 # ------------------------------
 # Google Sign-In (Detects Buyer/Seller)
 # ------------------------------
 @app.route('/google-signin', methods=['POST'])
 def google_signin():
-    data = request.json
+    data = request_body()
     id_token = data['id_token']
 
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = id_tokens.verify(id_token)
         firebase_uid = decoded_token['uid']
         email = decoded_token['email']
         name = decoded_token.get('name', 'Google User')
@@ -157,44 +538,498 @@ def google_signin():
         seller = Seller.query.filter_by(firebase_uid=firebase_uid).first()
 
         if buyer:
-            return jsonify({"message": "Google login successful", "role": "buyer", "user_id": buyer.id}), 200
+            return respond({"message": "Google login successful", "role": "buyer", "user_id": buyer.id,
+                            "session_token": session_tokens.issue('buyer', buyer.id)}), 200
         elif seller:
-            return jsonify({"message": "Google login successful", "role": "seller", "user_id": seller.id}), 200
+            return respond({"message": "Google login successful", "role": "seller", "user_id": seller.id,
+                            "session_token": session_tokens.issue('seller', seller.id)}), 200
 
         # If new user, assume Buyer by default
         new_buyer = Buyer(firebase_uid=firebase_uid, name=name, email=email)
         db.session.add(new_buyer)
         db.session.commit()
 
-        return jsonify({"message": "New Google user registered as Buyer", "role": "buyer"}), 201
+        return respond({"message": "New Google user registered as Buyer", "role": "buyer", "user_id": new_buyer.id,
+                        "session_token": session_tokens.issue('buyer', new_buyer.id)}), 201
     except Exception as e:
-        return jsonify({"error": str(e)}), 401
+        return respond({"error": str(e)}), 401
+
+
+@app.route('/session/refresh', methods=['POST'])
+@login_required()
+def refresh_session():
+    # Swap a session token that hasn't expired for a fresh one; once it has, the user logs in again
+    return respond({"session_token": session_tokens.issue(g.identity.role, g.identity.id)}), 200
 
 
 #buyers portal
+EXPLORE_PAGE_SIZE = 24
+EXPLORE_MAX_PAGE_SIZE = 100
+
+# sort name -> (sort key column, descending?)
+EXPLORE_SORTS = {
+    "newest": (Property.id, True),
+    "price_asc": (Property.price_min, False),
+    "price_desc": (Property.price_min, True),
+    "name": (Property.name, False),
+}
+
+
+# Sorts whose cursor key is text; the rest are numbers
+TEXT_SORTS = {"name"}
+
+
+def encode_cursor(sort, key, last_id, scope=None):
+    """A cursor for the page after (key, last_id). `scope` (JSON) pins it to what else the ordering depends on."""
+    raw = json.dumps([sort, key, last_id] + ([scope] if scope is not None else []), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, scope=None):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, key, last_id, *cursor_scope = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("Cursor does not match the requested sort")
+    if cursor_scope != ([scope] if scope is not None else []):
+        raise ValueError("Cursor is for another search")
+    # Only what encode_cursor writes for this sort, so a tampered cursor can't reach SQL as a bad parameter
+    if not (_cursor_value(last_id, int) and _cursor_value(key, str if sort in TEXT_SORTS else (int, float))):
+        raise ValueError("Invalid cursor")
+    return key, last_id
+
+
+def _cursor_value(value, types):
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    return not isinstance(value, int) or -(1 << 63) <= value < (1 << 63)  # An int must fit a BIGINT
+
+
+def requested_amenities(args):
+    return set(a for value in args.getlist('amenities') for a in value.split(',') if a)
+
+
+def explore_filters(args):
+    """Build SQL filter clauses from the /explore query string (everything but the search text).
+
+    Raises ValueError for a malformed `negotiable` or `filter` expression (see bitmaps.py).
+    """
+    filters = []
+
+    # A listing matches when its price range overlaps the requested one. Listings without a price
+    # ("Price on request") match no price bound, only searches that give none.
+    min_price = args.get('min_price', type=float)
+    if min_price is not None:
+        filters.append(Property.price_max >= min_price)
+    max_price = args.get('max_price', type=float)
+    if max_price is not None:
+        filters.append(Property.price_min <= max_price)
+
+    min_size = args.get('min_size', type=float)
+    if min_size is not None:
+        filters.append(Property.size_sqft >= min_size)
+    max_size = args.get('max_size', type=float)
+    if max_size is not None:
+        filters.append(Property.size_sqft <= max_size)
+
+    if args.get('location'):
+        filters.append(Property.location == args['location'])
+    if args.get('type'):
+        filters.append(Property.property_type == args['type'])
+    if args.get('size'):
+        filters.append(Property.size == args['size'])
+    if args.get('negotiable'):
+        filters.append(listing_index.clause(listing_index.term('negotiable', args['negotiable'])))
+    if args.get('filter'):
+        filters.append(listing_index.clause(listing_index.parse(args['filter'])))
+
+    # Properties having every requested amenity: intersect the per-amenity postings
+    amenities = requested_amenities(args)
+    if amenities:
+        matching = (
+            db.select(property_amenity.c.property_id)
+            .join(Amenity, Amenity.id == property_amenity.c.amenity_id)
+            .where(Amenity.name.in_(amenities))
+            .group_by(property_amenity.c.property_id)
+            .having(db.func.count() == len(amenities))
+        )
+        filters.append(Property.id.in_(matching))
+
+    return filters
+
+
+# The /explore filters the bitmap index can answer; the rest (price, size, text) need SQL
+INDEXED_FILTERS = ('location', 'type', 'negotiable', 'amenities', 'filter')
+
+
+def indexed_expression(args):
+    """The indexed /explore filters as one bitmaps expression tree, or None. Raises ValueError."""
+    terms = []
+    if args.get('location'):
+        terms.append(listing_index.term('location', args['location']))
+    if args.get('type'):
+        terms.append(listing_index.term('type', args['type']))
+    if args.get('negotiable'):
+        terms.append(listing_index.term('negotiable', args['negotiable']))
+    terms.extend(listing_index.term('amenity', name) for name in sorted(requested_amenities(args)))
+    if args.get('filter'):
+        terms.append(listing_index.parse(args['filter']))
+    return bitmaps.all_of(terms)
+
+
+def search_filters(args):
+    """Filter clauses for the /explore search text.
+
+    fuzzy=1 lets each word match any of its spellings, when the words as typed match no listing.
+    """
+    words = search.search_words(args.get('q', ''))
+    if not words:
+        return []
+    if args.get('fuzzy') and not matched_as_typed(words):
+        words = [spelling.alternatives() for spelling in fuzzy_index.spell(db.session.connection(), words)]
+    return [search.matching(Property, db.engine.dialect.name, words)]
+
+
+def matched_as_typed(words):
+    """Whether some listing matches all the search words as typed."""
+    exact = search.matching(Property, db.engine.dialect.name, words)
+    return db.session.scalar(db.select(Property.id).where(exact).limit(1)) is not None
+
+
+def without(args, *keys):
+    """A copy of the query string `args` minus `keys`."""
+    args = args.copy()
+    for key in keys:
+        args.poplist(key)
+    return args
+
+
+def property_card(property):
+    return {
+        "id": property.id,
+        "name": property.name,
+        "location": property.location,
+        "price": property.price_range,
+        "images": image_variants(property.image_urls, 'card'),
+        "size": property.size,
+        "amenities": property.amenity_names,
+        "latitude": property.latitude,
+        "longitude": property.longitude
+    }
+
+
+def keyset_page(query, sort, sort_key, descending, args, scope=None):
+    """Fetch the page of `query` after args['cursor'], ordered by (sort_key, id).
+
+    Returns the page's property cards and the cursor for the next page.
+    Raises ValueError for a malformed cursor, or one issued for another `scope` (see encode_cursor).
+    """
+    limit = page_limit(args)
+
+    # Seek past the last (sort key, id) of the previous page
+    cursor = args.get('cursor')
+    if cursor:
+        last_key, last_id = decode_cursor(cursor, sort, scope)
+        if descending:
+            query = query.filter(tuple_(sort_key, Property.id) < tuple_(last_key, last_id))
+        else:
+            query = query.filter(tuple_(sort_key, Property.id) > tuple_(last_key, last_id))
+
+    if descending:
+        query = query.order_by(sort_key.desc(), Property.id.desc())
+    else:
+        query = query.order_by(sort_key.asc(), Property.id.asc())
+
+    query = query.options(selectinload(Property.amenities), selectinload(Property.images))
+    rows = query.add_columns(sort_key).limit(limit + 1).all()
+    property_list = [property_card(property) for property, _ in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_property, last_key = rows[limit - 1]
+        next_cursor = encode_cursor(sort, last_key, last_property.id, scope)
+
+    return property_list, next_cursor
+
+
+def page_limit(args):
+    return max(1, min(args.get('limit', EXPLORE_PAGE_SIZE, type=int), EXPLORE_MAX_PAGE_SIZE))
+
+
+def bitmap_page(query, matches, args):
+    """keyset_page for the newest-first sort, walking the ids of the Bitmap `matches` instead of the table.
+
+    `query` still vets each id, a growing batch at a time, so SQL only reads rows around the page.
+    """
+    limit = page_limit(args)
+    below = None
+    if args.get('cursor'):
+        _, below = decode_cursor(args['cursor'], 'newest')
+
+    candidates = matches.descending(below)
+    found = []
+    batch = limit + 1
+    while len(found) <= limit:
+        ids = list(islice(candidates, batch))
+        if not ids:
+            break
+        found += [id for id, in (query.with_entities(Property.id)
+                                 .filter(Property.id.in_(ids))
+                                 .order_by(Property.id.desc()))]
+        batch *= 4
+
+    page = found[:limit]
+    properties = {property.id: property for property in (
+        Property.query.filter(Property.id.in_(page))
+        .options(selectinload(Property.amenities), selectinload(Property.images)))}
+    property_list = [property_card(properties[id]) for id in page if id in properties]
+    next_cursor = encode_cursor('newest', page[-1], page[-1]) if len(found) > limit else None
+    return property_list, next_cursor
+
+
+# An indexed match this small goes to SQL as an id list, whatever the sort
+MAX_MATCHED_IDS = 1000
+
+
 @app.route('/explore', methods=['GET'])
+@cached(explore_cache)
 def explore():
-    properties = Property.query.all()
-    property_list = []
-    
-    for property in properties:
-        property_list.append({
-            "id": property.id,
-            "name": property.name,
-            "location": property.location,
-            "price": property.price_range,
-            "images": property.images.split(',') if property.images else [],
-            "size": property.size,
-            "amenities": property.amenities.split(',') if property.amenities else []
-        })
-    return jsonify({"properties": property_list}), 200
+    sort = request.args.get('sort', 'newest')
+    if sort not in EXPLORE_SORTS:
+        return respond({"error": f"Unknown sort '{sort}'"}), 400
+    sort_key, descending = EXPLORE_SORTS[sort]
+
+    try:
+        # The indexed filters go to SQL as the index's own clause, cheap to check against a page of ids
+        expression = indexed_expression(request.args)
+        if expression is None:
+            query = Property.query.filter(*explore_filters(request.args))
+        else:
+            query = Property.query.filter(*explore_filters(without(request.args, *INDEXED_FILTERS)),
+                                          listing_index.clause(expression))
+        if sort_key is Property.price_min:
+            # Listings whose price couldn't be parsed have no place in a price ordering
+            query = query.filter(sort_key.isnot(None))
+
+        query = query.filter(*search_filters(request.args))
+
+        # The bitmap index narrows the indexed filters down to ids; SQL applies every filter to those.
+        # While another request brings the index up to date, SQL does it all.
+        matches = listing_index.evaluate(db.session.connection(), expression, wait=False) if expression else None
+        if matches is not None and sort == 'newest':
+            property_list, next_cursor = bitmap_page(query, matches, request.args)
+        else:
+            if matches is not None and len(matches) <= MAX_MATCHED_IDS:
+                query = query.filter(Property.id.in_(list(matches)))
+            property_list, next_cursor = keyset_page(query, sort, sort_key, descending, request.args)
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    return respond({"properties": property_list, "next_cursor": next_cursor}), 200
+
+
+@app.route('/search', methods=['GET'])
+@cached(explore_cache)
+def search_properties():
+    # Ranked full-text search (BM25 on SQLite, ts_rank_cd on PostgreSQL; prefix matching), combinable with the /explore filters.
+    # fuzzy=1 tolerates misspellings and aliases (see fuzzy.py), here and on /explore, when the words
+    # as typed match nothing
+    words = search.search_words(request.args.get('q', ''))
+    if not words:
+        return respond({"error": "Search text is required"}), 400
+
+    if request.args.get('fuzzy') and not matched_as_typed(words):
+        return fuzzy_search(words)
+
+    query, rank = search.ranked(Property.query, Property, db.engine.dialect.name, words)
+
+    try:
+        query = query.filter(*explore_filters(request.args))
+        property_list, next_cursor = keyset_page(query, 'relevance', rank, False, request.args)
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    return respond({"properties": property_list, "next_cursor": next_cursor}), 200
+
+
+def fuzzy_search(words):
+    """Typo-tolerant /search: the best full-text matches for any spelling of the words, re-ranked by similarity.
+
+    Re-ranking happens on one bounded candidate set, so results come as a single page.
+    """
+    try:
+        filters = explore_filters(request.args)
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    limit = page_limit(request.args)
+    spellings = fuzzy_index.spell(db.session.connection(), words)
+    query, rank = search.ranked(db.session.query(Property.id, Property.name, Property.location, Property.address),
+                                Property, db.engine.dialect.name, [s.alternatives() for s in spellings])
+    candidates = query.filter(*filters).order_by(rank, Property.id).limit(fuzzy.CANDIDATES).all()
+
+    # sorted() is stable, so equally similar listings keep their full-text order
+    best = sorted(candidates, key=lambda row: -fuzzy.score(
+        spellings, {'name': row.name, 'location': row.location, 'address': row.address}))[:limit]
+    properties = {p.id: p for p in (Property.query
+                                    .options(selectinload(Property.amenities), selectinload(Property.images))
+                                    .filter(Property.id.in_([row.id for row in best])))}
+    return respond({"properties": [property_card(properties[row.id]) for row in best], "next_cursor": None}), 200
+
+
+FACET_LOCATIONS = 20
+
+
+@app.route('/explore/facets', methods=['GET'])
+@cached(explore_cache)
+def explore_facets():
+    # Counts for the filter modal under the /explore filters in the query string. Location and price
+    # are counted without their own filter, so every choice shows what picking it instead would give.
+    # The counts come from the bitmap index; filters it doesn't cover are applied by SQL first.
+    args = request.args
+    connection = db.session.connection()
+    text = search_filters(args)
+
+    def allowed(args):
+        """The ids passing the filters the index doesn't cover, or None if there are none."""
+        unindexed = explore_filters(without(args, *INDEXED_FILTERS)) + text
+        if not unindexed:
+            return None
+        return bitmaps.Bitmap.of(connection.execute(db.select(Property.id).where(*unindexed)).scalars())
+
+    def matching(args, allowed):
+        matches = listing_index.evaluate(connection, indexed_expression(args))
+        return matches if allowed is None else matches & allowed
+
+    try:
+        everywhere = allowed(args)
+        matches = matching(args, everywhere)
+        any_location = matching(without(args, 'location'), everywhere)
+        any_price = matching(args, allowed(without(args, 'min_price', 'max_price')))
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    def counts(field, within):
+        counted = listing_index.counts(connection, field, within).items()
+        return sorted(counted, key=lambda item: (-item[1], item[0]))
+
+    # The index bands listings by their asking price's lower end, on the histogram's edges
+    prices = dict(counts('price', any_price))
+    histogram = [{"min": low, "max": high, "count": prices.get(i, 0)}
+                 for i, (low, high) in enumerate(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))]
+
+    return respond({
+        "total": len(matches),
+        "amenities": [{"name": name, "count": n} for name, n in counts('amenity', matches)],
+        "locations": [{"name": name, "count": n} for name, n in counts('location', any_location)[:FACET_LOCATIONS]],
+        "price_histogram": histogram,
+    }), 200
+
+
+NEAR_DEFAULT_RADIUS_KM = 10
+NEAR_MAX_RADIUS_KM = 500
+
+
+def parse_bbox(value):
+    """Parse `west,south,east,north` into a (south, west, north, east) box. Raises ValueError."""
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+        geo.coordinates(south, west)
+        geo.coordinates(north, east)
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north")
+    if south > north or west > east:
+        raise ValueError("bbox must be west,south,east,north")
+    return south, west, north, east
+
+
+def near_area(args):
+    """Parse a /explore/near query into (center, bounding box, radius or None). Raises ValueError.
+
+    Either `bbox=west,south,east,north` (ordered by distance from `lat`/`lng`
+    if given, else from the box's center) or `lat`, `lng` and `radius_km`.
+    """
+    if args.get('bbox'):
+        south, west, north, east = box = parse_bbox(args['bbox'])
+        center = geo.coordinates(args.get('lat'), args.get('lng'))
+        if center == (None, None):
+            center = ((south + north) / 2, (west + east) / 2)
+        return center, box, None
+
+    center = geo.coordinates(args.get('lat'), args.get('lng'))
+    if center == (None, None):
+        raise ValueError("lat and lng, or bbox, are required")
+    radius_km = args.get('radius_km', NEAR_DEFAULT_RADIUS_KM, type=float)
+    if not 0 < radius_km <= NEAR_MAX_RADIUS_KM:
+        raise ValueError(f"radius_km must be between 0 and {NEAR_MAX_RADIUS_KM}")
+    return center, geo.bounding_box(*center, radius_km), radius_km
+
+
+@app.route('/explore/near', methods=['GET'])
+@cached(explore_cache)
+def explore_near():
+    # Listings around a point or in a map view, nearest first; the spatial index prefilters to the box
+    try:
+        center, box, radius_km = near_area(request.args)
+        filters = explore_filters(request.args)
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    distance = geo.distance_key(Property, *center)
+    query = (Property.query
+             .filter(*geo.within(Property, db.engine.dialect.name, box))
+             .filter(*filters))
+    if radius_km is not None:
+        query = query.filter(geo.distance_km(Property, db.engine.dialect.name, *center) <= radius_km)
+
+    try:
+        # Distances are from this center and listings are kept in this area, so a cursor only goes on with both
+        property_list, next_cursor = keyset_page(query, 'distance', distance, False, request.args,
+                                                 scope=[*center, *box, radius_km])
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    for card in property_list:
+        card["distance_km"] = round(geo.haversine_km(*center, card["latitude"], card["longitude"]), 3)
+    return respond({"properties": property_list, "next_cursor": next_cursor}), 200
+
+
+@app.route('/explore/clusters', methods=['GET'])
+@cached(explore_cache)
+def explore_clusters():
+    # Map markers for a viewport: one per non-empty grid cell at the zoom's level, read from MapCluster
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None or not 0 <= zoom <= 22:
+        return respond({"error": "zoom must be between 0 and 22"}), 400
+    try:
+        box = parse_bbox(request.args.get('bbox', ''))
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+
+    level, query = map_clusters.viewport(box, zoom)
+    markers = []
+    for row in db.session.execute(query):
+        marker = {
+            "count": row.count,
+            "latitude": row.latitude_sum / row.count,
+            "longitude": row.longitude_sum / row.count,
+            "price_min": row.price_min,
+            "price_max": row.price_max,
+        }
+        if row.count == 1:
+            marker["id"] = row.first_property_id
+        markers.append(marker)
+
+    return respond({"level": level, "clusters": markers}), 200
 
 
 @app.route('/explore/<int:id>', methods=['GET'])
 def explore_property(id):
     property = Property.query.get(id)
     if not property:
-        return jsonify({"error": "Property not found"}), 404
+        return respond({"error": "Property not found"}), 404
     
     property_details = {
         "name": property.name,
@@ -206,95 +1041,88 @@ def explore_property(id):
         "price": property.price_range,
         "size": property.size,
         "contacts": property.contacts,
-        "amenities": property.amenities.split(',') if property.amenities else [],
+        "amenities": property.amenity_names,
         "description": property.description,
-        "images": property.images.split(',') if property.images else []
+        "images": image_variants(property.image_urls, 'detail'),
+        "latitude": property.latitude,
+        "longitude": property.longitude
     }
-    return jsonify(property_details), 200
+    return respond(property_details), 200
 
 
 @app.route('/cart/add', methods=['POST'])
+@login_required('buyer')
 def add_to_cart():
-    data = request.json
-    buyer_id = data.get('buyer_id')
+    data = request_body()
+    buyer_id = g.identity.id
     property_id = data.get('property_id')
     
-    if not buyer_id or not property_id:
-        return jsonify({"error": "Buyer ID and Property ID are required"}), 400
-    
-    # Check if property exists
-    property = Property.query.get(property_id)
-    if not property:
-        return jsonify({"error": "Property not found"}), 404
-    
-    # Check if buyer exists
-    buyer = Buyer.query.get(buyer_id)
-    if not buyer:
-        return jsonify({"error": "Buyer not found"}), 404
+    if not property_id:
+        return respond({"error": "Property ID is required"}), 400
     
-    # Check if item is already in cart
-    existing_cart_item = Cart.query.filter_by(buyer_id=buyer_id, property_id=property_id).first()
-    if existing_cart_item:
-        return jsonify({"message": "Property already in cart"}), 200
+    added = save_for_buyer(Cart, buyer_id, property_id)
+    if added is None:
+        return respond({"error": "Property not found"}), 404
+    if not added:
+        return respond({"message": "Property already in cart"}), 200
     
-    # Add item to cart
-    new_cart_item = Cart(buyer_id=buyer_id, property_id=property_id, count=False)
-    db.session.add(new_cart_item)
-    db.session.commit()
-    
-    return jsonify({"message": "Property added to cart successfully"}), 201
+    return respond({"message": "Property added to cart successfully"}), 201
 
 
 @app.route('/cart', methods=['POST'])
+@login_required('buyer')
 def get_cart():
-    data = request.json
-    buyer_id = data.get('buyer_id')
-
-    if not buyer_id:
-        return jsonify({"error": "Buyer ID is required"}), 400
+    buyer_id = g.identity.id
 
-    cart_items = Cart.query.filter_by(buyer_id=buyer_id).all()
+    # One joined query for the listing columns, one for their amenities
+    cart_items = (db.session.query(*SUMMARY_COLUMNS)
+                  .join(Cart, Cart.property_id == Property.id)
+                  .filter(Cart.buyer_id == buyer_id)
+                  .order_by(Cart.id)
+                  .all())
 
     if not cart_items:
-        return jsonify({"message": "Cart is empty"}), 200
-
-    cart_list = []
-    for cart_item in cart_items:
-        property = cart_item.property
-        cart_list.append({
-            "id": property.id,
-            "name": property.name,
-            "location": property.location,
-            "price": property.price_range,
-            "size": property.size,               # Fixed from 'area' to 'size'
-            "amenities": property.amenities.split(',') if property.amenities else []
-        })
+        return respond({"message": "Cart is empty"}), 200
+
+    return respond({"cart": property_summaries(cart_items)}), 200
 
-    return jsonify({"cart": cart_list}), 200
 
 
+@app.route('/cart/batch', methods=['POST'])
+@login_required('buyer')
+def batch_cart():
+    return batch_request(Cart)
+
 
 @app.route('/cart/<int:buyer_id>/<int:property_id>', methods=['DELETE'])
+@login_required('buyer')
 def delete_cart_item(buyer_id, property_id):
+    if buyer_id != g.identity.id:
+        return respond({"error": "Cannot modify another buyer's cart"}), 403
+
     cart_item = Cart.query.filter_by(buyer_id=buyer_id, property_id=property_id).first()
     
     if not cart_item:
-        return jsonify({"error": "Cart item not found"}), 404
+        return respond({"error": "Cart item not found"}), 404
     
     db.session.delete(cart_item)
     db.session.commit()
     
-    return jsonify({"message": "Property removed from cart successfully"}), 200
+    return respond({"message": "Property removed from cart successfully"}), 200
 
 
 
 @app.route('/email/<int:buyer_id>/<int:property_id>', methods=['GET'])
+@login_required('buyer')
 def get_emails(buyer_id, property_id):
+    if buyer_id != g.identity.id:
+        return respond({"error": "Cannot act for another buyer"}), 403
+
     # Fetch the cart item
     cart_item = Cart.query.filter_by(buyer_id=buyer_id, property_id=property_id).first()
     
     if not cart_item:
-        return jsonify({"error": "Cart item not found"}), 404
+        return respond({"error": "Cart item not found"}), 404
     
     if not cart_item.count:
         # Update the count to True before returning emails
@@ -307,76 +1135,81 @@ def get_emails(buyer_id, property_id):
         seller = Seller.query.get(property.seller_id)
         
         if not buyer or not seller:
-            return jsonify({"error": "Buyer or Seller not found"}), 404
+            return respond({"error": "Buyer or Seller not found"}), 404
         
-        return jsonify({
+        return respond({
             "buyer_email": buyer.email,
             "seller_email": seller.email
         }), 200
     else:
-        return jsonify({"message": "Max Limit reached"}), 200
+        return respond({"message": "Max Limit reached"}), 200
     
 @app.route('/interest/add', methods=['POST'])
+@login_required('buyer')
 def add_interest():
-    data = request.json
-    buyer_id = data.get('buyer_id')
+    data = request_body()
+    buyer_id = g.identity.id
     property_id = data.get('property_id')
     
-    if not buyer_id or not property_id:
-        return jsonify({"error": "Buyer ID and Property ID are required"}), 400
+    if not property_id:
+        return respond({"error": "Property ID is required"}), 400
     
-    # Check if already added
-    existing_interest = Interested.query.filter_by(buyer_id=buyer_id, property_id=property_id).first()
-    if existing_interest:
-        return jsonify({"message": "Already added to interest"}), 200
-    
-    # Add to Interested table
-    new_interest = Interested(buyer_id=buyer_id, property_id=property_id)
-    db.session.add(new_interest)
-    db.session.commit()
+    added = save_for_buyer(Interested, buyer_id, property_id)
+    if added is None:
+        return respond({"error": "Property not found"}), 404
+    if not added:
+        return respond({"message": "Already added to interest"}), 200
     
-    return jsonify({"message": "Added to interest"}), 201
+    return respond({"message": "Added to interest"}), 201
+
+@app.route('/interest/batch', methods=['POST'])
+@login_required('buyer')
+def batch_interest():
+    return batch_request(Interested)
+
 
 @app.route('/interest', methods=['POST'])
+@login_required('buyer')
 def get_interest():
-    data = request.json
-    buyer_id = data.get('buyer_id')
-    
-    if not buyer_id:
-        return jsonify({"error": "Buyer ID is required"}), 400
+    buyer_id = g.identity.id
     
-    interested_items = Interested.query.filter_by(buyer_id=buyer_id).all()
+    interested_items = (db.session.query(*SUMMARY_COLUMNS)
+                        .join(Interested, Interested.property_id == Property.id)
+                        .filter(Interested.buyer_id == buyer_id)
+                        .order_by(Interested.id)
+                        .all())
     if not interested_items:
-        return jsonify({"message": "No interests found"}), 200
-    
-    interest_list = []
-    for item in interested_items:
-        property = item.property
-        interest_list.append({
-            "id": property.id,
-            "name": property.name,
-            "location": property.location,
-            "price": property.price_range,
-            "size": property.area,
-            "amenities": property.amenities.split(',') if property.amenities else []
-        })
+        return respond({"message": "No interests found"}), 200
     
-    return jsonify({"interests": interest_list}), 200
+    return respond({"interests": property_summaries(interested_items)}), 200
 
 
 @app.route('/location', methods=['GET'])
 def get_locations():
     try:
-        # Retrieve all unique locations from Property table
-        locations = db.session.query(Property.location).distinct().all()
+        # Every location in use, most listings first, from the Location dictionary
+        location_list = db.session.scalars(
+            db.select(Location.name)
+            .where(Location.listing_count > 0)
+            .order_by(Location.listing_count.desc(), Location.name)
+        ).all()
 
-        # Extract the locations from the result and format them into a list
-        location_list = [location[0] for location in locations]
-
-        return jsonify({"locations": location_list}), 200
+        return respond({"locations": location_list}), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
+
+
+@app.route('/location/autocomplete', methods=['GET'])
+def autocomplete_locations():
+    # Locations with a word starting with `q`, most listings first, from the in-memory trie
+    prefix = request.args.get('q', '')
+    if not locations.normalize(prefix):
+        return respond({"error": "q is required"}), 400
+    limit = max(1, min(request.args.get('limit', locations.MAX_SUGGESTIONS, type=int), locations.MAX_SUGGESTIONS))
+
+    suggestions = location_index.complete(db.session.connection(), prefix, limit)
+    return respond({"locations": [{"name": name, "count": count} for name, count in suggestions]}), 200
 
 
 #---------------------------
@@ -384,11 +1217,12 @@ def get_locations():
 #---------------------------
 
 @app.route('/upload', methods=['POST'])
+@login_required('seller')
 def upload_property():
-    data = request.json
+    data = request_body()
     
     # Extracting fields
-    seller_id = data.get('seller_id')
+    seller_id = g.identity.id
     name = data.get('name')
     owner_name = data.get('owner_name')
     location = data.get('location')
@@ -398,17 +1232,17 @@ def upload_property():
     size = data.get('size')
     property_type = data.get('type')  # Ensure your DB uses 'property_type' instead of 'type'
     description = data.get('description')
-    images=data.get('images')
+    images = data.get('images', [])
     contacts=data.get('contacts')
-    # Serialize images and contacts
-    images = ','.join(data.get('images', []))
-    # images = json.dumps(data.get('images', []))  # Store as JSON string
-    amenities = ','.join(data.get('amenities', []))  # List to CSV string
-    # contacts = ','.join(data.get('contacts', []))  # Store contacts as CSV string
+    amenities = data.get('amenities', [])
 
     # Validation
     if not all([seller_id, name, owner_name, location, price_range, size, property_type, description, contacts]):
-        return jsonify({"error": "Missing required fields"}), 400
+        return respond({"error": "Missing required fields"}), 400
+    try:
+        latitude, longitude = geo.coordinates(data.get('latitude'), data.get('longitude'))
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
 
     # Creating the Property object
     new_property = Property(
@@ -422,49 +1256,122 @@ def upload_property():
         size=size,
         property_type=property_type, 
         description=description,
-        images=images,
-        amenities=amenities,
-        contacts=contacts
+        contacts=contacts,
+        latitude=latitude,
+        longitude=longitude
     )
+    new_property.set_price_and_size()
+    new_property.set_images(images)
+    new_property.amenities = get_amenities(amenities)
 
     # Save to DB
     db.session.add(new_property)
     db.session.commit()
 
-    return jsonify({"message": "Property uploaded successfully"}), 201
+    # Photos are processed in the background; their progress is at /upload/progress/<id>
+    # Photos are checked for duplicates once processed, which may flag the listing later
+    return respond({"message": "Property uploaded successfully", "id": new_property.id,
+                    "duplicate_of": new_property.duplicate_of_id,
+                    "photos": new_property.photo_job.progress()}), 201
+
+
+image_store = images.ImageStore(app.config['IMAGE_STORE'], app.config['IMAGE_BASE_URL'])
+image_derivatives = images.DerivativeCache(image_store)
+IMAGE_MAX_AGE = 365 * 24 * 3600  # A stored image's name is its content's hash, so it never changes
+
+
+@app.route('/upload/progress/<int:product_id>', methods=['GET'])
+@login_required('seller')
+def photo_progress(product_id):
+    # How far the photo worker has got with a listing's photos
+    property = Property.query.get(product_id)
+    if not property:
+        return respond({"error": "Property not found"}), 404
+    if property.seller_id != g.identity.id:
+        return respond({"error": "Cannot view another seller's property"}), 403
+
+    job = property.photo_job
+    progress = job.progress() if job else {"status": jobs.DONE, "done": 0, "total": 0, "error": None}
+    return respond({**progress, "duplicate_of": property.duplicate_of_id}), 200
+
+
+@app.route('/images', methods=['POST'])
+@login_required('seller')
+def upload_images():
+    # multipart/form-data with one or more image files, streamed to disk; returns their URLs for /upload.
+    # Clients may send several of these at once to upload a listing's photos in parallel.
+    try:
+        names = image_store.receive(request)
+    except RequestEntityTooLarge as e:
+        return respond({"error": e.description}), 413
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+    if not names:
+        return respond({"error": "No images uploaded"}), 400
+
+    return respond({"images": [image_store.url(name) for name in names]}), 201
+
+
+@app.route('/images/<name>', methods=['GET'])
+def serve_image(name):
+    path = image_store.path(name)
+    if path is None or not os.path.exists(path):
+        return respond({"error": "Image not found"}), 404
+
+    return immutable_file(path, images.CONTENT_TYPES[name.rsplit('.', 1)[1]], name.split('.')[0])
+
+
+@app.route('/images/<name>/<variant>', methods=['GET'])
+def serve_image_variant(name, variant):
+    # A stored image scaled down to one of images.VARIANTS, made on first request and then served from disk
+    try:
+        path = image_derivatives.get(name, variant)
+    except ValueError as e:
+        return respond({"error": str(e)}), 400
+    if path is None:
+        return respond({"error": "Image not found"}), 404
+
+    return immutable_file(path, images.DERIVATIVE_CONTENT_TYPE, f"{name.split('.')[0]}-{variant}")
+
+
+def immutable_file(path, mimetype, etag):
+    response = send_file(path, mimetype=mimetype, max_age=IMAGE_MAX_AGE, etag=etag)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/seller/explore/<int:seller_id>', methods=['GET'])
 def explore_seller_properties(seller_id):
     # Fetch all properties by the given seller_id
-    properties = Property.query.filter_by(seller_id=seller_id).all()
+    properties = (db.session.query(*SUMMARY_COLUMNS)
+                  .filter(Property.seller_id == seller_id)
+                  .order_by(Property.id)
+                  .all())
 
     if not properties:
-        return jsonify({"message": "No properties found for this seller"}), 200
-
-    property_list = []
-    for property in properties:
-        property_list.append({
-            "id": property.id,
-            "name": property.name,
-            "location": property.location,
-            "price": property.price_range,
-            "images": property.images,
-            "size": property.size,
-            "amenities": property.amenities.split(',') if property.amenities else []
-        })
+        return respond({"message": "No properties found for this seller"}), 200
 
-    return jsonify({"properties": property_list}), 200
+    return respond({"properties": property_summaries(properties, with_images=True)}), 200
 
 @app.route('/upload/update/<int:product_id>', methods=['PUT'])
+@login_required('seller')
 def update_property(product_id):
     # Fetch the property by ID
     property = Property.query.get(product_id)
 
     if not property:
-        return jsonify({"error": "Property not found"}), 404
+        return respond({"error": "Property not found"}), 404
+    if property.seller_id != g.identity.id:
+        return respond({"error": "Cannot modify another seller's property"}), 403
 
     # Get the JSON data from the request
-    data = request.json
+    data = request_body()
+
+    if 'latitude' in data or 'longitude' in data:
+        try:
+            property.latitude, property.longitude = geo.coordinates(data.get('latitude'), data.get('longitude'))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
 
     # Update property details
     property.name = data.get('name', property.name)
@@ -480,41 +1387,137 @@ def update_property(product_id):
 
     amenities = data.get('amenities')
     if amenities:
-        property.amenities = ','.join(amenities)
+        property.amenities = get_amenities(amenities)
 
     images = data.get('images')
     if images and isinstance(images, list):
-        property.images = ','.join(images)
+        property.set_images(images)
+
+    property.set_price_and_size()
 
     try:
         db.session.commit()
-        return jsonify({"message": "Property updated successfully"}), 200
+        return respond({"message": "Property updated successfully", "duplicate_of": property.duplicate_of_id}), 200
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/upload/delete/<int:product_id>', methods=['DELETE'])
+@login_required('seller')
 def delete_property(product_id):
     # Fetch the property by ID
     property = Property.query.get(product_id)
 
     if not property:
-        return jsonify({"error": "Property not found"}), 404
+        return respond({"error": "Property not found"}), 404
+    if property.seller_id != g.identity.id:
+        return respond({"error": "Cannot delete another seller's property"}), 403
 
     try:
         # Delete the property
         db.session.delete(property)
         db.session.commit()
         
-        return jsonify({"message": "Property deleted successfully"}), 200
+        return respond({"message": "Property deleted successfully"}), 200
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
+
+
+IMPORT_LIST_SEPARATOR = '|'
+
+
+@app.cli.command('import-properties')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_properties(path):
+    """Bulk-load listings from a CSV file with a header row.
+
+    Columns are the Property fields (latitude/longitude optional) plus
+    `amenities` and `images`, each a '|'-separated list. Rows go in with COPY on PostgreSQL and multi-row
+    INSERTs elsewhere, bypassing the ORM, so the search index is rebuilt after.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        records = list(csv.DictReader(f))
+    if not records:
+        click.echo("Nothing to import")
+        return
+
+    def split(value):
+        return [item.strip() for item in (value or '').split(IMPORT_LIST_SEPARATOR) if item.strip()]
+
+    storage.use_primary(db.session)
+    amenities = get_amenities(name for record in records for name in split(record.get('amenities')))
+    db.session.flush()
+    amenity_ids = {amenity.name: amenity.id for amenity in amenities}
+
+    connection = db.session.connection()
+    property_ids = storage.reserve_ids(connection, Property.__table__, len(records))
+    properties, links, images = [], [], []
+    for line, (property_id, record) in enumerate(zip(property_ids, records), start=2):
+        price_min, price_max = parse_price_range(record['price_range'])
+        try:
+            latitude, longitude = geo.coordinates(record.get('latitude') or None, record.get('longitude') or None)
+        except ValueError as e:
+            raise click.ClickException(f"Line {line}: {e}")
+        properties.append({
+            'id': property_id,
+            'seller_id': int(record['seller_id']),
+            'name': record['name'],
+            'owner_name': record['owner_name'],
+            'location': record['location'],
+            'address': record.get('address') or 'ggez',
+            'price_range': record['price_range'],
+            'price_min': price_min,
+            'price_max': price_max,
+            'negotiable': record.get('negotiable', '').strip().lower() in ('1', 'true', 'yes'),
+            'size': record['size'],
+            'size_sqft': parse_size_sqft(record['size']),
+            'property_type': record['property_type'],
+            'description': record['description'],
+            'contacts': record['contacts'],
+            'latitude': latitude,
+            'longitude': longitude,
+        })
+        links.extend({'property_id': property_id, 'amenity_id': amenity_ids[name]}
+                     for name in dict.fromkeys(split(record.get('amenities'))))
+        images.extend({'property_id': property_id, 'position': i, 'url': url}
+                      for i, url in enumerate(split(record.get('images'))))
+
+    storage.bulk_insert(connection, Property.__table__, properties)
+    storage.bulk_insert(connection, property_amenity, links)
+    storage.bulk_insert(connection, PropertyImage.__table__, images)
+    search.rebuild(connection)
+    geo.rebuild(connection)
+    map_clusters.rebuild(connection)
+    location_index.rebuild(connection, Property.__table__)
+    duplicate_index.add_many(connection, properties)
+    listing_changes.bump(connection)  # Tells every process's indexes to rebuild
+    db.session.commit()
+    # Running servers' cached pages expire within EXPLORE_CACHE_TTL
+    explore_cache.clear()
+    click.echo(f"Imported {len(properties)} properties")
+
+
+@app.cli.command('process-images')
+@click.option('--processes', type=int, default=None, help='Size of the process pool; one per core by default.')
+@click.option('--once', is_flag=True, help='Stop when the queue is empty instead of waiting for more jobs.')
+def process_images(processes, once):
+    """Make the derivatives, sizes and perceptual hashes of queued listing photos (see jobs.py)."""
+    worker = jobs.PhotoWorker(db.engine, PhotoJob.__table__, PropertyImage.__table__, image_store, processes,
+                              on_finish=duplicate_index.check_photos)
+    worker.run(once=once)
+
+
+@app.cli.command('refresh-replicas')
+def refresh_replicas():
+    """Copy the database over its SQLite read replicas, e.g. from cron for workers under gunicorn."""
+    storage.refresh_replicas(db.engines)
 
 
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        storage.start_replica_refresh(app, db.engines)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,483 @@
+import re
+import threading
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+from sqlalchemy import and_, event, exists, func, inspect, not_, or_, select
+
+# In-process bitmap index over listing ids, for the boolean filters buyers
+# combine: amenities, property type, location, negotiability and price band.
+#
+# Every (field, value) has a compressed bitmap of the ids having it, split
+# roaring-style into chunks of 2^16 ids: a chunk holding few ids is a set of
+# their low 16 bits, a denser one a 65536-bit integer, so an AND/OR of whole
+# filter expressions costs a few big-integer operations per chunk. Routes use
+# the result to fetch just the page of rows they return, and to count facets.
+# Single-valued fields also keep each listing's value, so a facet with
+# thousands of values (location) is counted in one pass over the matches
+# rather than one intersection per value.
+# SQL still applies every filter to the rows it fetches, so a stale index can
+# cost a page some of its rows' worth of work but never return a wrong row.
+#
+# The index is built from the database on first use and updated as this
+# process commits listing changes. Before answering it checks the shared
+# change count (see changes.py): once another process has changed the
+# listings, one request rebuilds it, and the rest either wait for that or,
+# like /explore, answer from SQL alone meanwhile.
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+ARRAY_MAX = 4096  # Past this many ids a set takes more room than the 8 KB bitset
+
+FIELDS = ('amenity', 'type', 'location', 'negotiable', 'price')
+SCALAR_FIELDS = ('type', 'location', 'negotiable', 'price')  # One value per listing
+EVERYTHING = ('*', None)  # Key of the bitmap of every listing, for NOT
+# Counting a scalar field by walking the matches beats intersecting every value's bitmap
+# up to about this many matches per value
+WALK_PER_VALUE = 50
+
+# Bit positions set in each byte value, for reading ids back out of a bitset
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _bitset(lows):
+    bits = bytearray(CHUNK_BYTES)
+    for low in lows:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _container(lows):
+    lows = frozenset(lows)
+    return lows if len(lows) <= ARRAY_MAX else _bitset(lows)
+
+
+def _lows(container):
+    """The container's low bits in ascending order."""
+    if isinstance(container, frozenset):
+        return sorted(container)
+    bits = container.to_bytes(CHUNK_BYTES, 'little')
+    return [i << 3 | bit for i, byte in enumerate(bits) if byte for bit in BYTE_BITS[byte]]
+
+
+def _filter(lows, bitset, keep):
+    """The `lows` whose bit in `bitset` is set (keep=True) or clear (keep=False)."""
+    bits = bitset.to_bytes(CHUNK_BYTES, 'little')
+    return frozenset(low for low in lows if bool(bits[low >> 3] >> (low & 7) & 1) is keep)
+
+
+def _and(a, b):
+    if isinstance(a, frozenset) and isinstance(b, frozenset):
+        return a & b
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b
+    lows, bitset = (a, b) if isinstance(a, frozenset) else (b, a)
+    return _filter(lows, bitset, True)
+
+
+def _or(a, b):
+    if isinstance(a, frozenset) and isinstance(b, frozenset):
+        return _container(a | b)
+    return (a if isinstance(a, int) else _bitset(a)) | (b if isinstance(b, int) else _bitset(b))
+
+
+def _andnot(a, b):
+    if isinstance(a, frozenset):
+        return a - b if isinstance(b, frozenset) else _filter(a, b, False)
+    return a & ~(b if isinstance(b, int) else _bitset(b))
+
+
+def _size(container):
+    return len(container) if isinstance(container, frozenset) else container.bit_count()
+
+
+class Bitmap:
+    """An immutable set of non-negative ids."""
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks or {}  # High bits -> frozenset of low bits, or int bitset; never empty
+
+    @classmethod
+    def of(cls, ids):
+        groups = defaultdict(list)
+        for id in ids:
+            groups[id >> CHUNK_BITS].append(id & LOW_MASK)
+        return cls({high: _container(lows) for high, lows in groups.items()})
+
+    def _combine(self, other, op, highs):
+        chunks = {}
+        for high in highs:
+            container = op(self.chunks.get(high, frozenset()), other.chunks.get(high, frozenset()))
+            if container:
+                chunks[high] = container
+        return Bitmap(chunks)
+
+    def __and__(self, other):
+        return self._combine(other, _and, self.chunks.keys() & other.chunks.keys())
+
+    def __or__(self, other):
+        return self._combine(other, _or, self.chunks.keys() | other.chunks.keys())
+
+    def __sub__(self, other):
+        return self._combine(other, _andnot, self.chunks.keys())
+
+    def __len__(self):
+        return sum(_size(container) for container in self.chunks.values())
+
+    def __contains__(self, id):
+        container = self.chunks.get(id >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = id & LOW_MASK
+        return low in container if isinstance(container, frozenset) else bool(container >> low & 1)
+
+    def __iter__(self):
+        for high in sorted(self.chunks):
+            base = high << CHUNK_BITS
+            for low in _lows(self.chunks[high]):
+                yield base | low
+
+    def descending(self, below=None):
+        """The ids in descending order, only those under `below` if given; cheap to stop early."""
+        for high in sorted(self.chunks, reverse=True):
+            base = high << CHUNK_BITS
+            if below is not None and base >= below:
+                continue
+            container = self.chunks[high]
+            limit = 1 << CHUNK_BITS if below is None else min(below - base, 1 << CHUNK_BITS)
+            if isinstance(container, frozenset):
+                for low in sorted((low for low in container if low < limit), reverse=True):
+                    yield base | low
+            else:
+                # Peel off the top bit each time rather than decoding the whole chunk for one page
+                container &= (1 << limit) - 1
+                while container:
+                    low = container.bit_length() - 1
+                    yield base | low
+                    container ^= 1 << low
+
+    def adding(self, id):
+        high, low = id >> CHUNK_BITS, id & LOW_MASK
+        chunks = dict(self.chunks)
+        chunks[high] = _or(chunks.get(high, frozenset()), frozenset((low,)))
+        return Bitmap(chunks)
+
+    def removing(self, id):
+        high, low = id >> CHUNK_BITS, id & LOW_MASK
+        chunks = dict(self.chunks)
+        container = _andnot(chunks.get(high, frozenset()), frozenset((low,)))
+        if container:
+            chunks[high] = container
+        else:
+            chunks.pop(high, None)
+        return Bitmap(chunks)
+
+
+EMPTY = Bitmap()
+
+# Filter expressions: field:value terms, with AND (or juxtaposition), OR, NOT and parentheses.
+# Values with spaces or parentheses are double-quoted: location:"Pune, Maharashtra"
+TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|(?P<field>\w+):(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<bare>[^\s()"]+))'
+                   r'|(?P<word>\w+)|(?P<bad>\S))')
+TRUE_WORDS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+
+def all_of(nodes):
+    """An expression tree requiring every one of `nodes`, or None if there are none."""
+    tree = None
+    for node in nodes:
+        tree = node if tree is None else ('and', tree, node)
+    return tree
+
+
+class BitmapIndex:
+    def __init__(self, model, links, amenities, price_edges, counter):
+        """`model` is the Property class, `links` the property-amenity table and `amenities` the amenity table.
+
+        `price_edges` are the ascending lower bounds of the price bands, starting at 0. `counter`
+        is the changes.ChangeCounter bumped by every listing change.
+        """
+        self.model = model
+        self.links = links
+        self.amenities = amenities
+        self.price_edges = price_edges
+        self.counter = counter
+        self.bitmaps = None  # Field -> value -> Bitmap
+        self.columns = None  # Scalar field -> id -> value
+        self.built_at = None  # The change count the bitmaps reflect; None when out of date
+        self.lock = threading.Lock()  # Held by the one request rebuilding
+        self.update_lock = threading.Lock()  # Held while changing self.bitmaps
+
+    def price_band(self, price):
+        return None if price is None else max(bisect_right(self.price_edges, price) - 1, 0)
+
+    def _load(self, connection):
+        model, links, amenities = self.model, self.links, self.amenities
+        ids = defaultdict(list)
+        for id, type_, location, negotiable, price in connection.execute(
+                select(model.id, model.property_type, model.location, model.negotiable, model.price_min)):
+            for key in self._scalar_keys(type_, location, negotiable, price):
+                ids[key].append(id)
+        for id, name in connection.execute(
+                select(links.c.property_id, amenities.c.name).join(amenities, amenities.c.id == links.c.amenity_id)):
+            ids[('amenity', name)].append(id)
+
+        bitmaps = defaultdict(dict)
+        columns = {field: {} for field in SCALAR_FIELDS}
+        for (field, value), members in ids.items():
+            bitmaps[field][value] = Bitmap.of(members)
+            if field in columns:
+                columns[field].update(dict.fromkeys(members, value))
+        return dict(bitmaps), columns
+
+    def _scalar_keys(self, type_, location, negotiable, price):
+        keys = [EVERYTHING, ('type', type_), ('location', location), ('negotiable', bool(negotiable))]
+        if price is not None:
+            keys.append(('price', self.price_band(price)))
+        return keys
+
+    def _current(self, count):
+        return self.bitmaps is not None and self.built_at is not None and self.built_at >= count
+
+    def _bitmaps(self, connection, wait=True):
+        """The bitmaps, rebuilt first if the listings changed since. Without `wait`, None rather than
+        waiting for another request's rebuild."""
+        # Read before the rows, so the rows are at least as recent as the count they are marked with
+        count = self.counter.current(connection)
+        if self._current(count):
+            return self.bitmaps
+        if not self.lock.acquire(blocking=wait):
+            return None
+        try:
+            if not self._current(count):  # Else rebuilt while this request waited
+                bitmaps, columns = self._load(connection)
+                with self.update_lock:
+                    self.bitmaps, self.columns, self.built_at = bitmaps, columns, count
+            return self.bitmaps
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        """Rebuild on the next lookup."""
+        self.built_at = None
+
+    def parse(self, text):
+        """Parse a filter expression into a tree for evaluate() and clause(). Raises ValueError."""
+        tokens = []
+        for match in TOKEN.finditer(text):
+            if match['bad']:
+                raise ValueError(f"Unexpected '{match['bad']}' in filter")
+            if match['paren']:
+                tokens.append(match['paren'])
+            elif match['word']:
+                word = match['word'].upper()
+                if word not in ('AND', 'OR', 'NOT'):
+                    raise ValueError(f"Expected field:value in filter, got '{match['word']}'")
+                tokens.append(word)
+            else:
+                value = re.sub(r'\\(.)', r'\1', match['quoted']) if match['quoted'] is not None else match['bare']
+                tokens.append(self.term(match['field'], value))
+
+        position = 0
+
+        def peek():
+            return tokens[position] if position < len(tokens) else None
+
+        def take():
+            nonlocal position
+            position += 1
+            return tokens[position - 1]
+
+        def any_of():
+            tree = all_of_terms()
+            while peek() == 'OR':
+                take()
+                tree = ('or', tree, all_of_terms())
+            return tree
+
+        def all_of_terms():
+            tree = negated()
+            while peek() not in (None, 'OR', ')'):
+                if peek() == 'AND':
+                    take()
+                tree = ('and', tree, negated())
+            return tree
+
+        def negated():
+            if peek() == 'NOT':
+                take()
+                return ('not', negated())
+            token = take() if peek() is not None else None
+            if token == '(':
+                tree = any_of()
+                if peek() != ')':
+                    raise ValueError("Unbalanced parentheses in filter")
+                take()
+                return tree
+            if not isinstance(token, tuple):
+                raise ValueError("Incomplete filter expression")
+            return token
+
+        if not tokens:
+            raise ValueError("Empty filter expression")
+        tree = any_of()
+        if position != len(tokens):
+            raise ValueError("Unbalanced parentheses in filter")
+        return tree
+
+    def term(self, field, value):
+        """A ('term', field, value) leaf, with the value in the form the index stores."""
+        if field not in FIELDS:
+            raise ValueError(f"Unknown filter field '{field}'; expected one of {', '.join(FIELDS)}")
+        if field == 'negotiable':
+            if value.lower() not in TRUE_WORDS:
+                raise ValueError("negotiable must be true or false")
+            return ('term', field, TRUE_WORDS[value.lower()])
+        if field == 'price':
+            try:
+                return ('term', field, self.price_edges.index(float(value)))
+            except ValueError:
+                raise ValueError(f"price must be the lower bound of a band: {', '.join(map(str, self.price_edges))}")
+        return ('term', field, value)
+
+    def evaluate(self, connection, tree, wait=True):
+        """The Bitmap of listing ids matching an expression tree.
+
+        Without `wait`, None if the index is out of date and another request is rebuilding it.
+        """
+        bitmaps = self._bitmaps(connection, wait)
+        if bitmaps is None:
+            return None
+        everything = _lookup(bitmaps, EVERYTHING)
+
+        def run(node):
+            if node[0] == 'term':
+                return _lookup(bitmaps, node[1:])
+            if node[0] == 'not':
+                return everything - run(node[1])
+            left, right = run(node[1]), run(node[2])
+            return left & right if node[0] == 'and' else left | right
+
+        return run(tree) if tree is not None else everything
+
+    def counts(self, connection, field, matches):
+        """{value: how many of the ids in `matches` have it} for the (non-None) values of `field` in `matches`."""
+        values = self._bitmaps(connection).get(field, {})
+        column = (self.columns or {}).get(field)
+        if column is not None and len(matches) <= WALK_PER_VALUE * len(values):
+            counts = Counter(map(column.get, matches))
+        else:
+            counts = {value: len(matches & bitmap) for value, bitmap in list(values.items())}
+        # None also stands for unpriced listings, and for any the index hasn't seen yet
+        return {value: n for value, n in counts.items() if n and value is not None}
+
+    def clause(self, node):
+        """The SQL equivalent of an expression tree, restricting the model's rows the same way."""
+        if node[0] == 'and':
+            return and_(self.clause(node[1]), self.clause(node[2]))
+        if node[0] == 'or':
+            return or_(self.clause(node[1]), self.clause(node[2]))
+        if node[0] == 'not':
+            return not_(self.clause(node[1]))
+        _, field, value = node
+        model = self.model
+        if field == 'type':
+            return model.property_type == value
+        if field == 'location':
+            return model.location == value
+        if field == 'negotiable':
+            return func.coalesce(model.negotiable, False) == value
+        if field == 'price':
+            # price_min IS NOT NULL first, so NOT of this is true, not NULL, for unpriced listings
+            band = [model.price_min.isnot(None), model.price_min >= self.price_edges[value]]
+            if value + 1 < len(self.price_edges):
+                band.append(model.price_min < self.price_edges[value + 1])
+            return and_(*band)
+        # Correlated, so vetting a page of ids costs a primary-key probe per id rather than a scan of the links
+        links, amenities = self.links, self.amenities
+        return exists().where(links.c.property_id == model.id,
+                              links.c.amenity_id == select(amenities.c.id)
+                              .where(amenities.c.name == value).scalar_subquery())
+
+    def _keys(self, obj):
+        keys = set(self._scalar_keys(obj.property_type, obj.location, obj.negotiable, obj.price_min))
+        keys.update(('amenity', amenity.name) for amenity in obj.amenities)
+        return keys
+
+    def apply(self, changes, count):
+        """Move ids between bitmaps: `changes` maps an id to the keys it had before and has now.
+
+        `count` is the change count the commit making them bumped to.
+        """
+        with self.update_lock:
+            bitmaps, columns = self.bitmaps, self.columns
+            if bitmaps is None:
+                return
+            for id, (before, after) in changes.items():
+                for field, value in before - after:
+                    values = bitmaps.get(field, {})
+                    if id in values.get(value, EMPTY):
+                        bitmap = values[value].removing(id)
+                        if bitmap:
+                            values[value] = bitmap
+                        else:
+                            del values[value]
+                    if field in columns:
+                        columns[field].pop(id, None)
+                for field, value in after:
+                    values = bitmaps.setdefault(field, {})
+                    if id not in values.get(value, EMPTY):
+                        values[value] = values.get(value, EMPTY).adding(id)
+                    if field in columns:
+                        columns[field][id] = value
+            # Still current only if no other process committed a change in between
+            self.built_at = count if self.built_at == count - 1 else None
+
+    def maintain_on_flush(self, session, model):
+        """Update the bitmaps of every `model` row a committed flush inserts, changes or deletes.
+
+        The counter must be bumped by flushes of `model` (see changes.ChangeCounter.bump_on_flush).
+        """
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            changes = session.info.setdefault('bitmap_changes', {})
+            for obj in session.new | session.dirty | session.deleted:
+                if not isinstance(obj, model):
+                    continue
+                if obj.id in changes:
+                    before = changes[obj.id][0]
+                elif obj in session.new:
+                    before = set()
+                else:
+                    before = self._previous_keys(obj)
+                changes[obj.id] = (before, set() if obj in session.deleted else self._keys(obj))
+
+        @self.counter.committed
+        def _committed(session, count):
+            self.apply(session.info.pop('bitmap_changes', {}), count)
+
+        @event.listens_for(session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop('bitmap_changes', None)
+
+    def _previous_keys(self, obj):
+        """The keys `obj` may have had before the pending flush: its old scalar values, and any amenity."""
+        keys = set(self._scalar_keys(_previous(obj, 'property_type'), _previous(obj, 'location'),
+                                     _previous(obj, 'negotiable'), _previous(obj, 'price_min')))
+        # The old amenity list isn't always loaded; the few amenity bitmaps are cheap to check instead
+        keys.update(('amenity', name) for name in list((self.bitmaps or {}).get('amenity', {})))
+        return keys
+
+
+def _lookup(bitmaps, key):
+    field, value = key
+    return bitmaps.get(field, {}).get(value, EMPTY)
+
+
+def _previous(obj, name):
+    """An attribute's value before the pending flush."""
+    deleted = inspect(obj).attrs[name].history.deleted
+    return deleted[0] if deleted else getattr(obj, name)
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request
+from sqlalchemy import event
+
+import compress
+import serializers
+
+# In-process cache of fully encoded GET responses. Entries hold the response
+# bytes plus a strong ETag, so a hit costs neither a query nor a jsonify, and a
+# client that already has the body gets a 304 through Werkzeug's conditional
+# response handling. Entries also keep the body compressed with every
+# available coding (see compress.py), so compression costs CPU once per fill
+# rather than once per request. Commits touching the watched models drop
+# every entry; with a `ttl`, entries also expire, for changes committed by
+# other processes and reads served by a lagging replica, which a commit-time
+# invalidation can't account for.
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'mimetype', 'encoded'])  # encoded: {coding: body}
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (CachedResponse, stored at)
+        self.generation = 0  # Bumped on every invalidation
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path, args, mimetype=None):
+        """Normalize a request into a cache key: order of query params doesn't matter.
+
+        `mimetype` tells apart encodings of the same data (see serializers.py).
+        """
+        return path, tuple(sorted((k, v) for k, values in args.lists() for v in values if v)), mimetype
+
+    def get(self, key):
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None:
+                return None
+            if self.ttl is not None and self.clock() - cached[1] >= self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return cached[0]
+
+    def put(self, key, body, mimetype, generation):
+        """Store an encoded body, unless the data changed since it was computed at `generation`."""
+        encoded = compress.precompress(body) if compress.compressible(mimetype) else {}
+        entry = CachedResponse(body, hashlib.sha256(body).hexdigest(), mimetype, encoded)
+        with self.lock:
+            if generation != self.generation:
+                return entry
+            self.entries[key] = (entry, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def invalidate_on_commit(self, session, models):
+        """Clear the cache after any commit that inserted, updated or deleted one of `models`."""
+        models = tuple(models)
+
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            changed = session.new | session.dirty | session.deleted
+            if any(isinstance(obj, models) for obj in changed):
+                session.info['response_cache_stale'] = True
+
+        @event.listens_for(session, 'after_commit')
+        def _after_commit(session):
+            if session.info.pop('response_cache_stale', False):
+                self.clear()
+
+        @event.listens_for(session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop('response_cache_stale', None)
+
+
+def cached(cache):
+    """Serve a GET view from `cache`, answering If-None-Match with 304, compressed if the client takes it."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache.key(request.path, request.args, serializers.negotiated().mimetype)
+            entry = cache.get(key)
+            if entry is None:
+                generation = cache.generation
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = cache.put(key, response.get_data(), response.mimetype, generation)
+
+            coding = compress.negotiate(request.headers.get('Accept-Encoding'), entry.encoded)
+            response = current_app.response_class(entry.encoded[coding] if coding else entry.body,
+                                                   mimetype=entry.mimetype)
+            if coding:
+                response.content_encoding = coding
+            response.vary.add('Accept')
+            if entry.encoded:
+                response.vary.add('Accept-Encoding')
+            response.set_etag(entry.etag, weak=bool(coding))
+            response.cache_control.no_cache = True  # Always revalidate; a match costs a 304
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,71 @@
+from sqlalchemy import event, insert, select, update
+
+import storage
+
+# A count of committed listing changes that every process shares, so the
+# data a process keeps in memory (the bitmap index, the location trie, the
+# spelling vocabulary) can tell when another process changed the listings.
+#
+# The count is one row. The first flush of a transaction that writes a
+# watched model bumps it, so the new count commits or rolls back with the
+# change. On PostgreSQL the row stays locked until then, which puts listing
+# writes one after another; they are short. An in-memory structure keeps
+# the count it was built at, and is current while that is no lower than
+# the stored count: one primary-key read to check.
+
+ROW_ID = 1
+
+
+class ChangeCounter:
+    def __init__(self, table):
+        """`table` has an integer `id` primary key and an integer `value`, and holds at most the one row."""
+        self.table = table
+        self.listeners = []
+
+    def current(self, connection):
+        """The count of committed changes, as `connection` sees it."""
+        return connection.scalar(select(self.table.c.value).where(self.table.c.id == ROW_ID)) or 0
+
+    def bump(self, connection):
+        """Count a change made through `connection`, for writes that bypass the ORM; returns the new count."""
+        value = connection.execute(update(self.table).where(self.table.c.id == ROW_ID)
+                                   .values(value=self.table.c.value + 1)
+                                   .returning(self.table.c.value)).scalar()
+        if value is None:  # The row is made by register() and the migration; in case it was lost since
+            connection.execute(insert(self.table).values(id=ROW_ID, value=1))
+            value = 1
+        return value
+
+    def committed(self, listener):
+        """Have listener(session, count) called after each commit that bumped the count, with its new count."""
+        self.listeners.append(listener)
+        return listener
+
+    def bump_on_flush(self, session, models):
+        """Bump the count once in each transaction whose flushes insert, update or delete one of `models`."""
+        models = tuple(models)
+
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            if 'change_count' in session.info:
+                return
+            if any(isinstance(obj, models) for obj in session.new | session.dirty | session.deleted):
+                session.info['change_count'] = self.bump(storage.primary_connection(session))
+
+        @event.listens_for(session, 'after_commit')
+        def _after_commit(session):
+            count = session.info.pop('change_count', None)
+            if count is not None:
+                for listener in self.listeners:
+                    listener(session, count)
+
+        @event.listens_for(session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop('change_count', None)
+
+
+def register(table):
+    """Create the counter's row along with its table."""
+    @event.listens_for(table, 'after_create')
+    def _seed(target, connection, **kw):
+        connection.execute(target.insert().values(id=ROW_ID, value=0))
@@ -0,0 +1,265 @@
+import math
+from collections import defaultdict
+
+from sqlalchemy import and_, bindparam, event, func, inspect, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import geo
+import storage
+
+# Per-zoom map clusters: listings aggregated over a quadtree of Web Mercator
+# grid cells, one row per non-empty (level, x, y) with the listing count,
+# coordinate sums (for the centroid) and price bounds. A map pan then reads
+# the few cells under the viewport instead of every listing.
+#
+# Cells are kept exact as listings change: after a flush, each touched cell
+# at the finest level is recomputed from the listings inside it (found
+# through the spatial index). The coarser cells above it take the change as
+# a delta, all levels in one upsert: counts and sums add up, and a price or
+# id coming in can only lower a minimum or raise a maximum. Only where one
+# going out was a cell's minimum or maximum is that cell recomputed from its
+# four children.
+
+MAX_LEVEL = 14  # ~2.4 km cells at the equator; closer in, clients page through /explore/near
+LEVEL_OFFSET = 3  # 8x8 cells per 256px map tile
+MAX_LATITUDE = 85.0511287798  # Web Mercator's limit; points beyond fall in the edge cells
+
+PG_LOCK_KEY = 0x6d6170  # Advisory lock serializing cluster maintenance on PostgreSQL
+
+WATCHED = ('latitude', 'longitude', 'price_min', 'price_max')
+
+SUMS = ('count', 'latitude_sum', 'longitude_sum')
+# Column -> whether its lowest (else highest) value is kept
+EXTREMES = {'price_min': True, 'price_max': False, 'first_property_id': True}
+
+
+def level_for_zoom(zoom):
+    return max(0, min(zoom + LEVEL_OFFSET, MAX_LEVEL))
+
+
+def cell(latitude, longitude, level):
+    """The (x, y) of the cell containing a point, in slippy-map tile numbering."""
+    n = 1 << level
+    latitude = max(-MAX_LATITUDE, min(latitude, MAX_LATITUDE))
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def cell_box(x, y, level):
+    """(south, west, north, east) of a cell; the edge rows reach the poles."""
+    n = 1 << level
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    north = 90.0 if y == 0 else latitude(y)
+    south = -90.0 if y == n - 1 else latitude(y + 1)
+    return south, x / n * 360 - 180, north, (x + 1) / n * 360 - 180
+
+
+class ClusterGrid:
+    def __init__(self, cluster_table, listings):
+        """`listings` gives the id, latitude, longitude, price_min and price_max columns as attributes.
+
+        That is the Property class, or a property table's `.c` where there is no mapping (migrations).
+        """
+        self.clusters = cluster_table
+        self.listings = listings
+
+    def _aggregate(self, rows):
+        """Cluster row values for an iterable of (id, latitude, longitude, price_min, price_max)."""
+        rows = list(rows)
+        prices_min = [r[3] for r in rows if r[3] is not None]
+        prices_max = [r[4] for r in rows if r[4] is not None]
+        return {
+            'count': len(rows),
+            'latitude_sum': sum(r[1] for r in rows),
+            'longitude_sum': sum(r[2] for r in rows),
+            'price_min': min(prices_min) if prices_min else None,
+            'price_max': max(prices_max) if prices_max else None,
+            'first_property_id': min(r[0] for r in rows),
+        }
+
+    def _listing_rows(self, connection, box):
+        listings = self.listings
+        return connection.execute(
+            select(listings.id, listings.latitude, listings.longitude, listings.price_min, listings.price_max)
+            .where(*geo.within(listings, connection.dialect.name, box))
+        ).all()
+
+    def refresh(self, connection, cells):
+        """Recompute the finest-level `cells` ({(x, y)}) from the listings, then bring their ancestors up to date."""
+        if not cells:
+            return
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PG_LOCK_KEY})
+
+        clusters = self.clusters.c
+        keys = [(MAX_LEVEL, x, y) for x, y in cells]
+        old = {(row.x, row.y): row._asdict() for row in connection.execute(
+            select(self.clusters).where(tuple_(clusters.level, clusters.x, clusters.y).in_(keys)))}
+        new = {}
+        for x, y in cells:
+            # Pad the box so rounding at the edges can't drop a listing; membership is decided by cell()
+            south, west, north, east = cell_box(x, y, MAX_LEVEL)
+            box = (south - 1e-9, west - 1e-9, north + 1e-9, east + 1e-9)
+            rows = [row for row in self._listing_rows(connection, box)
+                    if cell(row[1], row[2], MAX_LEVEL) == (x, y)]
+            if rows:
+                new[(x, y)] = {'level': MAX_LEVEL, 'x': x, 'y': y, **self._aggregate(rows)}
+        connection.execute(self.clusters.delete().where(tuple_(clusters.level, clusters.x, clusters.y).in_(keys)))
+        if new:
+            connection.execute(self.clusters.insert(), list(new.values()))
+
+        deltas, leaving = {}, defaultdict(set)  # Ancestor -> its change; (column, value) -> ancestors losing it
+        for x, y in cells:
+            before, after = old.get((x, y)), new.get((x, y))
+            change = {name: (after[name] if after else 0) - (before[name] if before else 0) for name in SUMS}
+            for name, lowest in EXTREMES.items():
+                change[name] = now = after and after[name]
+                gone = before and before[name]
+                # The cell's old extreme is no longer in it if the new one is past it, or there is none
+                if gone is not None and (now is None or (now > gone if lowest else now < gone)):
+                    leaving[(name, gone)].update(_ancestors(x, y))
+            for key in _ancestors(x, y):
+                _combine(deltas.setdefault(key, {name: 0 for name in SUMS} | dict.fromkeys(EXTREMES)), change)
+        self._apply(connection, deltas)
+
+        # Cells whose minimum or maximum went out get it again from their children, finest first
+        stale = set()
+        for (name, gone), keys in leaving.items():
+            stale.update(connection.execute(
+                select(clusters.level, clusters.x, clusters.y)
+                .where(tuple_(clusters.level, clusters.x, clusters.y).in_(keys), clusters[name] == gone)).all())
+        for level, x, y in sorted(stale, reverse=True):
+            self._recompute_extremes(connection, level, x, y)
+
+    def _apply(self, connection, deltas):
+        """Add each of `deltas` ({(level, x, y): change}) to its cell, and drop the cells left empty."""
+        clusters = self.clusters.c
+        changed = [{'level': level, 'x': x, 'y': y, **change} for (level, x, y), change in deltas.items()
+                   if any(change[name] for name in SUMS) or change['first_property_id'] is not None]
+        # Listings came into these, which may be new cells
+        arriving = [row for row in changed if row['first_property_id'] is not None]
+        if arriving:
+            insert = (postgresql if connection.dialect.name == 'postgresql' else sqlite).insert(self.clusters)
+            set_ = {name: clusters[name] + insert.excluded[name] for name in SUMS}
+            for name, lowest in EXTREMES.items():
+                set_[name] = _extreme(connection.dialect.name, lowest, clusters[name], insert.excluded[name])
+            connection.execute(insert.on_conflict_do_update(index_elements=['level', 'x', 'y'], set_=set_), arriving)
+        # Listings only left these, so they exist
+        leaving = [{f'delta_{name}': value for name, value in row.items()}
+                   for row in changed if row['first_property_id'] is None]
+        if leaving:
+            connection.execute(update(self.clusters)
+                               .where(clusters.level == bindparam('delta_level'),
+                                      clusters.x == bindparam('delta_x'), clusters.y == bindparam('delta_y'))
+                               .values({name: clusters[name] + bindparam(f'delta_{name}') for name in SUMS}),
+                               leaving)
+        emptied = [(row['level'], row['x'], row['y']) for row in changed if row['count'] < 0]
+        if emptied:
+            connection.execute(self.clusters.delete().where(
+                tuple_(clusters.level, clusters.x, clusters.y).in_(emptied), clusters.count <= 0))
+
+    def _recompute_extremes(self, connection, level, x, y):
+        clusters = self.clusters.c
+        children = self.clusters.alias('child').c
+        below = and_(children.level == level + 1,
+                     children.x.between(2 * x, 2 * x + 1), children.y.between(2 * y, 2 * y + 1))
+        connection.execute(update(self.clusters)
+                           .where(clusters.level == level, clusters.x == x, clusters.y == y)
+                           .values({name: select((func.min if lowest else func.max)(children[name]))
+                                    .where(below).scalar_subquery()
+                                    for name, lowest in EXTREMES.items()}))
+
+    def rebuild(self, connection):
+        """Recompute every cell from scratch, for writes that bypassed the ORM (bulk loads, migrations)."""
+        listings = self.listings
+        rows = connection.execute(
+            select(listings.id, listings.latitude, listings.longitude, listings.price_min, listings.price_max)
+            .where(listings.latitude.isnot(None), listings.longitude.isnot(None))
+        ).all()
+
+        by_cell = defaultdict(list)
+        for row in rows:
+            by_cell[cell(row[1], row[2], MAX_LEVEL)].append(row)
+        level_rows = [{'level': MAX_LEVEL, 'x': x, 'y': y, **self._aggregate(members)}
+                      for (x, y), members in by_cell.items()]
+
+        all_rows = list(level_rows)
+        for level in range(MAX_LEVEL - 1, -1, -1):
+            parents = defaultdict(list)
+            for child in level_rows:
+                parents[(child['x'] >> 1, child['y'] >> 1)].append(child)
+            level_rows = [{
+                'level': level, 'x': x, 'y': y,
+                'count': sum(c['count'] for c in children),
+                'latitude_sum': sum(c['latitude_sum'] for c in children),
+                'longitude_sum': sum(c['longitude_sum'] for c in children),
+                'price_min': min((c['price_min'] for c in children if c['price_min'] is not None), default=None),
+                'price_max': max((c['price_max'] for c in children if c['price_max'] is not None), default=None),
+                'first_property_id': min(c['first_property_id'] for c in children),
+            } for (x, y), children in parents.items()]
+            all_rows.extend(level_rows)
+
+        connection.execute(self.clusters.delete())
+        storage.bulk_insert(connection, self.clusters, all_rows)
+
+    def viewport(self, box, zoom):
+        """(level, select of the cluster rows under `box`) for a map at `zoom`."""
+        level = level_for_zoom(zoom)
+        south, west, north, east = box
+        x0, y0 = cell(north, west, level)
+        x1, y1 = cell(south, east, level)
+        clusters = self.clusters.c
+        return level, (select(self.clusters)
+                       .where(clusters.level == level, clusters.x.between(x0, x1), clusters.y.between(y0, y1))
+                       .order_by(clusters.x, clusters.y))
+
+    def maintain_on_flush(self, session, model):
+        """Refresh the cells of every `model` row a flush inserts, deletes or moves or reprices."""
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            cells = set()
+            for obj in session.new | session.dirty | session.deleted:
+                if not isinstance(obj, model):
+                    continue
+                state = inspect(obj)
+                if obj in session.dirty and not any(state.attrs[name].history.has_changes() for name in WATCHED):
+                    continue
+                # The cell it was in before this flush, and the one it is in now
+                positions = [(_previous(state, 'latitude'), _previous(state, 'longitude'))]
+                if obj not in session.deleted:
+                    positions.append((obj.latitude, obj.longitude))
+                cells.update(cell(latitude, longitude, MAX_LEVEL) for latitude, longitude in positions
+                             if latitude is not None and longitude is not None)
+            self.refresh(storage.primary_connection(session), cells)
+
+
+def _ancestors(x, y):
+    """The (level, x, y) of the cells above a finest-level cell, up to the one covering the world."""
+    return [(level, x >> (MAX_LEVEL - level), y >> (MAX_LEVEL - level)) for level in range(MAX_LEVEL)]
+
+
+def _combine(total, change):
+    """Fold a cell's `change` into its ancestor's running `total`."""
+    for name in SUMS:
+        total[name] += change[name]
+    for name, lowest in EXTREMES.items():
+        values = [v for v in (total[name], change[name]) if v is not None]
+        total[name] = (min if lowest else max)(values) if values else None
+
+
+def _extreme(dialect, lowest, current, incoming):
+    """SQL for the lower (or higher) of a cell's `current` value and an `incoming` one, ignoring NULLs."""
+    if dialect == 'postgresql':
+        return (func.least if lowest else func.greatest)(current, incoming)
+    # SQLite's two-argument min() and max() are NULL if either is
+    return func.coalesce((func.min if lowest else func.max)(current, incoming), current, incoming)
+
+
+def _previous(state, name):
+    """An attribute's value before the pending flush."""
+    deleted = state.attrs[name].history.deleted
+    return deleted[0] if deleted else state.attrs[name].value
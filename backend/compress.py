@@ -0,0 +1,208 @@
+import zlib
+from itertools import islice
+
+from werkzeug.http import parse_accept_header, parse_options_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Response compression, negotiated from Accept-Encoding.
+#
+# CompressionMiddleware wraps the WSGI app and compresses responses whose
+# content compresses (JSON, MessagePack, text/*, JavaScript, SVG) of at
+# least MINIMUM_SIZE bytes on their way out, chunk by chunk, so a streamed
+# response stays streamed.
+# It leaves alone responses that are already encoded, so a view (like
+# cache.cached) can send a body it compressed earlier, once, instead of on
+# every request. gzip is always available; zstd and brotli are used when
+# their packages (zstandard, brotli) are installed and the client takes
+# them.
+#
+# A compressed body isn't byte-for-byte the one its ETag was computed for,
+# so its ETag goes out weak (W/"..."), as nginx does. If-None-Match is
+# compared weakly, so the client's next request still gets a 304.
+
+MINIMUM_SIZE = 1024  # Smaller bodies gain too little to be worth the CPU and the extra headers
+
+# MessagePack repeats keys as JSON does, so it compresses about as well
+COMPRESSIBLE = {'application/json', 'application/msgpack', 'application/x-msgpack', 'application/javascript',
+                'application/xml', 'image/svg+xml'}
+
+# Preferred first when the client accepts several equally
+PREFERENCE = ['zstd', 'br', 'gzip']
+
+# Levels when compressing each response as it goes out, and when compressing a body once to keep
+STREAM_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+STORED_LEVELS = {'zstd': 12, 'br': 9, 'gzip': 9}
+
+
+class _Gzip:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        # Flushed every chunk, so what the app has produced reaches the client
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+CODECS = {'gzip': _Gzip}
+if brotli is not None:
+    CODECS['br'] = _Brotli
+if zstandard is not None:
+    CODECS['zstd'] = _Zstd
+
+
+def negotiate(accept_encoding, available=CODECS):
+    """The coding of `available` the Accept-Encoding header value prefers, or None for an uncompressed body."""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    identity = accepted['identity'] if 'identity' in accepted or '*' not in accepted else accepted['*']
+    best = max((coding for coding in PREFERENCE if coding in available and accepted[coding] > 0),
+               key=lambda coding: accepted[coding], default=None)
+    # A client that prefers identity gets it; one that refuses it outright gets whatever it takes
+    if best is None or accepted[best] < identity:
+        return None
+    return best
+
+
+def compressible(mimetype):
+    return mimetype in COMPRESSIBLE or mimetype.startswith('text/') or mimetype.endswith('+json')
+
+
+def compress(data, coding):
+    """`data` compressed whole with `coding`, at the level for bodies compressed once to keep."""
+    compressor = CODECS[coding](STORED_LEVELS[coding])
+    return compressor.compress(data) + compressor.finish()
+
+
+def precompress(data):
+    """{coding: `data` compressed with it} for every available coding, or {} if `data` is too small to bother."""
+    if len(data) < MINIMUM_SIZE:
+        return {}
+    return {coding: compress(data, coding) for coding in CODECS}
+
+
+def weak_etag(value):
+    return value if value.startswith('W/') else 'W/' + value
+
+
+def add_vary(headers, field='Accept-Encoding'):
+    """Add `field` to the Vary header in a WSGI header list."""
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if field.lower() not in (v.strip().lower() for v in value.split(',')):
+                headers[i] = (name, f'{value}, {field}')
+            return
+    headers.append(('Vary', field))
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE, levels=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**STREAM_LEVELS, **(levels or {})}
+
+    def __call__(self, environ, start_response):
+        coding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        started = []  # [status, headers, exc_info] once the app calls start_response
+        written = []  # Body written through start_response's write(), which few apps use
+
+        def capture(status, headers, exc_info=None):
+            started[:] = [status, headers, exc_info]
+            return written.append
+
+        body = self.app(environ, capture)
+        chunks = iter(body)
+        buffered = list(written)
+        if not started:  # Apps may call start_response on the first iteration
+            buffered.extend(islice(chunks, 1))
+        status, headers, exc_info = started
+
+        if not self._compressible(status, headers):
+            start_response(status, headers, exc_info)
+            if not buffered:
+                return body
+            return _chain(buffered, chunks, body)
+
+        # Streamed bodies don't say how long they are; read until there is enough to be worth compressing
+        size = sum(len(chunk) for chunk in buffered)
+        while size < self.minimum_size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buffered.append(chunk)
+            size += len(chunk)
+        if size < self.minimum_size:
+            start_response(status, headers, exc_info)
+            return _chain(buffered, chunks, body)
+
+        headers = [(name, weak_etag(value) if name.lower() == 'etag' else value)
+                   for name, value in headers if name.lower() != 'content-length']
+        headers.append(('Content-Encoding', coding))
+        add_vary(headers)
+        start_response(status, headers, exc_info)
+        return self._compressed(CODECS[coding](self.levels[coding]), _chain(buffered, chunks, body))
+
+    def _compressible(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        values = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in values or 'no-transform' in values.get('cache-control', ''):
+            return False
+        if not compressible(parse_options_header(values.get('content-type', ''))[0]):
+            return False
+        length = values.get('content-length')
+        return length is None or int(length) >= self.minimum_size
+
+    @staticmethod
+    def _compressed(compressor, chunks):
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+
+
+def _chain(buffered, chunks, body):
+    """Iterate over `buffered` then the rest of `chunks`, closing the app's `body` at the end, as WSGI requires."""
+    try:
+        yield from buffered
+        yield from chunks
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
@@ -0,0 +1,253 @@
+import hashlib
+import struct
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from sqlalchemy import and_, bindparam, delete, event, inspect, or_, select, update
+
+import search
+import storage
+
+# Near-duplicate listings: sellers re-upload the same property with small
+# edits, so each listing is checked against the rest as it is saved.
+#
+# A listing's text (name, address and description) is reduced to a MinHash
+# signature of its word 3-grams, one-permutation style: every 3-gram is
+# hashed once into one of SIGNATURE_SIZE bins and each bin keeps its
+# smallest hash, so signing costs one hash per 3-gram rather than one per
+# 3-gram per bin. The share of bins on which two signatures agree estimates
+# how much of their text the listings share (Jaccard similarity). Its photos
+# are compared by the perceptual hashes the photo worker computes (see
+# jobs.py); near-identical photos differ in a few of the 64 bits.
+#
+# Candidates come from locality-sensitive hashing rather than comparing with
+# every listing: the signature is cut into bands, each photo hash into
+# 16-bit pieces, and every band is a bucket in the duplicate_bucket table. A
+# listing is a candidate when it shares a bucket, which texts alike enough
+# to matter almost always do, and photos within 3 bits always do. Only the
+# candidates sharing the most buckets are compared in full.
+#
+# A listing found to duplicate another gets duplicate_of_id set to the
+# original (the earlier listing it copies, or that listing's own original).
+# Texts are checked as a flush writes them; photos once the worker has
+# hashed them, when the worker calls check_photos.
+
+SIGNATURE_SIZE = 64  # Bins of the MinHash signature, each a 32-bit hash
+BAND_SIZE = 3  # Bins per LSH band: texts 60% alike share one of the 21 bands 99 times in 100
+TEXT_BANDS = SIGNATURE_SIZE // BAND_SIZE
+PHOTO_PIECES = 4  # 16-bit pieces per photo hash, bucketed as bands TEXT_BANDS and up
+SHINGLE_WORDS = 3
+MIN_WORDS = 12  # Shorter texts are too alike by chance ("2 BHK flat in Pune") to compare
+
+TEXT_SIMILARITY = 0.6  # Estimated Jaccard similarity from which texts are duplicates; 5 words changed in 60 leave ~0.63
+PHOTO_DISTANCE = 6  # Differing bits up to which two photo hashes are the same photo
+PHOTO_SHARE = 0.5  # Share of a listing's photos that must appear in the other listing
+MAX_CANDIDATES = 50  # Compared in full per check
+
+WATCHED = ('name', 'address', 'description')
+
+EMPTY_BIN = 0xffffffff
+DENSIFY_STEP = 0x9e3779b1  # Odd, so the offsets of the bins before a full one all differ
+
+
+def _hash(data, size=8):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=size).digest(), 'big')
+
+
+def signature(name, address, description):
+    """The MinHash signature of a listing's text as bytes, or None if the text is too short to sign."""
+    words = search.search_words(' '.join(filter(None, (name, address, description))))
+    if len(words) < MIN_WORDS:
+        return None
+    bins = [EMPTY_BIN] * SIGNATURE_SIZE
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        value = _hash(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+        index, value = value % SIGNATURE_SIZE, value >> 32
+        if value < bins[index]:
+            bins[index] = value
+    # Fill each empty bin from the next full one, offset by the distance, so listings agree on it only by agreeing there
+    filled = [value != EMPTY_BIN for value in bins]
+    full = distance = None
+    for index in reversed(range(2 * SIGNATURE_SIZE)):  # Twice round, so the last bins see the first
+        index %= SIGNATURE_SIZE
+        if filled[index]:
+            full, distance = bins[index], 0
+        elif full is not None:
+            distance += 1
+            bins[index] = (full + distance * DENSIFY_STEP) & EMPTY_BIN
+    return struct.pack(f'>{SIGNATURE_SIZE}I', *bins)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the texts with signatures `a` and `b`, from 0 to 1."""
+    a, b = struct.unpack(f'>{SIGNATURE_SIZE}I', a), struct.unpack(f'>{SIGNATURE_SIZE}I', b)
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+@lru_cache(maxsize=1024)
+def text_buckets(sig):
+    """The (band, bucket) keys of a signature."""
+    size = BAND_SIZE * 4
+    # Buckets are signed 64-bit so they fit a BIGINT
+    return tuple((band, _hash(sig[band * size:(band + 1) * size]) - (1 << 63)) for band in range(TEXT_BANDS))
+
+
+def photo_buckets(phashes):
+    """The (band, bucket) keys of photo hashes (ints)."""
+    return list(dict.fromkeys(
+        (TEXT_BANDS + piece, (phash >> 16 * piece) & 0xffff) for phash in phashes for piece in range(PHOTO_PIECES)
+    ))
+
+
+def same_photo(a, b):
+    return bin(a ^ b).count('1') <= PHOTO_DISTANCE
+
+
+class DuplicateIndex:
+    def __init__(self, table, listings, photos):
+        """`table` is the duplicate_bucket table; `listings` and `photos` the property and property_image tables."""
+        self.table = table
+        self.listings = listings
+        self.photos = photos
+        self.lookups = {}  # Key count -> statement, see _lookup
+
+    def _lookup(self, count):
+        """SELECT of the listings in any of `count` (band, bucket) keys, bound as band_<i> and bucket_<i>.
+
+        Spelled out as ORs, which SQLite looks up key by key where it would scan for a (band, bucket) IN,
+        and built once per key count, which takes longer than running it.
+        """
+        if count not in self.lookups:
+            buckets = self.table.c
+            self.lookups[count] = select(buckets.property_id).where(or_(*(
+                and_(buckets.band == bindparam(f'band_{i}'), buckets.bucket == bindparam(f'bucket_{i}'))
+                for i in range(count)
+            )))
+        return self.lookups[count]
+
+    def _phashes(self, connection, property_ids):
+        """{property id: [photo hash]} of the listings' hashed photos."""
+        photos = self.photos.c
+        rows = connection.execute(select(photos.property_id, photos.phash)
+                                  .where(photos.property_id.in_(property_ids), photos.phash.isnot(None))).all()
+        phashes = defaultdict(list)
+        for property_id, phash in rows:
+            phashes[property_id].append(int(phash, 16))
+        return phashes
+
+    def original(self, connection, property_id, sig, phashes=(), pending=None):
+        """The id of the listing that one with signature `sig` (or None) and photo hashes `phashes` duplicates, or None.
+
+        `property_id` is the listing's own id, None for a new one. `pending` optionally maps
+        (band, bucket) keys to [(property id, signature, original's id)] of listings not in the table yet.
+        """
+        keys = [*(text_buckets(sig) if sig else ()), *photo_buckets(phashes)]
+        if not keys:
+            return None
+        # Counted here rather than with GROUP BY, which SQLite would answer by scanning the property_id index
+        shared = Counter(connection.scalars(self._lookup(len(keys)), {
+            f'{name}_{i}': value for i, key in enumerate(keys) for name, value in zip(('band', 'bucket'), key)
+        }))
+        shared.pop(property_id, None)
+
+        listings = self.listings.c
+        candidates = {}  # Id -> (signature, original's id or None)
+        ids = [id for id, _ in shared.most_common(MAX_CANDIDATES)]
+        for id, minhash, duplicate_of in connection.execute(
+                select(listings.id, listings.minhash, listings.duplicate_of_id).where(listings.id.in_(ids))):
+            candidates[id] = (minhash, duplicate_of)
+        for key in keys:
+            for id, minhash, duplicate_of in (pending or {}).get(key, ()):
+                candidates.setdefault(id, (minhash, duplicate_of))
+        candidate_phashes = self._phashes(connection, ids) if phashes else {}
+
+        best = None
+        for id, (minhash, duplicate_of) in candidates.items():
+            original = duplicate_of or id
+            if original == property_id:
+                continue
+            text = similarity(sig, minhash) if sig and minhash else 0.0
+            photos = (sum(any(same_photo(mine, theirs) for theirs in candidate_phashes.get(id, ()))
+                          for mine in phashes) / len(phashes)) if phashes else 0.0
+            if text < TEXT_SIMILARITY and photos < PHOTO_SHARE:
+                continue
+            score = max(text, photos)
+            if best is None or (score, -original) > best:
+                best = (score, -original)
+        return None if best is None else -best[1]
+
+    def _replace_buckets(self, connection, property_id, keys, photos=False):
+        """Make `keys` the listing's text buckets, or with `photos` its photo buckets."""
+        buckets = self.table.c
+        connection.execute(delete(self.table).where(
+            buckets.property_id == property_id,
+            buckets.band >= TEXT_BANDS if photos else buckets.band < TEXT_BANDS,
+        ))
+        if keys:
+            connection.execute(self.table.insert(),
+                               [{'band': band, 'bucket': bucket, 'property_id': property_id} for band, bucket in keys])
+
+    def check_photos(self, connection, property_id):
+        """Bucket a listing's photo hashes and re-check it now they are known; for the photo worker."""
+        listings = self.listings.c
+        row = connection.execute(select(listings.minhash).where(listings.id == property_id)).first()
+        if row is None:
+            return
+        phashes = self._phashes(connection, [property_id]).get(property_id, [])
+        self._replace_buckets(connection, property_id, photo_buckets(phashes), photos=True)
+        connection.execute(update(self.listings).where(listings.id == property_id)
+                           .values(duplicate_of_id=self.original(connection, property_id, row.minhash, phashes)))
+
+    def add_many(self, connection, listings):
+        """Sign, bucket and check `listings` (dicts with id, name, address and description), for bulk loads.
+
+        Each listing is checked against the table and the listings before it.
+        """
+        pending = defaultdict(list)
+        updates, inserts = [], []
+        for listing in listings:
+            sig = signature(listing['name'], listing['address'], listing['description'])
+            original = self.original(connection, listing['id'], sig, pending=pending) if sig else None
+            updates.append({'listing_id': listing['id'], 'minhash': sig, 'duplicate_of_id': original})
+            if sig:
+                for key in text_buckets(sig):
+                    pending[key].append((listing['id'], sig, original))
+                    inserts.append({'band': key[0], 'bucket': key[1], 'property_id': listing['id']})
+        if updates:
+            connection.execute(update(self.listings).where(self.listings.c.id == bindparam('listing_id'))
+                               .values(minhash=bindparam('minhash'), duplicate_of_id=bindparam('duplicate_of_id')),
+                               updates)
+        storage.bulk_insert(connection, self.table, inserts)
+
+    def maintain_on_flush(self, session, model):
+        """Sign and check `model` rows as flushes write their text, and bucket them."""
+        @event.listens_for(session, 'before_flush')
+        def _before_flush(session, flush_context, instances):
+            signed = [obj for obj in session.new if isinstance(obj, model)]
+            signed += [obj for obj in session.dirty if isinstance(obj, model) and obj not in session.deleted
+                       and any(inspect(obj).attrs[name].history.has_changes() for name in WATCHED)]
+            if not signed:
+                return
+            connection = storage.primary_connection(session)
+            for obj in signed:
+                obj.minhash = signature(obj.name, obj.address, obj.description)
+                phashes = self._phashes(connection, [obj.id]).get(obj.id, []) if obj.id else []
+                obj.duplicate_of_id = self.original(connection, obj.id, obj.minhash, phashes)
+            session.info.setdefault('duplicates_signed', []).extend(signed)
+
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            connection = None
+            for obj in session.info.pop('duplicates_signed', ()):
+                connection = connection or storage.primary_connection(session)
+                self._replace_buckets(connection, obj.id, text_buckets(obj.minhash) if obj.minhash else [])
+            deleted = [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, model)]
+            if deleted:
+                connection = connection or storage.primary_connection(session)
+                connection.execute(delete(self.table).where(self.table.c.property_id.in_(deleted)))
+                connection.execute(update(self.listings).where(self.listings.c.duplicate_of_id.in_(deleted))
+                                   .values(duplicate_of_id=None))
+
+        @event.listens_for(session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop('duplicates_signed', None)
@@ -0,0 +1,203 @@
+import re
+import threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from sqlalchemy import DDL, event, select, text
+
+import search
+
+# Typo-tolerant search over the full-text index.
+#
+# Each process keeps a trigram index of the full-text vocabulary (the
+# distinct words of every listing's name, location, address and
+# description), so "bangalor" or "andehri" can be matched to the words that
+# are actually indexed without touching the property table. Every query word
+# is widened to its spellings: the word itself, its aliases from the
+# search_alias table ("bengaluru" <-> "bangalore") and the most similar
+# vocabulary words. The full-text index then retrieves listings matching any
+# spelling of every word, and the best of those are re-ranked by how closely
+# their name, location and address resemble what was typed.
+#
+# The vocabulary is reloaded after any process commits a listing or alias
+# change, which the shared change count tells (see changes.py). One request
+# reloads it while the others go on spelling from the previous one.
+
+# Lists the FTS table's terms; its name falls under search.is_fts_table, so autogenerate skips it
+VOCAB_TABLE = f'{search.FTS_TABLE}_vocab'
+CREATE_VOCAB = f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({search.FTS_TABLE}, row)"
+SQLITE_VOCABULARY = text(f"SELECT term, doc FROM {VOCAB_TABLE}")
+POSTGRES_VOCABULARY = text(f"SELECT word, ndoc FROM ts_stat('SELECT {search.TSVECTOR_COLUMN} FROM property')")
+
+SIMILARITY_THRESHOLD = 0.3  # pg_trgm's default
+ONE_EDIT_SIMILARITY = 0.5  # Credited to words one typo away, which short words rarely reach by trigrams
+MAX_SPELLINGS = 4  # Similar vocabulary words tried per query word
+MIN_WORD_LENGTH = 3  # Shorter words share too few trigrams to compare; they match only as typed
+CANDIDATES = 200  # Best full-text matches re-ranked per query
+
+# How much a match in each field counts when re-ranking
+FIELD_WEIGHTS = {'name': 1.0, 'location': 0.9, 'address': 0.6}
+
+# Seeded into search_alias: (alias, canonical), both single lowercase words
+DEFAULT_ALIASES = [
+    ('bengaluru', 'bangalore'), ('bombay', 'mumbai'), ('gurugram', 'gurgaon'), ('madras', 'chennai'),
+    ('calcutta', 'kolkata'), ('poona', 'pune'), ('cochin', 'kochi'), ('baroda', 'vadodara'),
+    ('mysuru', 'mysore'), ('mangaluru', 'mangalore'), ('belagavi', 'belgaum'), ('trivandrum', 'thiruvananthapuram'),
+    ('prayagraj', 'allahabad'), ('vizag', 'visakhapatnam'),
+    ('w', 'west'), ('e', 'east'), ('n', 'north'), ('s', 'south'),
+    ('rd', 'road'), ('st', 'street'), ('apt', 'apartment'), ('apts', 'apartments'), ('sec', 'sector'),
+]
+
+
+@lru_cache(maxsize=65536)
+def trigrams(word):
+    """The word's trigrams, padded as pg_trgm does: "mumbai" -> {"  m", " mu", "mum", ..., "ai "}."""
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a, b):
+    """Shared trigrams over all trigrams of the two words, from 0 to 1 (pg_trgm's similarity())."""
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    shared = len(grams_a & grams_b)
+    return shared / (len(grams_a) + len(grams_b) - shared)
+
+
+def one_edit_apart(a, b):
+    """True if inserting, deleting or replacing a letter, or swapping two adjacent ones, turns `a` into `b`."""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2]
+                                      and a[i + 2:] == b[i + 2:])
+
+
+class Spelling:
+    """A query word with the other words it may stand for."""
+
+    def __init__(self, word, aliases=(), similar=None):
+        self.word = word
+        self.aliases = set(aliases)
+        self.similar = similar or {}  # Vocabulary word -> its similarity to `word`
+
+    def alternatives(self):
+        """Every spelling, for search.matching and search.ranked."""
+        return [self.word, *sorted(self.aliases), *(term for term in self.similar if term not in self.aliases)]
+
+    def match(self, token):
+        """How well an indexed word matches, from 0 to 1; prefixes and aliases match fully."""
+        if token.startswith(self.word) or token in self.aliases:
+            return 1.0
+        return self.similar.get(token) or similarity(self.word, token)
+
+
+class Vocabulary:
+    def __init__(self, terms, aliases):
+        """`terms` is an iterable of (word, listings using it); `aliases` of (alias, canonical)."""
+        self.terms = []  # Term id -> (word, trigram count, listings using it)
+        self.postings = defaultdict(list)  # Trigram -> ids of the terms containing it
+        for term, listings in terms:
+            # Numbers and hyphenated or dotted tokens can't be spelled wrong usefully, nor quoted safely
+            if len(term) < MIN_WORD_LENGTH or not re.fullmatch(r'[^\W\d_]+', term):
+                continue
+            term_id = len(self.terms)
+            grams = trigrams(term)
+            self.terms.append((term, len(grams), listings))
+            for gram in grams:
+                self.postings[gram].append(term_id)
+
+        self.aliases = defaultdict(set)  # Either way round: "bengaluru" <-> "bangalore"
+        for alias, canonical in aliases:
+            alias, canonical = alias.casefold(), canonical.casefold()
+            self.aliases[alias].add(canonical)
+            self.aliases[canonical].add(alias)
+
+    def similar(self, word, limit=MAX_SPELLINGS, threshold=SIMILARITY_THRESHOLD):
+        """Up to `limit` vocabulary words like `word`, as {word: similarity}, most similar (then most used) first.
+
+        A word is like `word` when they are at least `threshold` similar or one typo apart.
+        """
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = []
+        for term_id, count in shared.items():
+            term, size, listings = self.terms[term_id]
+            score = count / (len(grams) + size - count)
+            # A typo changes at most 4 trigrams (a swap), which bounds what a word one typo away still shares
+            if score < ONE_EDIT_SIMILARITY and count >= len(grams) - 4 and one_edit_apart(word, term):
+                score = ONE_EDIT_SIMILARITY
+            if score >= threshold and term != word:
+                scored.append((score, listings, term))
+        scored.sort(reverse=True)
+        return {term: score for score, _, term in scored[:limit]}
+
+    def spell(self, word):
+        return Spelling(word, self.aliases.get(word, ()),
+                        self.similar(word) if len(word) >= MIN_WORD_LENGTH else None)
+
+
+class FuzzyIndex:
+    def __init__(self, alias_table, counter):
+        """`counter` is the changes.ChangeCounter bumped by every listing and alias change."""
+        self.aliases = alias_table
+        self.counter = counter
+        self.vocabulary = None
+        self.built_at = None  # The change count the vocabulary reflects; None when out of date
+        self.lock = threading.Lock()
+
+    def _current(self, count):
+        return self.vocabulary is not None and self.built_at is not None and self.built_at >= count
+
+    def _vocabulary(self, connection):
+        # Read before the terms, so the terms are at least as recent as the count they are marked with
+        count = self.counter.current(connection)
+        vocabulary = self.vocabulary
+        if self._current(count):
+            return vocabulary
+        # One request reloads; the rest keep spelling from the old vocabulary meanwhile
+        if not self.lock.acquire(blocking=vocabulary is None):
+            return vocabulary
+        try:
+            if not self._current(count):  # Else reloaded while this request waited
+                statement = POSTGRES_VOCABULARY if connection.dialect.name == 'postgresql' else SQLITE_VOCABULARY
+                terms = connection.execute(statement).all()
+                aliases = connection.execute(select(self.aliases.c.alias, self.aliases.c.canonical)).all()
+                self.vocabulary, self.built_at = Vocabulary(terms, aliases), count
+            return self.vocabulary
+        finally:
+            self.lock.release()
+
+    def spell(self, connection, words):
+        """A Spelling for each of the query `words`."""
+        vocabulary = self._vocabulary(connection)
+        return [vocabulary.spell(word) for word in words]
+
+    def invalidate(self):
+        """Reload on the next query, which meanwhile may still be spelled from the current vocabulary."""
+        self.built_at = None
+
+
+def score(spellings, fields):
+    """How well a listing matches, from 0 to 1: each query word's best weighted match in `fields` ({name: text}), averaged."""
+    tokens = [(FIELD_WEIGHTS[name], search.search_words(value or '')) for name, value in fields.items()]
+    return sum(
+        max((weight * spelling.match(token) for weight, words in tokens for token in words), default=0.0)
+        for spelling in spellings
+    ) / len(spellings)
+
+
+def register(model, alias_table):
+    """Create the vocabulary table alongside the model's FTS table, and seed the aliases."""
+    event.listen(model.__table__, 'after_create', DDL(CREATE_VOCAB).execute_if(dialect='sqlite'))
+
+    @event.listens_for(alias_table, 'after_create')
+    def _seed(target, connection, **kw):
+        connection.execute(target.insert(), [{'alias': a, 'canonical': c} for a, c in DEFAULT_ALIASES])
@@ -0,0 +1,169 @@
+import math
+
+from sqlalchemy import DDL, event, func, text, table, column
+
+# Spatial index over Property coordinates.
+#
+# SQLite: an R*Tree table whose id is the property id, holding each listing's
+# point as a zero-size box and kept in sync by ORM events like the FTS table.
+# PostgreSQL: a GiST index on point(longitude, latitude), so no PostGIS needed.
+# Either way a query first cuts the candidates down to a bounding box through
+# the index, and only the rows inside it are ranked by distance.
+
+RTREE_TABLE = 'property_rtree'
+POINT_INDEX = 'ix_property_point'
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CREATE_RTREE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+    f"USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+)
+POPULATE_RTREE = (
+    f"INSERT INTO {RTREE_TABLE} SELECT id, latitude, latitude, longitude, longitude "
+    f"FROM property WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+)
+CREATE_POINT_INDEX = f"CREATE INDEX IF NOT EXISTS {POINT_INDEX} ON property USING gist (point(longitude, latitude))"
+
+INSERT_ROW = text(f"INSERT INTO {RTREE_TABLE} VALUES (:id, :lat, :lat, :lng, :lng)")
+DELETE_ROW = text(f"DELETE FROM {RTREE_TABLE} WHERE id = :id")
+
+rtree = table(RTREE_TABLE, column('id'), column('min_lat'), column('max_lat'), column('min_lng'), column('max_lng'))
+
+
+def is_rtree_table(name):
+    """True for the R*Tree table and the shadow tables SQLite creates for it."""
+    return name == RTREE_TABLE or name.startswith(RTREE_TABLE + '_')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic hook keeping autogenerate away from the spatial structures it doesn't model."""
+    if type_ == 'table':
+        return not is_rtree_table(name)
+    if type_ == 'index':
+        return name != POINT_INDEX
+    return True
+
+
+def coordinates(latitude, longitude):
+    """Validate a latitude/longitude pair; both None means no location. Raises ValueError."""
+    if latitude is None and longitude is None:
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must both be given as numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("latitude must be within ±90 and longitude within ±180")
+    return latitude, longitude
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, west, north, east) of a box containing every point within `radius_km`."""
+    lat_span = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - lat_span, -90.0), min(latitude + lat_span, 90.0)
+    # Degrees of longitude shrink towards the poles; near one, take the whole parallel
+    widest = max(abs(south), abs(north))
+    if widest >= 90 or radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest))) >= 180:
+        return south, -180.0, north, 180.0
+    lng_span = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    return south, max(longitude - lng_span, -180.0), north, min(longitude + lng_span, 180.0)
+
+
+def within(model, dialect, box):
+    """Clauses restricting `model` to points inside `box`, with the spatial index doing the cut."""
+    south, west, north, east = box
+    exact = [model.latitude.between(south, north), model.longitude.between(west, east)]
+    if dialect == 'sqlite':
+        candidates = (rtree.select().with_only_columns(rtree.c.id)
+                      .where(rtree.c.max_lat >= south, rtree.c.min_lat <= north,
+                             rtree.c.max_lng >= west, rtree.c.min_lng <= east))
+        return [model.id.in_(candidates), *exact]
+    if dialect == 'postgresql':
+        area = func.box(func.point(west, south), func.point(east, north))
+        return [func.point(model.longitude, model.latitude).op('<@')(area), *exact]
+    return exact
+
+
+def distance_key(model, latitude, longitude):
+    """Squared distance in km² from (latitude, longitude), as plain SQL arithmetic.
+
+    An equirectangular approximation: within the few hundred km a radius
+    query covers, it orders listings as the great-circle distance does. It is
+    off by up to a few hundred metres there, so radius checks use distance_km.
+    """
+    lng_scale = KM_PER_DEGREE * math.cos(math.radians(latitude))
+    dlat = (model.latitude - latitude) * KM_PER_DEGREE
+    dlng = (model.longitude - longitude) * lng_scale
+    return (dlat * dlat + dlng * dlng).label('distance')
+
+
+def distance_km(model, dialect, latitude, longitude):
+    """Great-circle (haversine) distance in km from (latitude, longitude), in SQL.
+
+    SQLite builds don't all have trigonometry, so there it calls the
+    haversine_km() function install() gives each connection.
+    """
+    if dialect == 'sqlite':
+        return func.haversine_km(latitude, longitude, model.latitude, model.longitude)
+    lat1, lat2 = math.radians(latitude), func.radians(model.latitude)
+    a = (func.power(func.sin((lat2 - lat1) / 2), 2)
+         + math.cos(lat1) * func.cos(lat2) * func.power(func.sin(func.radians(model.longitude - longitude) / 2), 2))
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    if None in (lat1, lng1, lat2, lng2):
+        return None  # As SQL arithmetic on NULL would
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _add_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function('haversine_km', 4, haversine_km, deterministic=True)
+
+
+def install(db):
+    """Give each SQLite engine's connections the haversine_km() SQL function. Call before anything connects."""
+    for engine in db.engines.values():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _add_functions)
+
+
+def rebuild(connection):
+    """Re-index every property, for writes that bypassed the ORM (bulk loads)."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DELETE FROM {RTREE_TABLE}"))
+        connection.execute(text(POPULATE_RTREE))
+
+
+def _index_row(connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        connection.execute(INSERT_ROW, {'id': target.id, 'lat': target.latitude, 'lng': target.longitude})
+
+
+def _after_insert(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _index_row(connection, target)
+
+
+def _after_update(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DELETE_ROW, {'id': target.id})
+        _index_row(connection, target)
+
+
+def _after_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DELETE_ROW, {'id': target.id})
+
+
+def register(model):
+    """Create the spatial index alongside the model's table and keep it in step with writes."""
+    event.listen(model.__table__, 'after_create', DDL(CREATE_RTREE).execute_if(dialect='sqlite'))
+    event.listen(model.__table__, 'after_create', DDL(CREATE_POINT_INDEX).execute_if(dialect='postgresql'))
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+    event.listen(model, 'after_delete', _after_delete)
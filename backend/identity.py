@@ -0,0 +1,123 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, request
+from sqlalchemy import event
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from serializers import respond
+
+# Short-lived signed session tokens, issued at login and sent back as
+# `Authorization: Bearer <token>`. A before_request hook verifies the token
+# once and puts the caller's identity on `g.identity`, so endpoints neither
+# trust ids in request bodies nor look the buyer/seller up again. A missing,
+# bad or expired token makes the caller anonymous; only login_required
+# endpoints turn that into a 401. A token that is still valid can be swapped
+# for a fresh one, so an active session outlives `max_age`.
+
+Identity = namedtuple('Identity', ['role', 'id', 'name'])
+
+
+class SessionTokens:
+    def __init__(self, secret_key, max_age=3600):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='terralink-session')
+        self.max_age = max_age
+
+    def issue(self, role, user_id):
+        return self.serializer.dumps([role, user_id])
+
+    def load(self, token):
+        """Return (role, user_id); raises BadSignature (or SignatureExpired) for a bad token."""
+        role, user_id = self.serializer.loads(token, max_age=self.max_age)
+        return role, user_id
+
+
+class IdentityCache:
+    """Bounded LRU of (role, id) -> Identity, each entry trusted for `ttl` seconds."""
+
+    def __init__(self, loader, max_entries=4096, ttl=300, clock=time.monotonic):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # (role, id) -> (Identity, loaded at)
+        self.lock = threading.Lock()
+
+    def get(self, role, user_id):
+        key = (role, user_id)
+        now = self.clock()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.entries.move_to_end(key)
+                return cached[0]
+
+        identity = self.loader(role, user_id)
+        if identity is not None:
+            with self.lock:
+                self.entries[key] = (identity, now)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return identity
+
+    def forget(self, role, user_id):
+        with self.lock:
+            self.entries.pop((role, user_id), None)
+
+    def forget_on_flush(self, session, models):
+        """Forget users once a commit changes or deletes them; `models` maps each role to its model."""
+        roles = {model: role for role, model in models.items()}
+
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            changed = session.info.setdefault('identities_changed', set())
+            for obj in session.dirty | session.deleted:
+                role = roles.get(type(obj))
+                if role is not None:
+                    changed.add((role, obj.id))
+
+        @event.listens_for(session, 'after_commit')
+        def _after_commit(session):
+            for role, user_id in session.info.pop('identities_changed', ()):
+                self.forget(role, user_id)
+
+        @event.listens_for(session, 'after_rollback')
+        def _after_rollback(session):
+            session.info.pop('identities_changed', None)
+
+
+def init_app(app, tokens, identities):
+    @app.before_request
+    def authenticate():
+        g.identity, g.login_error = None, "Login required"
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return
+        try:
+            role, user_id = tokens.load(header[len('Bearer '):])
+        except SignatureExpired:
+            g.login_error = "Session expired"
+            return
+        except (BadSignature, ValueError, TypeError):
+            g.login_error = "Invalid session token"
+            return
+        g.identity = identities.get(role, user_id)
+        if g.identity is None:
+            g.login_error = "Unknown user"
+
+
+def login_required(role=None):
+    """Reject the request unless it carries a valid session for a `role` user, or any user when `role` is None."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if g.get('identity') is None:
+                return respond({"error": g.get('login_error', "Login required")}), 401
+            if role is not None and g.identity.role != role:
+                return respond({"error": f"Only a {role} can do this"}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,318 @@
+import hashlib
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+from PIL import ExifTags, Image, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+
+# Content-addressed store for listing photos on local disk.
+#
+# Uploads stream from Werkzeug's multipart parser straight into a temporary
+# file inside the store, hashed as they arrive, so no image is ever held in
+# memory whole. A finished file is renamed to its SHA-256 digest, which
+# makes the rename atomic against concurrent uploads and keeps an image
+# uploaded twice (a retried upload, one photo on two listings) only once.
+# Stored files never change, so they can be served with permanent caching.
+#
+# Pages don't show originals: each image is also served scaled down to the
+# widths the pages use, re-encoded as WebP. A size is made the first time it
+# is requested and kept in an on-disk cache of bounded size; the least
+# recently used derivatives are deleted once it fills up.
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGES = 10  # Per request, as many as one listing takes
+# Werkzeug holds non-file fields, and the parser's read-ahead, to this in memory (Flask's default)
+MAX_FORM_BYTES = 500 * 1000
+
+INCOMING = 'incoming'  # Temporary files still being received
+
+# Leading bytes of each accepted format, and the extension it is stored under
+SIGNATURES = [
+    (re.compile(rb'\xff\xd8\xff'), 'jpg'),
+    (re.compile(rb'\x89PNG\r\n\x1a\n'), 'png'),
+    (re.compile(rb'GIF8[79]a'), 'gif'),
+    (re.compile(rb'RIFF....WEBP', re.DOTALL), 'webp'),
+]
+HEAD_BYTES = 12
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+# A stored image's name: its digest and extension
+NAME = re.compile(r'(?P<digest>[0-9a-f]{64})\.(?P<extension>jpg|png|gif|webp)')
+
+# Derivative widths in pixels; heights keep the aspect ratio, and nothing is scaled up.
+# URLs of derivatives are cached forever, so a changed width needs a new variant name.
+VARIANTS = {'thumb': 160, 'card': 480, 'detail': 1280}
+DERIVATIVE_QUALITY = 80
+DERIVATIVE_CONTENT_TYPE = 'image/webp'
+
+DERIVATIVES = 'derivatives'  # Directory of the derivative cache, in the store
+MAX_DERIVATIVE_BYTES = 1024 * 1024 * 1024
+EVICT_TO = 0.9  # Eviction frees space down to this fraction of the limit
+RESCAN_INTERVAL = 300  # Seconds between recounts of the cache, which other processes also fill
+TOUCH_INTERVAL = 3600  # A hit marks a derivative recently used at most this often, as it costs a write
+
+# Perceptual hashes (pHash) keep the signs of the HASH_SIZE x HASH_SIZE lowest frequencies
+# of a HASH_SAMPLE x HASH_SAMPLE grayscale copy: 64 bits that survive resizing and re-encoding
+HASH_SIZE = 8
+HASH_SAMPLE = 32
+DCT_BASIS = [[math.cos(math.pi * (2 * x + 1) * u / (2 * HASH_SAMPLE)) for x in range(HASH_SAMPLE)]
+             for u in range(HASH_SIZE)]
+
+
+def image_type(head):
+    """The extension for a file starting with the bytes `head`, or None if it isn't an accepted image."""
+    for signature, extension in SIGNATURES:
+        if signature.match(head):
+            return extension
+    return None
+
+
+def perceptual_hash(image):
+    """The image's 64-bit pHash, as an int; visually similar images differ in few bits."""
+    sample = image.convert('L').resize((HASH_SAMPLE, HASH_SAMPLE), Image.Resampling.LANCZOS)
+    pixels = list(sample.getdata())
+    rows = [pixels[y * HASH_SAMPLE:(y + 1) * HASH_SAMPLE] for y in range(HASH_SAMPLE)]
+    # A 2-D DCT done as 1-D DCTs of the rows, then of the columns, keeping only the low frequencies
+    across = [[sum(c * p for c, p in zip(basis, row)) for basis in DCT_BASIS] for row in rows]
+    low = [sum(basis[y] * across[y][u] for y in range(HASH_SAMPLE)) for basis in DCT_BASIS for u in range(HASH_SIZE)]
+    median = sorted(low)[len(low) // 2]
+    return sum(1 << i for i, value in enumerate(low) if value > median)
+
+
+def describe(source):
+    """(width, height, perceptual hash) of the image file `source`, the size as displayed. Raises ValueError."""
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):  # Turned a quarter
+                width, height = height, width
+            image.draft(None, (HASH_SAMPLE, HASH_SAMPLE))  # The hash needs no more than this
+            return width, height, perceptual_hash(ImageOps.exif_transpose(image))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Image can't be decoded") from e
+
+
+def derive(source, width, destination):
+    """Write the image file `source` at most `width` pixels wide, as WebP, to the file object `destination`.
+
+    Raises ValueError if `source` can't be decoded.
+    """
+    try:
+        with Image.open(source) as image:
+            # A JPEG can decode straight to a fraction of its size; ask for no less than width x width,
+            # which covers the width whichever way the photo turns out to be rotated
+            image.draft(None, (width, width))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                transparent = 'A' in image.getbands() or 'transparency' in image.info
+                image = image.convert('RGBA' if transparent else 'RGB')
+            image.save(destination, 'WEBP', quality=DERIVATIVE_QUALITY)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Image can't be decoded") from e
+
+
+class Upload:
+    """A file being received: written to a temporary file, hashed on the way in."""
+
+    def __init__(self, directory, filename, limit):
+        self.filename = filename
+        self.limit = limit
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"{self.filename or 'An image'} is over {self.limit // (1024 * 1024)} MB")
+        if len(self.head) < HEAD_BYTES:
+            self.head += data[:HEAD_BYTES - len(self.head)]
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def discard(self):
+        """Delete the temporary file, unless the store has kept it."""
+        self.file.close()
+        try:
+            os.unlink(self.file.name)
+        except FileNotFoundError:
+            pass
+
+
+class ImageStore:
+    def __init__(self, root, base_url, max_image_bytes=MAX_IMAGE_BYTES, max_images=MAX_IMAGES):
+        self.root = root
+        self.base_url = base_url.rstrip('/')  # Public URL the images are served under
+        self.max_image_bytes = max_image_bytes
+        self.max_images = max_images
+        # Only URLs under base_url are ours: a listing may link a photo at /images/ on any other site
+        self.stored_url = re.compile(re.escape(self.base_url) + r'/(?P<name>[0-9a-f]{64}\.(?:jpg|png|gif|webp))')
+
+    def url(self, name):
+        """The public URL of the stored image `name`."""
+        return f'{self.base_url}/{name}'
+
+    def stored_name(self, url):
+        """The name of the stored image at `url`, or None for an image hosted elsewhere."""
+        match = self.stored_url.fullmatch(url)
+        return match['name'] if match else None
+
+    def variant_url(self, url, variant):
+        """The URL of `variant` of a stored image; images hosted elsewhere keep their own URL."""
+        return f'{url}/{variant}' if self.stored_name(url) else url
+
+    def path(self, name):
+        """Where the image called `name` is stored, or None if that isn't a stored image's name."""
+        if not NAME.fullmatch(name):
+            return None
+        return os.path.join(self.root, name[:2], name)
+
+    def receive(self, request):
+        """Store the files of a multipart/form-data `request`, returning their names in upload order.
+
+        Raises ValueError for a malformed body or a file that isn't a JPEG, PNG, GIF or WebP image,
+        and RequestEntityTooLarge past max_images files or max_image_bytes in one file.
+        """
+        incoming = os.path.join(self.root, INCOMING)
+        os.makedirs(incoming, exist_ok=True)
+        uploads = []
+
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            if len(uploads) == self.max_images:
+                raise RequestEntityTooLarge(f"At most {self.max_images} images can be uploaded at once")
+            uploads.append(Upload(incoming, filename, self.max_image_bytes))
+            return uploads[-1]
+
+        parser = FormDataParser(stream_factory, max_form_memory_size=MAX_FORM_BYTES,
+                                max_content_length=self.max_images * (self.max_image_bytes + MAX_FORM_BYTES),
+                                silent=False)
+        try:
+            _, _, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                       request.mimetype_params)
+            received = [file.stream for _, file in files.items(multi=True)]
+            extensions = [image_type(upload.head) for upload in received]
+            for upload, extension in zip(received, extensions):
+                if extension is None:
+                    raise ValueError(f"{upload.filename or 'A file'} is not a JPEG, PNG, GIF or WebP image")
+            return [self._keep(upload, extension) for upload, extension in zip(received, extensions)]
+        finally:
+            for upload in uploads:
+                upload.discard()
+
+    def _keep(self, upload, extension):
+        name = f'{upload.sha256.hexdigest()}.{extension}'
+        path = self.path(name)
+        if not os.path.exists(path):
+            # On disk before the rename, so a crash can't leave a stored name over partial content
+            upload.file.flush()
+            os.fsync(upload.file.fileno())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(upload.file.name, path)
+        return name
+
+
+class DerivativeCache:
+    def __init__(self, store, max_bytes=MAX_DERIVATIVE_BYTES, clock=time.time):
+        self.store = store
+        self.root = os.path.join(store.root, DERIVATIVES)
+        self.max_bytes = max_bytes
+        self.clock = clock  # Compared with file mtimes, so wall-clock time
+        self.size = None  # Bytes in the cache as last counted, plus what this process added since
+        self.counted_at = float('-inf')
+        self.lock = threading.Lock()  # Held while counting, evicting and registering a derivative being made
+        self.making = {}  # Path -> lock held while one request makes that derivative
+
+    def path(self, name, variant):
+        """Where `variant` of the stored image `name` is cached, or None for an unknown name or variant."""
+        if variant not in VARIANTS or not NAME.fullmatch(name):
+            return None
+        digest = name.split('.')[0]
+        return os.path.join(self.root, variant, digest[:2], f'{digest}.webp')
+
+    def get(self, name, variant):
+        """The path of `variant` of the stored image `name`, made now if it isn't cached; None if there is no such image.
+
+        Raises ValueError if the stored image can't be decoded.
+        """
+        path = self.path(name, variant)
+        if path is None:
+            return None
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return self._make(name, path, VARIANTS[variant])
+        if self.clock() - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except FileNotFoundError:  # Evicted meanwhile
+                return self._make(name, path, VARIANTS[variant])
+        return path
+
+    def _make(self, name, path, width):
+        source = self.store.path(name)
+        if not os.path.exists(source):
+            return None
+        with self.lock:
+            making = self.making.setdefault(path, threading.Lock())
+        # Concurrent requests for a new derivative wait for the first to make it
+        with making:
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='derive-', delete=False) as file:
+                        try:
+                            derive(source, width, file)
+                        except ValueError:
+                            file.close()
+                            os.unlink(file.name)
+                            raise
+                    os.replace(file.name, path)
+                    self._added(os.path.getsize(path))
+            finally:
+                with self.lock:
+                    self.making.pop(path, None)
+        return path
+
+    def _added(self, size):
+        with self.lock:
+            if self.size is not None and self.clock() - self.counted_at < RESCAN_INTERVAL:
+                self.size += size
+                if self.size <= self.max_bytes:
+                    return
+            self.size = self._evict()
+            self.counted_at = self.clock()
+
+    def _evict(self):
+        """Count the cache, and delete the least recently used derivatives if it is over the limit; returns its size."""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # Evicted by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(file_size for _, file_size, _ in files)
+        if size <= self.max_bytes:
+            return size
+        files.sort()
+        for _, file_size, path in files:
+            if size <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        return size
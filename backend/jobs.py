@@ -0,0 +1,187 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+from sqlalchemy import and_, case, or_, select, update
+
+import images
+
+# Background processing of listing photos, with the app database as the queue.
+#
+# /upload and /upload/update queue a job for the listing whose photos they
+# set, and return at once. `flask process-images` runs a worker that claims
+# queued jobs and hands each stored photo to a pool of processes, one per
+# core by default. A pool process makes the photo's derivatives (see
+# images.py) and measures its size and perceptual hash. As each photo
+# finishes, its row gets the results and the job's done count goes up; the
+# count is the progress sellers see.
+#
+# Several workers can share the queue on PostgreSQL, since a claim skips
+# jobs another worker has locked. A job whose worker died is claimed again
+# after STALE_AFTER seconds, and fails after MAX_ATTEMPTS claims. A job
+# queued again while it runs (the seller changed the photos) is left to the
+# next claim: the running worker's writes are matched on its claim time, so
+# they stop applying.
+#
+# A photo that kills its pool process (a decoder crash, running out of
+# memory) breaks the whole pool. Which photo did it is unknown, so every job
+# in flight is queued again, and the worker carries on with a new pool; a
+# job that keeps doing it fails after MAX_ATTEMPTS claims like any other.
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+POLL_INTERVAL = 1.0  # Seconds between looks at an empty queue
+STALE_AFTER = 600
+MAX_ATTEMPTS = 3
+BACKLOG_PER_PROCESS = 2  # Photos handed to the pool ahead of the one each process is on
+
+_derivatives = None  # The DerivativeCache of a pool process
+
+
+def _start(root, base_url):
+    global _derivatives
+    _derivatives = images.DerivativeCache(images.ImageStore(root, base_url))
+
+
+def process_photo(name):
+    """Make every derivative of the stored photo `name`, and return its (width, height, perceptual hash).
+
+    Runs in a pool process. Raises ValueError if the photo can't be decoded, and OSError if it can't be
+    read from or written to the store.
+    """
+    source = _derivatives.store.path(name)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"{name} is not in the image store")
+    for variant in images.VARIANTS:
+        _derivatives.get(name, variant)
+    return images.describe(source)
+
+
+class PhotoWorker:
+    def __init__(self, engine, jobs, photos, store, processes=None, on_finish=None, clock=time.time):
+        """`jobs` is the photo_job table and `photos` the property_image table, in the database `engine` holds.
+
+        `on_finish` is called with (connection, property id) in the transaction finishing a job.
+        """
+        self.engine = engine
+        self.jobs = jobs
+        self.photos = photos
+        self.store = store
+        self.processes = processes or os.cpu_count()
+        self.on_finish = on_finish
+        self.clock = clock
+
+    def claim(self):
+        """Mark the next job due as running; returns (job id, property id, claim time), or None if none is due."""
+        jobs = self.jobs.c
+        now = self.clock()
+        stale = and_(jobs.status == RUNNING, jobs.claimed_at < now - STALE_AFTER)
+        with self.engine.begin() as connection:
+            connection.execute(update(self.jobs).where(stale, jobs.attempts >= MAX_ATTEMPTS)
+                               .values(status=FAILED, error="Processing stopped before finishing"))
+            due = (select(jobs.id).where(or_(jobs.status == QUEUED, stale))
+                   .order_by(jobs.id).limit(1)
+                   .with_for_update(skip_locked=True).scalar_subquery())
+            row = connection.execute(update(self.jobs).where(jobs.id == due)
+                                     .values(status=RUNNING, claimed_at=now, attempts=jobs.attempts + 1, done=0)
+                                     .returning(jobs.id, jobs.property_id)).first()
+        return None if row is None else (row.id, row.property_id, now)
+
+    def _photos(self, property_id):
+        """(row id, stored name) of the listing's photos that are in the store."""
+        photos = self.photos.c
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(photos.id, photos.url).where(photos.property_id == property_id)).all()
+        return [(id, self.store.stored_name(url)) for id, url in rows if self.store.stored_name(url)]
+
+    def _update_job(self, connection, job, **values):
+        """Update a job this worker still holds: one not queued again or claimed by another since.
+
+        Returns whether it did.
+        """
+        id, _, claimed_at = job
+        jobs = self.jobs.c
+        return connection.execute(update(self.jobs)
+                                  .where(jobs.id == id, jobs.status == RUNNING, jobs.claimed_at == claimed_at)
+                                  .values(**values)).rowcount > 0
+
+    def run(self, once=False):
+        """Process jobs until stopped, or with `once` until the queue is empty."""
+        while not self._run_pool(once):
+            pass  # A pool process died; start again with a new pool
+
+    def _run_pool(self, once):
+        """Process jobs in a new pool until `once` finds the queue empty (returns True) or the pool breaks (False)."""
+        with ProcessPoolExecutor(self.processes, initializer=_start, initargs=(self.store.root, self.store.base_url)) as pool:
+            remaining = {}  # Job -> photos not finished yet
+            try:
+                self._process(pool, once, remaining)
+            except BrokenProcessPool:
+                self._requeue(remaining)
+                return False
+            return True
+
+    def _process(self, pool, once, remaining):
+        running = {}  # Future -> (job, photo row id)
+        errors = {}  # Job -> the first photo error
+        while True:
+            # Keep the pool busy: claim jobs while it has fewer photos than it can take
+            while len(running) < self.processes * BACKLOG_PER_PROCESS:
+                job = self.claim()
+                if job is None:
+                    break
+                photos = self._photos(job[1])
+                with self.engine.begin() as connection:
+                    self._update_job(connection, job, total=len(photos))
+                remaining[job] = len(photos)
+                for photo_id, name in photos:
+                    running[pool.submit(process_photo, name)] = (job, photo_id)
+                if not photos:
+                    self._finish(job, remaining, errors)
+
+            if not running:
+                if once:
+                    return
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            finished, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job, photo_id = running.pop(future)
+                self._record(future, job, photo_id, errors)
+                remaining[job] -= 1
+                if not remaining[job]:
+                    self._finish(job, remaining, errors)
+
+    def _record(self, future, job, photo_id, errors):
+        photos, jobs = self.photos.c, self.jobs.c
+        with self.engine.begin() as connection:
+            try:
+                width, height, phash = future.result()
+            except (ValueError, OSError, Image.DecompressionBombError) as e:
+                # images.py words decoding errors for the seller; others (a photo gone from the store,
+                # a derivative that couldn't be written) fail the photo without their details
+                errors.setdefault(job, str(e) if isinstance(e, ValueError) else "Photo can't be processed")
+            else:
+                connection.execute(update(self.photos).where(photos.id == photo_id)
+                                   .values(width=width, height=height, phash=f'{phash:016x}'))
+            self._update_job(connection, job, done=jobs.done + 1)
+
+    def _requeue(self, remaining):
+        """Queue the jobs in flight again, or fail those out of attempts."""
+        jobs = self.jobs.c
+        spent = jobs.attempts >= MAX_ATTEMPTS
+        with self.engine.begin() as connection:
+            for job in remaining:
+                self._update_job(connection, job, status=case((spent, FAILED), else_=QUEUED),
+                                 error=case((spent, "Photo can't be processed"), else_=None))
+        remaining.clear()
+
+    def _finish(self, job, remaining, errors):
+        del remaining[job]
+        error = errors.pop(job, None)
+        with self.engine.begin() as connection:
+            if self._update_job(connection, job, status=FAILED if error else DONE, error=error) and self.on_finish:
+                self.on_finish(connection, job[1])
@@ -0,0 +1,135 @@
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import storage
+
+# Dictionary of listing locations with how many listings each has, so
+# /location and the autocomplete never scan the property table.
+#
+# The table is kept current by a flush hook applying +1/-1 deltas as
+# properties are added, moved or deleted. Each process answers prefix
+# lookups from a trie built from the table: every node keeps the most
+# popular locations below it, so a lookup costs O(len(prefix)) whatever the
+# number of locations. The trie is rebuilt on the first lookup after any
+# process commits a listing change, which the shared change count tells
+# (see changes.py); building it takes milliseconds.
+
+MAX_SUGGESTIONS = 10
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces: "Navi  Mumbai,Maharashtra" -> "navi mumbai maharashtra"."""
+    return ' '.join(re.findall(r'\w+', text.casefold()))
+
+
+class LocationTrie:
+    def __init__(self, locations):
+        """`locations` is an iterable of (name, listing count)."""
+        self.root = {}
+        # Inserting the most popular first lets each node's list stay in rank order
+        for name, count in sorted(locations, key=lambda item: (-item[1], item[0])):
+            key = normalize(name)
+            # Index from the start of every word, so "maha" finds "Mumbai, Maharashtra"
+            for start in [0] + [m.end() for m in re.finditer(' ', key)]:
+                node = self.root
+                for char in key[start:]:
+                    node = node.setdefault(char, {})
+                    top = node.setdefault('', [])  # '' can't be a character key
+                    if len(top) < MAX_SUGGESTIONS and (name, count) not in top:
+                        top.append((name, count))
+
+    def complete(self, prefix, limit=MAX_SUGGESTIONS):
+        node = self.root
+        for char in normalize(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])[:limit]
+
+
+class LocationIndex:
+    def __init__(self, table, counter):
+        """`table` is the location table; `counter` the changes.ChangeCounter bumped by every listing change."""
+        self.table = table
+        self.counter = counter
+        self.trie = None
+        self.built_at = None  # The change count the trie reflects; None when out of date
+        self.lock = threading.Lock()
+
+    def _current(self, count):
+        return self.trie is not None and self.built_at is not None and self.built_at >= count
+
+    def _trie(self, connection):
+        # Read before the rows, so the rows are at least as recent as the count they are marked with
+        count = self.counter.current(connection)
+        if self._current(count):
+            return self.trie
+        with self.lock:
+            if not self._current(count):  # Else rebuilt while this request waited
+                rows = connection.execute(
+                    select(self.table.c.name, self.table.c.listing_count).where(self.table.c.listing_count > 0)
+                ).all()
+                self.trie, self.built_at = LocationTrie(rows), count
+            return self.trie
+
+    def complete(self, connection, prefix, limit=MAX_SUGGESTIONS):
+        """The `limit` most popular locations with a word starting with `prefix`, as (name, count)."""
+        return self._trie(connection).complete(prefix, limit)
+
+    def invalidate(self):
+        """Rebuild on the next lookup."""
+        self.built_at = None
+
+    def apply(self, connection, deltas):
+        """Add `deltas` ({name: change in listing count}) to the table, dropping names no listing uses."""
+        insert = (postgresql if connection.dialect.name == 'postgresql' else sqlite).insert(self.table)
+        for name, delta in deltas.items():
+            if delta == 0:
+                continue
+            connection.execute(insert.values(name=name, listing_count=delta).on_conflict_do_update(
+                index_elements=['name'],
+                set_={'listing_count': self.table.c.listing_count + insert.excluded.listing_count},
+            ))
+        connection.execute(self.table.delete().where(self.table.c.name.in_(list(deltas)),
+                                                     self.table.c.listing_count <= 0))
+
+    def rebuild(self, connection, listings):
+        """Recount every location from `listings` (the property table), for writes that bypassed the ORM."""
+        counts = connection.execute(
+            select(listings.c.location, func.count()).group_by(listings.c.location)
+        ).all()
+        connection.execute(self.table.delete())
+        if counts:
+            connection.execute(self.table.insert(), [{'name': name, 'listing_count': count} for name, count in counts])
+
+    def maintain_on_flush(self, session, model):
+        """Count `model` rows in and out of their locations as flushes add, move and delete them.
+
+        The trie follows through the change count, which must be bumped by flushes of `model`.
+        """
+        @event.listens_for(session, 'after_flush')
+        def _after_flush(session, flush_context):
+            deltas = Counter()
+            for obj in session.new:
+                if isinstance(obj, model):
+                    deltas[obj.location] += 1
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    deltas[_previous(obj, 'location')] -= 1
+            for obj in session.dirty:
+                if isinstance(obj, model) and inspect(obj).attrs.location.history.has_changes():
+                    deltas[_previous(obj, 'location')] -= 1
+                    deltas[obj.location] += 1
+            deltas.pop(None, None)
+            if deltas:
+                self.apply(storage.primary_connection(session), deltas)
+
+
+def _previous(obj, name):
+    """An attribute's value before the pending flush."""
+    deleted = inspect(obj).attrs[name].history.deleted
+    return deleted[0] if deleted else getattr(obj, name)
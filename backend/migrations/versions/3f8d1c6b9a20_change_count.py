@@ -0,0 +1,29 @@
+"""shared count of listing changes
+
+Revision ID: 3f8d1c6b9a20
+Revises: 9e3b7a5c4f12
+Create Date: 2026-10-19 10:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d1c6b9a20'
+down_revision = '9e3b7a5c4f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_count = op.create_table('change_count',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(change_count, [{'id': 1, 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('change_count')
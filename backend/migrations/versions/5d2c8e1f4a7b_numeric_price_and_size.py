@@ -0,0 +1,135 @@
+"""numeric price and size columns
+
+Revision ID: 5d2c8e1f4a7b
+Revises: 1273c9f40f8a
+Create Date: 2026-10-18 14:05:12.418230
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c8e1f4a7b'
+down_revision = '1273c9f40f8a'
+branch_labels = None
+depends_on = None
+
+
+# The price and size parsers (parsing.py) as of this revision, so the backfill stays the same
+# whatever the app's parsers become
+
+NUMBER = r'(\d+(?:\.\d+)?)'
+PRICE_UNITS = {
+    'k': 1_000, 'thousand': 1_000,
+    'l': 100_000, 'lac': 100_000, 'lacs': 100_000, 'lakh': 100_000, 'lakhs': 100_000,
+    'cr': 10_000_000, 'crore': 10_000_000, 'crores': 10_000_000,
+}
+SIZE_UNITS = {
+    'sqft': 1.0, 'sqfeet': 1.0, 'sqfoot': 1.0, 'squarefeet': 1.0, 'ft2': 1.0, 'ft²': 1.0,
+    'sqm': 10.7639, 'sqmeter': 10.7639, 'sqmeters': 10.7639, 'sqmetre': 10.7639, 'sqmetres': 10.7639,
+    'm2': 10.7639, 'm²': 10.7639,
+    'sqyd': 9.0, 'sqyard': 9.0, 'sqyards': 9.0, 'gaj': 9.0,
+    'acre': 43560.0, 'acres': 43560.0,
+    'hectare': 107639.0, 'hectares': 107639.0, 'ha': 107639.0,
+}
+PRICE_PART = re.compile(NUMBER + r'\s*([a-z]*)')
+SIZE_PART = re.compile(NUMBER + r'\s*(.*)')
+
+
+def _price_value(part):
+    match = PRICE_PART.search(part)
+    if not match:
+        return None
+    number, unit = match.groups()
+    if unit and unit not in PRICE_UNITS:
+        return None
+    return float(number) * PRICE_UNITS.get(unit, 1)
+
+
+def parse_price_range(text):
+    if not text:
+        return None, None
+    cleaned = re.sub(r'\brs\.?|\binr\b|₹|,', '', str(text).lower())
+    parts = [p for p in re.split(r'\s*(?:-|–|to)\s*', cleaned) if p.strip()]
+    if not parts or len(parts) > 2:
+        return None, None
+    values = [_price_value(p) for p in parts]
+    if None in values:
+        return None, None
+    if len(parts) == 2:
+        low_unit = PRICE_PART.search(parts[0]).group(2)
+        high_unit = PRICE_PART.search(parts[1]).group(2)
+        if not low_unit and high_unit:
+            values[0] *= PRICE_UNITS[high_unit]
+    return min(values), max(values)
+
+
+def parse_size_sqft(text):
+    if not text:
+        return None
+    match = SIZE_PART.search(str(text).lower().replace(',', ''))
+    if not match:
+        return None
+    number, unit = match.groups()
+    unit = re.sub(r'[\s.]', '', unit).replace('square', 'sq')
+    if unit == 'sq':
+        unit = 'sqft'
+    if not unit:
+        return float(number)
+    if unit not in SIZE_UNITS:
+        return None
+    return float(number) * SIZE_UNITS[unit]
+
+
+def upgrade():
+    op.add_column('property', sa.Column('price_min', sa.Float(), nullable=True))
+    op.add_column('property', sa.Column('price_max', sa.Float(), nullable=True))
+    op.add_column('property', sa.Column('size_sqft', sa.Float(), nullable=True))
+
+    # Backfill the parsed values for existing listings
+    property_table = sa.table(
+        'property',
+        sa.column('id', sa.Integer),
+        sa.column('price_range', sa.String),
+        sa.column('size', sa.String),
+        sa.column('price_min', sa.Float),
+        sa.column('price_max', sa.Float),
+        sa.column('size_sqft', sa.Float),
+    )
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(property_table.c.id, property_table.c.price_range, property_table.c.size)).all()
+    updates = []
+    for row in rows:
+        price_min, price_max = parse_price_range(row.price_range)
+        updates.append({
+            'b_id': row.id,
+            'price_min': price_min,
+            'price_max': price_max,
+            'size_sqft': parse_size_sqft(row.size),
+        })
+    if updates:
+        conn.execute(
+            property_table.update()
+            .where(property_table.c.id == sa.bindparam('b_id'))
+            .values(price_min=sa.bindparam('price_min'),
+                    price_max=sa.bindparam('price_max'),
+                    size_sqft=sa.bindparam('size_sqft')),
+            updates,
+        )
+
+    op.create_index('ix_property_price_min', 'property', ['price_min'], unique=False)
+    op.create_index('ix_property_price_max', 'property', ['price_max'], unique=False)
+    op.create_index('ix_property_size_sqft', 'property', ['size_sqft'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_property_size_sqft', table_name='property')
+    op.drop_index('ix_property_price_max', table_name='property')
+    op.drop_index('ix_property_price_min', table_name='property')
+    with op.batch_alter_table('property') as batch_op:
+        batch_op.drop_column('size_sqft')
+        batch_op.drop_column('price_max')
+        batch_op.drop_column('price_min')
@@ -0,0 +1,48 @@
+"""photo jobs and photo dimensions
+
+Revision ID: 6c2e9f4a1d07
+Revises: b8f14e6d2a93
+Create Date: 2026-10-18 23:04:12.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2e9f4a1d07'
+down_revision = 'b8f14e6d2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('photo_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('done', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('claimed_at', sa.Float(), nullable=True),
+    sa.Column('error', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['property.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('property_id')
+    )
+    op.create_index('ix_photo_job_status_id', 'photo_job', ['status', 'id'], unique=False)
+
+    with op.batch_alter_table('property_image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('phash', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('property_image', schema=None) as batch_op:
+        batch_op.drop_column('phash')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
+
+    op.drop_index('ix_photo_job_status_id', table_name='photo_job')
+    op.drop_table('photo_job')
@@ -0,0 +1,97 @@
+"""amenity and image tables
+
+Revision ID: 8a41f0c9d2e3
+Revises: 5d2c8e1f4a7b
+Create Date: 2026-10-18 14:52:37.905114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41f0c9d2e3'
+down_revision = '5d2c8e1f4a7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    amenity = op.create_table('amenity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    property_amenity = op.create_table('property_amenity',
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('amenity_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['amenity_id'], ['amenity.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['property_id'], ['property.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('property_id', 'amenity_id')
+    )
+    op.create_index('ix_property_amenity_amenity_id_property_id', 'property_amenity', ['amenity_id', 'property_id'], unique=False)
+    property_image = op.create_table('property_image',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.ForeignKeyConstraint(['property_id'], ['property.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_property_image_property_id_position', 'property_image', ['property_id', 'position'], unique=False)
+
+    # Move the comma-joined values into the new tables
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT id, amenities, images FROM property')).all()
+    amenity_ids = {}
+    links, images = [], []
+    for row in rows:
+        names = dict.fromkeys(n.strip() for n in (row.amenities or '').split(',') if n.strip())
+        for name in names:
+            if name not in amenity_ids:
+                amenity_ids[name] = len(amenity_ids) + 1
+            links.append({'property_id': row.id, 'amenity_id': amenity_ids[name]})
+        urls = [u.strip() for u in (row.images or '').split(',') if u.strip()]
+        for position, url in enumerate(urls):
+            images.append({'property_id': row.id, 'position': position, 'url': url})
+
+    if amenity_ids:
+        op.bulk_insert(amenity, [{'id': i, 'name': name} for name, i in amenity_ids.items()])
+    if links:
+        op.bulk_insert(property_amenity, links)
+    if images:
+        op.bulk_insert(property_image, images)
+
+    with op.batch_alter_table('property') as batch_op:
+        batch_op.drop_column('amenities')
+        batch_op.drop_column('images')
+
+
+def downgrade():
+    with op.batch_alter_table('property') as batch_op:
+        batch_op.add_column(sa.Column('images', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('amenities', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    amenities, images = {}, {}
+    for row in conn.execute(sa.text(
+            'SELECT pa.property_id, a.name FROM property_amenity pa '
+            'JOIN amenity a ON a.id = pa.amenity_id ORDER BY a.name')):
+        amenities.setdefault(row.property_id, []).append(row.name)
+    for row in conn.execute(sa.text(
+            'SELECT property_id, url FROM property_image ORDER BY property_id, position')):
+        images.setdefault(row.property_id, []).append(row.url)
+    for property_id in set(amenities) | set(images):
+        conn.execute(
+            sa.text('UPDATE property SET amenities = :amenities, images = :images WHERE id = :id'),
+            {'id': property_id,
+             'amenities': ','.join(amenities.get(property_id, [])),
+             'images': ','.join(images.get(property_id, []))},
+        )
+
+    op.drop_index('ix_property_image_property_id_position', table_name='property_image')
+    op.drop_table('property_image')
+    op.drop_index('ix_property_amenity_amenity_id_property_id', table_name='property_amenity')
+    op.drop_table('property_amenity')
+    op.drop_table('amenity')
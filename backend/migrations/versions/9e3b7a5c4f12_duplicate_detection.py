@@ -0,0 +1,127 @@
+"""near-duplicate detection
+
+Revision ID: 9e3b7a5c4f12
+Revises: 6c2e9f4a1d07
+Create Date: 2026-10-18 23:41:08.216403
+
+"""
+import hashlib
+import re
+import struct
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b7a5c4f12'
+down_revision = '6c2e9f4a1d07'
+branch_labels = None
+depends_on = None
+
+# Text signing and matching as duplicates.py defined them at this revision
+SIGNATURE_SIZE = 64
+BAND_SIZE = 3
+TEXT_BANDS = SIGNATURE_SIZE // BAND_SIZE
+SHINGLE_WORDS = 3
+MIN_WORDS = 12
+TEXT_SIMILARITY = 0.6
+EMPTY_BIN = 0xffffffff
+DENSIFY_STEP = 0x9e3779b1
+
+
+def _hash(data, size=8):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=size).digest(), 'big')
+
+
+def signature(name, address, description):
+    words = re.findall(r'\w+', ' '.join(filter(None, (name, address, description))).lower())
+    if len(words) < MIN_WORDS:
+        return None
+    bins = [EMPTY_BIN] * SIGNATURE_SIZE
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        value = _hash(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+        index, value = value % SIGNATURE_SIZE, value >> 32
+        if value < bins[index]:
+            bins[index] = value
+    filled = [value != EMPTY_BIN for value in bins]
+    full = distance = None
+    for index in reversed(range(2 * SIGNATURE_SIZE)):
+        index %= SIGNATURE_SIZE
+        if filled[index]:
+            full, distance = bins[index], 0
+        elif full is not None:
+            distance += 1
+            bins[index] = (full + distance * DENSIFY_STEP) & EMPTY_BIN
+    return struct.pack(f'>{SIGNATURE_SIZE}I', *bins)
+
+
+def similarity(a, b):
+    a, b = struct.unpack(f'>{SIGNATURE_SIZE}I', a), struct.unpack(f'>{SIGNATURE_SIZE}I', b)
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def text_buckets(sig):
+    size = BAND_SIZE * 4
+    return [(band, _hash(sig[band * size:(band + 1) * size]) - (1 << 63)) for band in range(TEXT_BANDS)]
+
+
+def upgrade():
+    buckets = op.create_table('duplicate_bucket',
+    sa.Column('band', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['property_id'], ['property.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('band', 'bucket', 'property_id')
+    )
+    op.create_index('ix_duplicate_bucket_property_id', 'duplicate_bucket', ['property_id'], unique=False)
+
+    with op.batch_alter_table('property', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('minhash', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_property_duplicate_of_id'), ['duplicate_of_id'], unique=False)
+        batch_op.create_foreign_key('fk_property_duplicate_of_id', 'property', ['duplicate_of_id'], ['id'],
+                                    ondelete='SET NULL')
+
+    # Sign and check the existing listings, oldest first; photos are checked as the photo worker reprocesses them
+    listings = sa.table('property', sa.column('id'), sa.column('name'), sa.column('address'),
+                        sa.column('description'), sa.column('minhash'), sa.column('duplicate_of_id'))
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(listings.c.id, listings.c.name, listings.c.address, listings.c.description).order_by(listings.c.id)
+    ).all()
+    bucketed = defaultdict(list)  # (band, bucket) -> [(id, signature, original's id)] of the listings so far
+    updates, inserts = [], []
+    for row in rows:
+        sig = signature(row.name, row.address, row.description)
+        original = None
+        if sig:
+            keys = text_buckets(sig)
+            best = None
+            for id, minhash, duplicate_of in {entry for key in keys for entry in bucketed[key]}:
+                score = similarity(sig, minhash)
+                if score >= TEXT_SIMILARITY and (best is None or (score, -(duplicate_of or id)) > best):
+                    best = (score, -(duplicate_of or id))
+            original = None if best is None else -best[1]
+            for key in keys:
+                bucketed[key].append((row.id, sig, original))
+                inserts.append({'band': key[0], 'bucket': key[1], 'property_id': row.id})
+        updates.append({'listing_id': row.id, 'minhash': sig, 'duplicate_of_id': original})
+    if updates:
+        connection.execute(listings.update().where(listings.c.id == sa.bindparam('listing_id'))
+                           .values(minhash=sa.bindparam('minhash'), duplicate_of_id=sa.bindparam('duplicate_of_id')),
+                           updates)
+    if inserts:
+        op.bulk_insert(buckets, inserts)
+
+
+def downgrade():
+    with op.batch_alter_table('property', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_property_duplicate_of_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_property_duplicate_of_id'))
+        batch_op.drop_column('duplicate_of_id')
+        batch_op.drop_column('minhash')
+
+    op.drop_index('ix_duplicate_bucket_property_id', table_name='duplicate_bucket')
+    op.drop_table('duplicate_bucket')
@@ -0,0 +1,47 @@
+"""search aliases and fts vocabulary
+
+Revision ID: a4d7e2c91b58
+Revises: f2c6a9d14b37
+Create Date: 2026-10-18 20:41:07.519346
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2c91b58'
+down_revision = 'f2c6a9d14b37'
+branch_labels = None
+depends_on = None
+
+# As fuzzy.py defined them at this revision
+VOCAB_TABLE = 'property_fts_vocab'
+DEFAULT_ALIASES = [
+    ('bengaluru', 'bangalore'), ('bombay', 'mumbai'), ('gurugram', 'gurgaon'), ('madras', 'chennai'),
+    ('calcutta', 'kolkata'), ('poona', 'pune'), ('cochin', 'kochi'), ('baroda', 'vadodara'),
+    ('mysuru', 'mysore'), ('mangaluru', 'mangalore'), ('belagavi', 'belgaum'), ('trivandrum', 'thiruvananthapuram'),
+    ('prayagraj', 'allahabad'), ('vizag', 'visakhapatnam'),
+    ('w', 'west'), ('e', 'east'), ('n', 'north'), ('s', 'south'),
+    ('rd', 'road'), ('st', 'street'), ('apt', 'apartment'), ('apts', 'apartments'), ('sec', 'sector'),
+]
+
+
+def upgrade():
+    search_alias = op.create_table('search_alias',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('alias', sa.String(length=64), nullable=False),
+    sa.Column('canonical', sa.String(length=64), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('alias')
+    )
+    op.bulk_insert(search_alias, [{'alias': a, 'canonical': c} for a, c in DEFAULT_ALIASES])
+
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab(property_fts, row)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute(f"DROP TABLE IF EXISTS {VOCAB_TABLE}")
+    op.drop_table('search_alias')
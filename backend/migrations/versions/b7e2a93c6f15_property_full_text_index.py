@@ -0,0 +1,36 @@
+"""property full-text index
+
+Revision ID: b7e2a93c6f15
+Revises: 8a41f0c9d2e3
+Create Date: 2026-10-18 15:31:09.562871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2a93c6f15'
+down_revision = '8a41f0c9d2e3'
+branch_labels = None
+depends_on = None
+
+# The FTS5 table as search.py defined it at this revision
+FTS_TABLE = 'property_fts'
+FTS_COLUMNS = 'name, location, address, description'
+FTS_RANK = 'bm25(10.0, 5.0, 2.0, 1.0)'
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+               f"{FTS_COLUMNS}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    op.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', '{FTS_RANK}')")
+    op.execute(f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) SELECT id, {FTS_COLUMNS} FROM property")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
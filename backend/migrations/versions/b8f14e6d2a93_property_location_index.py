@@ -0,0 +1,24 @@
+"""property location index
+
+Revision ID: b8f14e6d2a93
+Revises: a4d7e2c91b58
+Create Date: 2026-10-18 21:26:40.183527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f14e6d2a93'
+down_revision = 'a4d7e2c91b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_property_location', 'property', ['location'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_property_location', table_name='property')
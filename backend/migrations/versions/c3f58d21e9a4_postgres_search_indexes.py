@@ -0,0 +1,61 @@
+"""postgres search indexes
+
+Revision ID: c3f58d21e9a4
+Revises: b7e2a93c6f15
+Create Date: 2026-10-18 17:02:44.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f58d21e9a4'
+down_revision = 'b7e2a93c6f15'
+branch_labels = None
+depends_on = None
+
+# The search structures as search.py defined them at this revision
+TSVECTOR_COLUMN = 'search_vector'
+TSVECTOR_EXPRESSION = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(address, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+)
+TRIGRAM_COLUMNS = ('name', 'location')
+
+
+def has_trigram_extension(bind):
+    return bind.scalar(sa.text(
+        "SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )) > 0
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    op.execute(
+        f"ALTER TABLE property ADD COLUMN IF NOT EXISTS {TSVECTOR_COLUMN} tsvector "
+        f"GENERATED ALWAYS AS ({TSVECTOR_EXPRESSION}) STORED"
+    )
+    op.execute(
+        f"CREATE INDEX IF NOT EXISTS ix_property_{TSVECTOR_COLUMN} "
+        f"ON property USING gin ({TSVECTOR_COLUMN})"
+    )
+    # Trigram indexes serve ILIKE '%...%' on name/location; skipped where the contrib module isn't installed
+    if has_trigram_extension(bind):
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRIGRAM_COLUMNS:
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_property_{column}_trgm "
+                       f"ON property USING gin ({column} gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column in TRIGRAM_COLUMNS:
+        op.execute(f"DROP INDEX IF EXISTS ix_property_{column}_trgm")
+    op.execute(f"DROP INDEX IF EXISTS ix_property_{TSVECTOR_COLUMN}")
+    op.execute(f"ALTER TABLE property DROP COLUMN IF EXISTS {TSVECTOR_COLUMN}")
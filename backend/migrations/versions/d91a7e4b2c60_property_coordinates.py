@@ -0,0 +1,47 @@
+"""property coordinates and spatial index
+
+Revision ID: d91a7e4b2c60
+Revises: c3f58d21e9a4
+Create Date: 2026-10-18 18:12:37.804519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91a7e4b2c60'
+down_revision = 'c3f58d21e9a4'
+branch_labels = None
+depends_on = None
+
+# The spatial index as geo.py defined it at this revision
+RTREE_TABLE = 'property_rtree'
+POINT_INDEX = 'ix_property_point'
+
+
+def upgrade():
+    with op.batch_alter_table('property', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+                   f"USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+        op.execute(f"INSERT INTO {RTREE_TABLE} SELECT id, latitude, latitude, longitude, longitude "
+                   f"FROM property WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+    elif dialect == 'postgresql':
+        op.execute(f"CREATE INDEX IF NOT EXISTS {POINT_INDEX} ON property USING gist (point(longitude, latitude))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+    elif dialect == 'postgresql':
+        op.execute(f"DROP INDEX IF EXISTS {POINT_INDEX}")
+
+    with op.batch_alter_table('property', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
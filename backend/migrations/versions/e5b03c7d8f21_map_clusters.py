@@ -0,0 +1,85 @@
+"""map cluster grid
+
+Revision ID: e5b03c7d8f21
+Revises: d91a7e4b2c60
+Create Date: 2026-10-18 19:04:52.331870
+
+"""
+import math
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b03c7d8f21'
+down_revision = 'd91a7e4b2c60'
+branch_labels = None
+depends_on = None
+
+# The grid as clusters.py defined it at this revision
+MAX_LEVEL = 14
+MAX_LATITUDE = 85.0511287798
+
+
+def cell(latitude, longitude, level):
+    n = 1 << level
+    latitude = max(-MAX_LATITUDE, min(latitude, MAX_LATITUDE))
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def combine(level, x, y, parts):
+    """The cluster row of a cell from those of its listings (as one-listing rows) or its children."""
+    prices_min = [p['price_min'] for p in parts if p['price_min'] is not None]
+    prices_max = [p['price_max'] for p in parts if p['price_max'] is not None]
+    return {
+        'level': level, 'x': x, 'y': y,
+        'count': sum(p['count'] for p in parts),
+        'latitude_sum': sum(p['latitude_sum'] for p in parts),
+        'longitude_sum': sum(p['longitude_sum'] for p in parts),
+        'price_min': min(prices_min, default=None),
+        'price_max': max(prices_max, default=None),
+        'first_property_id': min(p['first_property_id'] for p in parts),
+    }
+
+
+def upgrade():
+    map_cluster = op.create_table('map_cluster',
+    sa.Column('level', sa.Integer(), nullable=False),
+    sa.Column('x', sa.Integer(), nullable=False),
+    sa.Column('y', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('latitude_sum', sa.Float(), nullable=False),
+    sa.Column('longitude_sum', sa.Float(), nullable=False),
+    sa.Column('price_min', sa.Float(), nullable=True),
+    sa.Column('price_max', sa.Float(), nullable=True),
+    sa.Column('first_property_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('level', 'x', 'y')
+    )
+
+    # Cluster the existing listings, finest level first
+    by_cell = defaultdict(list)
+    for row in op.get_bind().execute(sa.text(
+            "SELECT id, latitude, longitude, price_min, price_max FROM property "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL")):
+        by_cell[cell(row.latitude, row.longitude, MAX_LEVEL)].append({
+            'count': 1, 'latitude_sum': row.latitude, 'longitude_sum': row.longitude,
+            'price_min': row.price_min, 'price_max': row.price_max, 'first_property_id': row.id,
+        })
+    level_rows = [combine(MAX_LEVEL, x, y, parts) for (x, y), parts in by_cell.items()]
+    rows = list(level_rows)
+    for level in range(MAX_LEVEL - 1, -1, -1):
+        parents = defaultdict(list)
+        for child in level_rows:
+            parents[(child['x'] >> 1, child['y'] >> 1)].append(child)
+        level_rows = [combine(level, x, y, children) for (x, y), children in parents.items()]
+        rows.extend(level_rows)
+    if rows:
+        op.bulk_insert(map_cluster, rows)
+
+
+def downgrade():
+    op.drop_table('map_cluster')
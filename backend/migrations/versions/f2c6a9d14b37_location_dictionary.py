@@ -0,0 +1,34 @@
+"""location dictionary
+
+Revision ID: f2c6a9d14b37
+Revises: e5b03c7d8f21
+Create Date: 2026-10-18 19:48:15.276034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6a9d14b37'
+down_revision = 'e5b03c7d8f21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('location',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('listing_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.execute(
+        "INSERT INTO location (name, listing_count) "
+        "SELECT location, count(*) FROM property GROUP BY location"
+    )
+
+
+def downgrade():
+    op.drop_table('location')
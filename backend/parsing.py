@@ -0,0 +1,99 @@
+import re
+
+# Parse the free-text price and size fields sellers type in into numbers
+# the database can index and range-filter on.
+
+NUMBER = r'(\d+(?:\.\d+)?)'
+
+PRICE_UNITS = {
+    'k': 1_000,
+    'thousand': 1_000,
+    'l': 100_000,
+    'lac': 100_000,
+    'lacs': 100_000,
+    'lakh': 100_000,
+    'lakhs': 100_000,
+    'cr': 10_000_000,
+    'crore': 10_000_000,
+    'crores': 10_000_000,
+}
+
+# Size units -> square feet
+SIZE_UNITS = {
+    'sqft': 1.0,
+    'sqfeet': 1.0,
+    'sqfoot': 1.0,
+    'squarefeet': 1.0,
+    'ft2': 1.0,
+    'ft²': 1.0,
+    'sqm': 10.7639,
+    'sqmeter': 10.7639,
+    'sqmeters': 10.7639,
+    'sqmetre': 10.7639,
+    'sqmetres': 10.7639,
+    'm2': 10.7639,
+    'm²': 10.7639,
+    'sqyd': 9.0,
+    'sqyard': 9.0,
+    'sqyards': 9.0,
+    'gaj': 9.0,
+    'acre': 43560.0,
+    'acres': 43560.0,
+    'hectare': 107639.0,
+    'hectares': 107639.0,
+    'ha': 107639.0,
+}
+
+PRICE_PART = re.compile(NUMBER + r'\s*([a-z]*)')
+SIZE_PART = re.compile(NUMBER + r'\s*(.*)')
+
+
+def _price_value(part):
+    match = PRICE_PART.search(part)
+    if not match:
+        return None
+    number, unit = match.groups()
+    if unit and unit not in PRICE_UNITS:
+        return None
+    return float(number) * PRICE_UNITS.get(unit, 1)
+
+
+def parse_price_range(text):
+    """Parse "50,00,000", "45-60 Lakh" or "1.2 Cr to 1.5 Cr" into (min, max) rupees."""
+    if not text:
+        return None, None
+    cleaned = re.sub(r'\brs\.?|\binr\b|₹|,', '', str(text).lower())
+    parts = [p for p in re.split(r'\s*(?:-|–|to)\s*', cleaned) if p.strip()]
+    if not parts or len(parts) > 2:
+        return None, None
+
+    values = [_price_value(p) for p in parts]
+    if None in values:
+        return None, None
+
+    # "45-60 Lakh": a unit on the upper bound only applies to both
+    if len(parts) == 2:
+        low_unit = PRICE_PART.search(parts[0]).group(2)
+        high_unit = PRICE_PART.search(parts[1]).group(2)
+        if not low_unit and high_unit:
+            values[0] *= PRICE_UNITS[high_unit]
+
+    return min(values), max(values)
+
+
+def parse_size_sqft(text):
+    """Parse "1200 sq ft", "2 acres" or "500 sq. yd" into square feet."""
+    if not text:
+        return None
+    match = SIZE_PART.search(str(text).lower().replace(',', ''))
+    if not match:
+        return None
+    number, unit = match.groups()
+    unit = re.sub(r'[\s.]', '', unit).replace('square', 'sq')
+    if unit == 'sq':
+        unit = 'sqft'
+    if not unit:
+        return float(number)
+    if unit not in SIZE_UNITS:
+        return None
+    return float(number) * SIZE_UNITS[unit]
@@ -0,0 +1,146 @@
+import re
+
+from sqlalchemy import DDL, Float, cast, event, func, literal_column, text, table, column
+
+# Full-text index over the searchable Property fields.
+#
+# SQLite: an FTS5 table whose rowid is the property id, kept in sync by ORM
+# events so anything written through the session is searchable on commit.
+# PostgreSQL: a generated, weighted tsvector column on property with a GIN
+# index (see the migrations), which the database maintains itself.
+
+FTS_TABLE = 'property_fts'
+FTS_COLUMNS = ('name', 'location', 'address', 'description')
+
+# BM25 column weights, in FTS_COLUMNS order: a hit in the name counts most
+FTS_RANK = 'bm25(10.0, 5.0, 2.0, 1.0)'
+
+CREATE_FTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+CONFIGURE_RANK = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', '{FTS_RANK}')"
+POPULATE_FTS = (
+    f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+    f"SELECT id, {', '.join(FTS_COLUMNS)} FROM property"
+)
+
+# PostgreSQL: same weighting as FTS_RANK, expressed as tsvector weights A-D
+TSVECTOR_COLUMN = 'search_vector'
+TSVECTOR_EXPRESSION = " || ".join(
+    f"setweight(to_tsvector('simple', coalesce({name}, '')), '{weight}')"
+    for name, weight in zip(FTS_COLUMNS, 'ABCD')
+)
+TRIGRAM_COLUMNS = ('name', 'location')
+POSTGRES_INDEXES = {f'ix_property_{TSVECTOR_COLUMN}'} | {f'ix_property_{c}_trgm' for c in TRIGRAM_COLUMNS}
+
+INSERT_ROW = text(
+    f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+    f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})"
+)
+DELETE_ROW = text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id")
+
+fts = table(FTS_TABLE, column('rowid'), column(FTS_TABLE), column('rank'))
+
+
+def is_fts_table(name):
+    """True for the FTS table and the shadow tables SQLite creates for it."""
+    return name == FTS_TABLE or name.startswith(FTS_TABLE + '_')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic hook keeping autogenerate away from the search structures it doesn't model."""
+    if type_ == 'table':
+        return not is_fts_table(name)
+    if type_ == 'column':
+        return name != TSVECTOR_COLUMN
+    if type_ == 'index':
+        return name not in POSTGRES_INDEXES
+    return True
+
+
+def search_words(search):
+    return re.findall(r'\w+', search.lower())
+
+
+def alternatives(word):
+    """A query word as its tuple of spellings: a plain string, or a sequence any of whose items may match."""
+    return (word,) if isinstance(word, str) else tuple(word)
+
+
+def match_query(words):
+    """FTS5 query: every word must match, as a prefix."""
+    return ' AND '.join('(' + ' OR '.join(f'"{w}"*' for w in alternatives(word)) + ')' for word in words)
+
+
+def tsquery(words):
+    """PostgreSQL tsquery with the same meaning as match_query."""
+    return func.to_tsquery('simple', ' & '.join(
+        '(' + ' | '.join(f'{w}:*' for w in alternatives(word)) + ')' for word in words
+    ))
+
+
+def match(expression):
+    return fts.c[FTS_TABLE].op('MATCH')(expression)
+
+
+def matching(model, dialect, words):
+    """A clause restricting `model` to rows matching all `words` (see alternatives)."""
+    if dialect == 'postgresql':
+        vector = literal_column(f'{model.__tablename__}.{TSVECTOR_COLUMN}')
+        return vector.op('@@')(tsquery(words))
+    return model.id.in_(fts.select().with_only_columns(fts.c.rowid).where(match(match_query(words))))
+
+
+def ranked(query, model, dialect, words):
+    """Restrict `query` to matches and return it with a rank expression, best first when ascending."""
+    if dialect == 'postgresql':
+        vector = literal_column(f'{model.__tablename__}.{TSVECTOR_COLUMN}')
+        # ts_rank_cd is a float4; widen it so the rank round-trips exactly through page cursors
+        rank = (-cast(func.ts_rank_cd(vector, tsquery(words)), Float)).label('rank')
+        return query.filter(vector.op('@@')(tsquery(words))), rank
+    query = query.join(fts, fts.c.rowid == model.id).filter(match(match_query(words)))
+    return query, fts.c.rank
+
+
+def rebuild(connection):
+    """Re-index every property, for writes that bypassed the ORM (bulk loads)."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        connection.execute(text(POPULATE_FTS))
+
+
+def _index_row(connection, target):
+    connection.execute(INSERT_ROW, {'id': target.id, **{c: getattr(target, c) for c in FTS_COLUMNS}})
+
+
+def _after_insert(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _index_row(connection, target)
+
+
+def _after_update(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DELETE_ROW, {'id': target.id})
+        _index_row(connection, target)
+
+
+def _after_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DELETE_ROW, {'id': target.id})
+
+
+def register(model):
+    """Create the FTS table alongside the model's table and index its writes."""
+    for statement in (CREATE_FTS, CONFIGURE_RANK):
+        event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(model.__table__, 'after_create', DDL(
+        f"ALTER TABLE {model.__tablename__} ADD COLUMN {TSVECTOR_COLUMN} tsvector "
+        f"GENERATED ALWAYS AS ({TSVECTOR_EXPRESSION}) STORED"
+    ).execute_if(dialect='postgresql'))
+    event.listen(model.__table__, 'after_create', DDL(
+        f"CREATE INDEX ix_property_{TSVECTOR_COLUMN} ON {model.__tablename__} USING gin ({TSVECTOR_COLUMN})"
+    ).execute_if(dialect='postgresql'))
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+    event.listen(model, 'after_delete', _after_delete)
@@ -0,0 +1,74 @@
+import msgpack
+from flask import current_app, request
+from werkzeug.exceptions import BadRequest
+
+# Request and response bodies in the format the client speaks.
+#
+# Views answer with respond(data) and read request_body() rather than
+# jsonify and request.json. A response is encoded by the serializer the
+# Accept header prefers: JSON unless the client asks for MessagePack, which
+# is smaller and quicker to encode and decode, for mobile and internal
+# clients. A request body is decoded by the serializer for its
+# Content-Type. Other formats plug in through register().
+
+
+class JSONSerializer:
+    mimetype = 'application/json'
+
+    def response(self, data):
+        return current_app.json.response(data)  # Exactly what jsonify sends
+
+    def loads(self, body):
+        return current_app.json.loads(body)
+
+
+class MessagePackSerializer:
+    def __init__(self, mimetype='application/msgpack'):
+        self.mimetype = mimetype
+
+    def response(self, data):
+        # Anything JSON can't hold natively (dates, decimals, ...) is converted as jsonify would
+        body = msgpack.packb(data, default=current_app.json.default)
+        return current_app.response_class(body, mimetype=self.mimetype)
+
+    def loads(self, body):
+        return msgpack.unpackb(body)
+
+
+SERIALIZERS = {}  # Mimetype -> serializer; the first is the default
+
+
+def register(serializer):
+    SERIALIZERS[serializer.mimetype] = serializer
+
+
+register(JSONSerializer())
+register(MessagePackSerializer())
+register(MessagePackSerializer('application/x-msgpack'))  # The name older clients use
+
+
+def negotiated():
+    """The serializer for this request's response, by its Accept header."""
+    mimetypes = list(SERIALIZERS)
+    return SERIALIZERS[request.accept_mimetypes.best_match(mimetypes, default=mimetypes[0])]
+
+
+def respond(data):
+    """A response holding `data`, encoded as the client prefers; use in place of jsonify."""
+    response = negotiated().response(data)
+    response.vary.add('Accept')
+    return response
+
+
+def request_body():
+    """The decoded request body; use in place of request.json.
+
+    Bodies of a type no serializer handles are refused as request.json refuses them (415).
+    """
+    serializer = SERIALIZERS.get(request.mimetype)
+    if serializer is None or isinstance(serializer, JSONSerializer):
+        return request.json
+    try:
+        return serializer.loads(request.get_data(cache=True))
+    except (ValueError, msgpack.UnpackException) as e:
+        raise BadRequest(f"Failed to decode {request.mimetype} body") from e
@@ -0,0 +1,286 @@
+import csv
+import io
+import os
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# Engine setup for the app database. For an SQLite file this means WAL
+# journaling and tuned pragmas on every pooled connection, one writer
+# connection that all writes queue for (so concurrent requests wait in the
+# pool instead of failing with "database is locked"), and a pool of
+# query-only reader connections that WAL lets run alongside the writer.
+#
+# For PostgreSQL (DATABASE_URL=postgresql+psycopg2://...) there is a single
+# sized QueuePool shared by reads and writes: the server handles concurrency,
+# so any number of API workers can run against one database.
+#
+# Either can also be given read replicas (SQLALCHEMY_REPLICA_URIS). Reads
+# then go to a replica and the primary only serves writes and whatever the
+# same request reads after writing. An SQLite replica is a file refreshed
+# from the primary with the online backup API, by `flask refresh-replicas`
+# or the thread start_replica_refresh() runs for the development server.
+
+READER_BIND = 'reader'
+REPLICA_BIND = 'replica'  # Replica binds are replica0, replica1, ...
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # WAL stays durable across crashes; only fsyncs at checkpoints
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # Negative means KiB: 64 MiB of page cache per connection
+    'busy_timeout': 5000,  # ms to wait on another process's lock before failing
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',  # Off by default in SQLite, which would skip the schema's ON DELETE CASCADEs
+}
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def is_read_bind(key):
+    return key == READER_BIND or (key or '').startswith(REPLICA_BIND)
+
+
+def configure(app):
+    """Fill in engine options for app.config['SQLALCHEMY_DATABASE_URI'].
+
+    Tunables (set before calling): SQLITE_PRAGMAS to override pragma values,
+    SQLITE_READERS for the reader pool size and SQLITE_WRITE_TIMEOUT for how
+    long a request waits for the writer connection. For PostgreSQL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE size
+    each worker's connection pool. SQLALCHEMY_REPLICA_URIS lists read
+    replicas, SQLITE_REPLICA_INTERVAL is how many seconds apart SQLite
+    replicas are refreshed by start_replica_refresh (0 refreshes them once)
+    and REPLICA_CACHE_TTL bounds how long cached responses built from
+    replica reads are served.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    replicas = app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('SQLITE_REPLICA_INTERVAL', 30)
+    app.config.setdefault('REPLICA_CACHE_TTL', 5)
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+
+    if make_url(uri).get_backend_name() == 'postgresql':
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _postgres_pool(app))
+    elif is_sqlite_file(uri):
+        app.config.setdefault('SQLITE_PRAGMAS', {})
+        app.config.setdefault('SQLITE_WRITE_TIMEOUT', 30)
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': 1,
+            'max_overflow': 0,
+            'pool_timeout': app.config['SQLITE_WRITE_TIMEOUT'],
+        })
+        if not replicas:
+            binds.setdefault(READER_BIND, {'url': uri, **_sqlite_readers(app)})
+
+    for i, replica in enumerate(replicas):
+        if make_url(replica).get_backend_name() == 'postgresql':
+            options = _postgres_pool(app)
+        elif is_sqlite_file(replica):
+            options = _sqlite_readers(app)
+        else:
+            options = {}
+        binds.setdefault(f'{REPLICA_BIND}{i}', {'url': replica, **options})
+
+
+def _postgres_pool(app):
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', 10)))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.environ.get('DB_MAX_OVERFLOW', 20)))
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)  # Below typical server/proxy idle timeouts
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,  # Replace connections the server dropped instead of failing a request
+    }
+
+
+def _sqlite_readers(app):
+    app.config.setdefault('SQLITE_READERS', 8)
+    return {'pool_size': app.config['SQLITE_READERS'], 'max_overflow': 0}
+
+
+def _set_pragmas(pragmas, query_only):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if query_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return on_connect
+
+
+def install(app, db):
+    """Set up each SQLite engine's connections. Call inside an app context."""
+    pragmas = {**SQLITE_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {})}
+    # Replicas stay in rollback-journal mode: refresh_replicas swaps their file, which must have no -wal or -shm
+    replica_pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    for key, engine in db.engines.items():
+        if engine.dialect.name == 'sqlite':
+            replica = is_read_bind(key) and key != READER_BIND
+            event.listen(engine, 'connect', _set_pragmas(replica_pragmas if replica else pragmas,
+                                                         query_only=is_read_bind(key)))
+
+
+def start_replica_refresh(app, engines):
+    """Refresh the SQLite replicas now, then every SQLITE_REPLICA_INTERVAL seconds on a daemon thread.
+
+    For the process serving requests; importing the app never starts it, so
+    CLI commands, tests and each API worker of a multi-process server don't
+    all copy the database.
+    """
+    engines = dict(engines)
+    if not _sqlite_replicas(engines):
+        return
+    refresh_replicas(engines)
+    interval = app.config.get('SQLITE_REPLICA_INTERVAL', 0)
+    if not interval:
+        return
+
+    def refresh_periodically():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_replicas(engines)
+            except Exception:
+                app.logger.exception("Refreshing SQLite replicas failed")
+
+    threading.Thread(target=refresh_periodically, name='sqlite-replica-refresh', daemon=True).start()
+
+
+def _sqlite_replicas(engines):
+    if engines[None].dialect.name != 'sqlite':
+        return []
+    return [engine for key, engine in engines.items()
+            if key != READER_BIND and is_read_bind(key) and engine.dialect.name == 'sqlite']
+
+
+def refresh_replicas(engines):
+    """Copy the primary SQLite database over each SQLite replica, using the online backup API.
+
+    The copy reads through its own connection, so writers aren't held up.
+    It goes to a new file that then replaces the replica, so readers never
+    see a half-written copy: ones already reading finish on the old file and
+    the replica's pool is swapped for connections to the new one.
+    """
+    primary = engines[None].url.database
+    if not os.path.exists(primary):
+        return
+    for replica in _sqlite_replicas(engines):
+        path = replica.url.database
+        temporary = f'{path}.{os.getpid()}.tmp'
+        source = sqlite3.connect(pathlib.Path(primary).resolve().as_uri() + '?mode=ro', uri=True)
+        target = sqlite3.connect(temporary)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")  # Self-contained: no -wal left beside the copy
+        except BaseException:
+            target.close()
+            os.remove(temporary)
+            raise
+        finally:
+            source.close()
+        target.close()
+        os.replace(temporary, path)
+        replica.dispose()
+
+
+def reserve_ids(connection, table, count):
+    """Allocate `count` primary keys for `table` ahead of a bulk load."""
+    if connection.dialect.name == 'postgresql':
+        sequence = func.pg_get_serial_sequence(table.name, 'id')
+        return list(connection.scalars(select(func.nextval(sequence)).select_from(func.generate_series(1, count))))
+    # SQLite: the caller holds the write lock, so nobody else can take these
+    start = connection.scalar(select(func.coalesce(func.max(table.c.id), 0))) + 1
+    return list(range(start, start + count))
+
+
+def bulk_insert(connection, table, rows):
+    """Insert many rows (dicts) into `table` as fast as the database allows.
+
+    PostgreSQL gets a single COPY ... FROM STDIN; elsewhere it is an
+    executemany, which SQLAlchemy batches into multi-row INSERTs.
+    """
+    if not rows:
+        return
+    if connection.dialect.name != 'postgresql':
+        connection.execute(table.insert(), rows)
+        return
+
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([r'\N' if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+
+    statement = (f"COPY {table.name} ({', '.join(columns)}) FROM STDIN "
+                 f"WITH (FORMAT csv, NULL '\\N')")
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):  # psycopg2
+            cursor.copy_expert(statement, buffer)
+        else:  # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+class RoutingSession(Session):
+    """Session sending reads to a read-only engine and writes to the primary.
+
+    Each session (one per request) reads from one randomly picked replica,
+    or the SQLite reader pool when there are none. Once it has written, its
+    reads stay on the primary so they see its own changes. The SQLite readers
+    see a commit at once, so that lasts until commit or rollback; replicas
+    only see it after replicating, so it lasts for the rest of the request.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+            elif not self.info.get('wrote'):
+                key = self.read_bind()
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def read_bind(self):
+        """The bind key this session reads from, or None to read from the primary."""
+        if 'read_bind' not in self.info:
+            keys = [key for key in self._db.engines if is_read_bind(key)]
+            self.info['read_bind'] = random.choice(keys) if keys else None
+        return self.info['read_bind']
+
+
+def use_primary(session):
+    """Send the rest of `session`'s statements to the primary, e.g. before raw-connection writes."""
+    session.info['wrote'] = True
+
+
+def primary_connection(session):
+    """`session`'s connection to the primary, for flush hooks and other writes that bypass the ORM."""
+    use_primary(session)
+    return session.connection()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def _end_write(session):
+    if session.read_bind() == READER_BIND:
+        session.info.pop('wrote', None)
@@ -0,0 +1,145 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Tests run the app against the database DATABASE_URL names, with the schema
+# the migrations build: a throwaway SQLite file unless it is set. From
+# backend/:
+#
+#   python -m pytest tests
+#   DATABASE_URL=postgresql+psycopg2://localhost/terralink_test python -m pytest tests
+#
+# Every table is emptied after each test, so only point DATABASE_URL at a
+# database you can lose. Tests of PostgreSQL-only paths (see
+# test_postgres.py) are skipped on SQLite.
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_scratch = tempfile.mkdtemp(prefix='terralink-tests-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_scratch, 'terralink.db'))
+os.environ.setdefault('IMAGE_STORE', os.path.join(_scratch, 'images'))
+os.environ.setdefault('IMAGE_BASE_URL', 'http://localhost/images')
+
+
+@pytest.fixture(scope='session')
+def app():
+    os.chdir(BACKEND)  # auth reads firebase_credentials.json and migrations/ relative to it
+    import auth
+    from flask_migrate import upgrade
+
+    auth.app.config['TESTING'] = True
+    with auth.app.app_context():
+        upgrade()
+    return auth.app
+
+
+@pytest.fixture
+def db(app):
+    """The app's database, emptied once the test is done."""
+    import auth
+    import fuzzy
+    import geo
+    import search
+
+    yield auth.db
+    with app.app_context():
+        auth.db.session.remove()
+        with auth.db.engine.begin() as connection:
+            for table in reversed(auth.db.metadata.sorted_tables):
+                if table is not auth.ChangeCount.__table__:  # Counts on; the indexes are invalidated below
+                    connection.execute(table.delete())
+            connection.execute(auth.SearchAlias.__table__.insert(),
+                               [{'alias': alias, 'canonical': canonical} for alias, canonical in fuzzy.DEFAULT_ALIASES])
+            search.rebuild(connection)
+            geo.rebuild(connection)
+    auth.explore_cache.clear()
+    auth.identities.entries.clear()
+    for index in (auth.listing_index, auth.location_index, auth.fuzzy_index):
+        index.invalidate()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(app):
+    """headers(role, id): request headers signed in as that buyer or seller."""
+    import auth
+
+    def headers(role, user_id):
+        return {'Authorization': 'Bearer ' + auth.session_tokens.issue(role, user_id)}
+    return headers
+
+
+@pytest.fixture
+def seller(app, db):
+    """The id of a seller."""
+    import auth
+    with app.app_context():
+        seller = auth.Seller(firebase_uid='seller-uid', name='Seller', email='seller@example.com')
+        db.session.add(seller)
+        db.session.commit()
+        return seller.id
+
+
+@pytest.fixture
+def buyer(app, db):
+    """The id of a buyer."""
+    import auth
+    with app.app_context():
+        buyer = auth.Buyer(firebase_uid='buyer-uid', name='Buyer', email='buyer@example.com', phone='9000000000')
+        db.session.add(buyer)
+        db.session.commit()
+        return buyer.id
+
+
+@pytest.fixture
+def add_listings(app, db):
+    """add_listings(seller_id, count, **fields): add `count` listings saved through the ORM, returning their ids.
+
+    `fields` override the defaults; a callable is called with the listing's number.
+    """
+    import auth
+
+    def add_listings(seller_id, count, **fields):
+        with app.app_context():
+            listings = []
+            for i in range(count):
+                values = {
+                    'name': f'Plot {i}', 'owner_name': 'Owner', 'location': 'Pune, Maharashtra',
+                    'address': f'{i} Main Road', 'price_range': '45 Lakh', 'size': '1200 sq ft',
+                    'property_type': 'Houses', 'description': f'Corner plot number {i}', 'contacts': '9000000000',
+                    'amenities': ['Water', 'Parking'], 'images': [f'https://example.com/{i}.jpg'],
+                }
+                values.update({name: value(i) if callable(value) else value for name, value in fields.items()})
+                amenities, urls = values.pop('amenities'), values.pop('images')
+                listing = auth.Property(seller_id=seller_id, **values)
+                listing.set_price_and_size()
+                listing.set_images(urls)
+                listing.amenities = auth.get_amenities(amenities)
+                db.session.add(listing)
+                db.session.flush()
+                listings.append(listing.id)
+            db.session.commit()
+            return listings
+    return add_listings
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements run on any engine while the test runs, in order."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(Engine, 'before_cursor_execute', record)
@@ -0,0 +1,179 @@
+import random
+
+import pytest
+from sqlalchemy import select, update
+
+import bitmaps
+from bitmaps import ARRAY_MAX, CHUNK_BITS, Bitmap
+
+# The bitmap index must agree with SQL: its set operations with Python sets,
+# its filter expressions with their clause(), and its updates with a rebuild.
+
+
+@pytest.fixture
+def index(app):
+    import auth
+    return auth.listing_index
+
+
+def test_parse_precedence(index):
+    # AND (or nothing) binds tighter than OR; NOT tighter than both
+    assert index.parse('type:Flats OR type:Houses amenity:Pool') == (
+        'or', ('term', 'type', 'Flats'), ('and', ('term', 'type', 'Houses'), ('term', 'amenity', 'Pool')))
+    assert index.parse('NOT amenity:Pool AND (type:Flats OR type:Land)') == (
+        'and', ('not', ('term', 'amenity', 'Pool')), ('or', ('term', 'type', 'Flats'), ('term', 'type', 'Land')))
+    assert index.parse('not not negotiable:yes') == ('not', ('not', ('term', 'negotiable', True)))
+
+
+def test_parse_values(index):
+    assert index.parse('location:"Pune, Maharashtra"') == ('term', 'location', 'Pune, Maharashtra')
+    assert index.parse(r'location:"Say \"Hi\""') == ('term', 'location', 'Say "Hi"')
+    assert index.parse('negotiable:0') == ('term', 'negotiable', False)
+    assert index.parse('price:500000') == ('term', 'price', index.price_edges.index(500000))
+
+
+@pytest.mark.parametrize('text, message', [
+    ('', 'Empty'),
+    ('colour:red', 'Unknown filter field'),
+    ('negotiable:maybe', 'negotiable must be'),
+    ('price:123', 'price must be the lower bound'),
+    ('(type:Flats', 'Unbalanced'),
+    ('type:Flats)', 'Unbalanced'),
+    ('type:Flats OR', 'Incomplete'),
+    ('Flats', 'Expected field:value'),
+    ('type:Flats & amenity:Pool', "Unexpected '&'"),
+])
+def test_parse_errors(index, text, message):
+    with pytest.raises(ValueError, match=message):
+        index.parse(text)
+
+
+def sample(rnd, high, count):
+    base = high << CHUNK_BITS
+    return {base | rnd.randrange(1 << CHUNK_BITS) for _ in range(count)}
+
+
+@pytest.fixture
+def sets():
+    """Id sets with sparse (array) and dense (bitset) chunks, overlapping in some chunks and not others."""
+    rnd = random.Random(7)
+    a = sample(rnd, 0, 50) | sample(rnd, 1, ARRAY_MAX + 500) | sample(rnd, 3, 10)
+    b = sample(rnd, 0, ARRAY_MAX + 100) | sample(rnd, 1, 40) | sample(rnd, 2, 5)
+    return a, b
+
+
+def test_bitmap_containers(sets):
+    a, b = sets
+    bitmap = Bitmap.of(a)
+    assert isinstance(bitmap.chunks[0], frozenset)
+    assert isinstance(bitmap.chunks[1], int)
+    assert list(bitmap) == sorted(a)
+    assert len(bitmap) == len(a)
+
+
+def test_bitmap_set_operations(sets):
+    a, b = sets
+    x, y = Bitmap.of(a), Bitmap.of(b)
+    for result, expected in [(x & y, a & b), (y & x, a & b), (x | y, a | b), (x - y, a - b), (y - x, b - a)]:
+        assert list(result) == sorted(expected)
+        assert len(result) == len(expected)
+    # Chunks emptied by an operation are dropped
+    assert 3 not in (x & y).chunks
+    assert all(id in x for id in list(a)[:100]) and max(a | b) + 1 not in x
+
+
+def test_bitmap_descending_and_updates(sets):
+    a, _ = sets
+    bitmap = Bitmap.of(a)
+    below = sorted(a)[len(a) // 2]
+    assert list(bitmap.descending()) == sorted(a, reverse=True)
+    assert list(bitmap.descending(below)) == sorted((id for id in a if id < below), reverse=True)
+
+    dense_id = next(id for id in a if id >> CHUNK_BITS == 1)
+    assert dense_id not in bitmap.removing(dense_id) and dense_id in bitmap  # Immutable
+    assert list(bitmap.removing(dense_id).adding(dense_id)) == sorted(a)
+    assert list(Bitmap.of([5]).removing(5)) == [] and not Bitmap.of([5]).removing(5).chunks
+
+
+EXPRESSIONS = [
+    'type:Flats',
+    'amenity:Pool OR amenity:Gym',
+    'NOT amenity:Pool',
+    'location:"Pune, Maharashtra" negotiable:true',
+    'price:1000000 OR price:0',
+    'NOT price:1000000',
+    '(type:Houses OR type:Land) NOT location:"Mumbai, Maharashtra"',
+]
+
+
+def agree(app, index):
+    """Check evaluate() and clause() select the same listings for every expression."""
+    import auth
+    with app.app_context():
+        connection = auth.db.session.connection()
+        for text in EXPRESSIONS:
+            tree = index.parse(text)
+            by_sql = set(connection.scalars(select(auth.Property.id).where(index.clause(tree))))
+            assert set(index.evaluate(connection, tree)) == by_sql, text
+
+
+def test_index_agrees_with_sql(app, seller, add_listings, index):
+    import auth
+    rnd = random.Random(3)
+    listings = add_listings(
+        seller, 40,
+        property_type=lambda i: rnd.choice(['Flats', 'Houses', 'Land']),
+        location=lambda i: rnd.choice(['Pune, Maharashtra', 'Mumbai, Maharashtra']),
+        negotiable=lambda i: rnd.random() < 0.5,
+        price_range=lambda i: rnd.choice(['80,000', '12 Lakh', '15 Lakh', 'Price on request']),
+        amenities=lambda i: rnd.sample(['Pool', 'Gym', 'Water'], rnd.randrange(3)),
+    )
+    agree(app, index)
+    built_at = index.built_at
+
+    # Changes this process commits are applied to the bitmaps, without a rebuild
+    with app.app_context():
+        changed = auth.db.session.get(auth.Property, listings[0])
+        changed.property_type, changed.negotiable = 'Land', not changed.negotiable
+        changed.price_range = '1.5 Cr'
+        changed.set_price_and_size()
+        changed.amenities = auth.get_amenities(['Pool'])
+        auth.db.session.delete(auth.db.session.get(auth.Property, listings[1]))
+        auth.db.session.commit()
+    assert index.built_at == built_at + 1
+    agree(app, index)
+    assert index.built_at == built_at + 1
+
+
+def test_other_processes_changes(app, client, seller, add_listings, index):
+    import auth
+    listing, = add_listings(seller, 1, property_type='Houses')
+    assert [p['id'] for p in client.get('/explore?type=Houses').json['properties']] == [listing]
+
+    # Another worker changes the listing: this one's session hooks never see it
+    with app.app_context():
+        with auth.db.engine.begin() as connection:
+            connection.execute(update(auth.Property).where(auth.Property.id == listing).values(property_type='Flats'))
+            auth.listing_changes.bump(connection)
+        connection = auth.db.session.connection()
+        assert list(index.evaluate(connection, index.parse('type:Flats'))) == [listing]
+        assert not index.evaluate(connection, index.parse('type:Houses'))
+
+    auth.explore_cache.clear()
+    assert [p['id'] for p in client.get('/explore?type=Flats').json['properties']] == [listing]
+
+
+def test_explore_answers_from_sql_during_a_rebuild(app, client, seller, add_listings, index):
+    listing, = add_listings(seller, 1, property_type='Houses')
+    index.invalidate()
+    with index.lock:  # Another request is rebuilding
+        with app.app_context():
+            import auth
+            assert index.evaluate(auth.db.session.connection(), index.parse('type:Houses'), wait=False) is None
+        assert [p['id'] for p in client.get('/explore?type=Houses').json['properties']] == [listing]
+
+
+def test_all_of():
+    assert bitmaps.all_of([]) is None
+    assert bitmaps.all_of([('term', 'type', 'A'), ('term', 'type', 'B')]) == (
+        'and', ('term', 'type', 'A'), ('term', 'type', 'B'))
@@ -0,0 +1,102 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from cache import ResponseCache
+
+# Cached /explore pages: served without touching the database until a
+# commit changes listings, and revalidated with ETags.
+
+UPLOAD = {'name': 'New Plot', 'owner_name': 'Owner', 'location': 'Pune, Maharashtra', 'address': '1 Main Road',
+          'price_range': '45 Lakh', 'size': '1200 sq ft', 'type': 'Houses', 'description': 'A plot',
+          'contacts': '9000000000'}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_response_cache():
+    clock = Clock()
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+    key = cache.key('/explore', MultiDict([('type', 'Plots'), ('q', 'pune'), ('cursor', '')]))
+    assert key == cache.key('/explore', MultiDict([('q', 'pune'), ('type', 'Plots')]))
+
+    cache.put(key, b'{}', 'application/json', cache.generation)
+    assert cache.get(key).body == b'{}'
+    clock.now = 10
+    assert cache.get(key) is None  # Expired
+
+    # A page computed before an invalidation isn't stored
+    generation = cache.generation
+    cache.clear()
+    cache.put(key, b'{}', 'application/json', generation)
+    assert cache.get(key) is None
+
+    for page in ('a', 'b', 'c'):
+        cache.put(('/explore', page), page.encode(), 'application/json', cache.generation)
+    assert list(cache.entries) == [('/explore', 'b'), ('/explore', 'c')]
+
+
+@pytest.fixture
+def explore(client, statements):
+    """explore(): GET /explore, and whether it was answered from the cache."""
+    def explore():
+        del statements[:]
+        response = client.get('/explore')
+        assert response.status_code == 200
+        return sorted(p['name'] for p in response.json['properties']), not statements
+    return explore
+
+
+def test_changes_invalidate(client, headers, seller, add_listings, explore):
+    listing, = add_listings(seller, 1, name='Old Plot')
+    seller_headers = headers('seller', seller)
+    assert explore() == (['Old Plot'], False)
+    assert explore() == (['Old Plot'], True)
+
+    assert client.post('/upload', json=UPLOAD, headers=seller_headers).status_code == 201
+    assert explore() == (['New Plot', 'Old Plot'], False)
+    assert explore()[1]
+
+    assert client.put(f'/upload/update/{listing}', json={'name': 'Renamed Plot'},
+                      headers=seller_headers).status_code == 200
+    assert explore() == (['New Plot', 'Renamed Plot'], False)
+    assert explore()[1]
+
+    assert client.delete(f'/upload/delete/{listing}', headers=seller_headers).status_code == 200
+    assert explore() == (['New Plot'], False)
+
+
+def test_rollback_keeps_cache(app, seller, add_listings, explore):
+    import auth
+    listing, = add_listings(seller, 1, name='Old Plot')
+    explore()
+    with app.app_context():
+        auth.db.session.get(auth.Property, listing).name = 'Renamed Plot'
+        auth.db.session.flush()
+        auth.db.session.rollback()
+    assert explore() == (['Old Plot'], True)
+
+    # A commit of something that isn't a listing keeps it too
+    with app.app_context():
+        auth.db.session.get(auth.Seller, seller).name = 'Renamed Seller'
+        auth.db.session.commit()
+    assert explore() == (['Old Plot'], True)
+
+
+def test_not_modified(client, seller, add_listings):
+    add_listings(seller, 1)
+    response = client.get('/explore')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    response = client.get('/explore', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert client.get('/explore', query_string={'type': 'Plots'}, headers={'If-None-Match': etag}).status_code == 200
+
+    add_listings(seller, 1)
+    assert client.get('/explore', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+from sqlalchemy import select
+
+import clusters
+from clusters import MAX_LATITUDE, MAX_LEVEL, cell, cell_box
+
+# Map clusters kept up to date as listings change must match clusters
+# rebuilt from scratch, and /explore/clusters must read the right level.
+
+
+@pytest.mark.parametrize('latitude, longitude, level, expected', [
+    (0, -180, 1, (0, 1)),
+    (0, 180, 1, (1, 1)),  # The antimeridian stays in the last column
+    (0, 0, 1, (1, 1)),  # Cells include their west and north edges
+    (90, 0, 3, (4, 0)),  # Beyond Web Mercator's limit: the edge rows
+    (-90, 0, 3, (4, 7)),
+    (MAX_LATITUDE, -180, MAX_LEVEL, (0, 0)),
+    (-MAX_LATITUDE, 180, MAX_LEVEL, ((1 << MAX_LEVEL) - 1, (1 << MAX_LEVEL) - 1)),
+    (28.6, 77.2, 0, (0, 0)),
+])
+def test_cell(latitude, longitude, level, expected):
+    assert cell(latitude, longitude, level) == expected
+
+
+def test_cell_box():
+    rnd = random.Random(5)
+    for _ in range(200):
+        latitude, longitude, level = rnd.uniform(-85, 85), rnd.uniform(-180, 180), rnd.randrange(MAX_LEVEL + 1)
+        south, west, north, east = cell_box(*cell(latitude, longitude, level), level)
+        assert south <= latitude <= north and west <= longitude <= east
+    assert cell_box(0, 0, 0) == (-90.0, -180.0, 90.0, 180.0)
+
+
+def snapshot(app):
+    import auth
+    with app.app_context():
+        rows = auth.db.session.execute(select(auth.MapCluster.__table__)).all()
+    return {(r.level, r.x, r.y): (r.count, pytest.approx(r.latitude_sum), pytest.approx(r.longitude_sum),
+                                  r.price_min, r.price_max, r.first_property_id) for r in rows}
+
+
+def rebuilt(app):
+    import auth
+    with app.app_context():
+        with auth.db.engine.begin() as connection:
+            auth.map_clusters.rebuild(connection)
+    return snapshot(app)
+
+
+def test_changes_match_a_rebuild(app, seller, add_listings):
+    import auth
+    rnd = random.Random(11)
+    # Clustered so cells hold several listings, with prices that tie
+    spot = lambda: (18.5 + rnd.choice([0, 0.001, 0.3]), 73.8 + rnd.choice([0, 0.001, 2]))  # noqa: E731
+    listings = add_listings(seller, 30, latitude=lambda i: spot()[0], longitude=lambda i: spot()[1],
+                            price_range=lambda i: rnd.choice(['10 Lakh', '20 Lakh', '1 Cr', 'Price on request']))
+    assert snapshot(app) == rebuilt(app)
+
+    for _ in range(6):
+        with app.app_context():
+            for id in rnd.sample(listings, 4):
+                listing = auth.db.session.get(auth.Property, id)
+                action = rnd.choice(['move', 'reprice', 'unplace', 'delete'])
+                if action == 'move':
+                    listing.latitude, listing.longitude = spot()
+                elif action == 'reprice':
+                    listing.price_range = rnd.choice(['5 Lakh', '20 Lakh', '2 Cr', 'Price on request'])
+                    listing.set_price_and_size()
+                elif action == 'unplace':
+                    listing.latitude = listing.longitude = None
+                else:
+                    auth.db.session.delete(listing)
+                    listings.remove(id)
+            auth.db.session.commit()
+        listings += add_listings(seller, 2, latitude=lambda i: spot()[0], longitude=lambda i: spot()[1])
+        assert snapshot(app) == rebuilt(app)
+
+
+def test_adding_a_listing_takes_few_statements(seller, add_listings, statements):
+    add_listings(seller, 1, latitude=18.5, longitude=73.8)
+    del statements[:]
+    add_listings(seller, 1, latitude=18.6, longitude=73.9)
+    # Not a delete and an insert per level, as recomputing each ancestor would take
+    assert sum('map_cluster' in statement for statement in statements) <= 6
+
+
+def test_explore_clusters(client, seller, add_listings):
+    first, = add_listings(seller, 1, latitude=18.52, longitude=73.85, price_range='40 Lakh')  # Pune
+    add_listings(seller, 2, latitude=19.07, longitude=72.87, price_range=lambda i: ['1 Cr', '2 Cr'][i])  # Mumbai
+
+    def markers(zoom, bbox='72,18,75,20'):
+        response = client.get('/explore/clusters', query_string={'zoom': zoom, 'bbox': bbox})
+        assert response.status_code == 200
+        assert response.json['level'] == clusters.level_for_zoom(zoom)
+        return sorted((m['count'], round(m['latitude'], 2), round(m['longitude'], 2), m['price_min'], m['price_max'],
+                       m.get('id')) for m in response.json['clusters'])
+
+    assert markers(2) == [(3, 18.89, 73.2, 4000000, 20000000, None)]
+    assert markers(10) == [(1, 18.52, 73.85, 4000000, 4000000, first), (2, 19.07, 72.87, 10000000, 20000000, None)]
+    assert markers(10, bbox='73,18,75,19') == [(1, 18.52, 73.85, 4000000, 4000000, first)]
+
+    assert client.get('/explore/clusters', query_string={'zoom': 23, 'bbox': '72,18,75,20'}).status_code == 400
+    assert client.get('/explore/clusters', query_string={'zoom': 5, 'bbox': '75,18,72,20'}).status_code == 400
@@ -0,0 +1,110 @@
+import gzip
+import json
+
+import brotli
+import pytest
+import zstandard
+from werkzeug.test import Client, EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+import compress
+from compress import MINIMUM_SIZE, CompressionMiddleware
+
+# Responses are compressed with the coding the client prefers, only when
+# worth it, and never twice.
+
+BODY = json.dumps([{'id': i, 'name': f'Plot {i}', 'location': 'Pune, Maharashtra'} for i in range(100)]).encode()
+DECOMPRESS = {'gzip': gzip.decompress, 'br': brotli.decompress,
+              'zstd': lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)}
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('gzip, deflate, br, zstd', 'zstd'),
+    ('gzip, br', 'br'),
+    ('gzip;q=1, br;q=0.5', 'gzip'),
+    ('deflate', None),
+    ('gzip;q=0', None),
+    ('*', 'zstd'),
+    ('*, zstd;q=0', 'br'),
+    ('identity, gzip;q=0.5', None),
+    ('identity;q=0, gzip;q=0.5', 'gzip'),
+    ('', None),
+])
+def test_negotiate(accept, expected):
+    assert compress.negotiate(accept) == expected
+
+
+def wsgi(body=BODY, mimetype='application/json', headers=None, status=200):
+    """A WSGI app answering every request with `body`, which may be an iterable of chunks."""
+    @Request.application
+    def app(request):
+        return Response(body, status=status, mimetype=mimetype, headers=headers)
+    return CompressionMiddleware(app)
+
+
+def get(app, coding, method='GET'):
+    return Client(app).open('/', method=method, headers={'Accept-Encoding': coding})
+
+
+@pytest.mark.parametrize('coding', ['gzip', 'br', 'zstd'])
+def test_compressed(coding):
+    response = get(wsgi(headers={'ETag': '"abc"', 'Vary': 'Accept'}), coding)
+    assert response.headers['Content-Encoding'] == coding
+    assert DECOMPRESS[coding](response.data) == BODY
+    assert 'Content-Length' not in response.headers
+    # The compressed bytes aren't the ones the ETag names, so it is only a weak match for them
+    assert response.headers['ETag'] == 'W/"abc"'
+    assert response.headers['Vary'] == 'Accept, Accept-Encoding'
+
+
+@pytest.mark.parametrize('app', [
+    wsgi(body=BODY[:MINIMUM_SIZE - 1]),
+    wsgi(body=[BODY[:100], BODY[100:MINIMUM_SIZE - 1]]),  # Streamed, but short
+    wsgi(mimetype='image/png'),
+    wsgi(headers={'Cache-Control': 'no-transform'}),
+    wsgi(status=206),
+])
+def test_left_alone(app):
+    response = get(app, 'gzip')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data in (BODY, BODY[:MINIMUM_SIZE - 1])
+
+
+def test_not_compressed_twice():
+    response = get(wsgi(body=gzip.compress(BODY), headers={'Content-Encoding': 'gzip', 'ETag': '"abc"'}), 'gzip')
+    assert response.headers['Content-Encoding'] == 'gzip' and response.headers['ETag'] == '"abc"'
+    assert gzip.decompress(response.data) == BODY
+
+
+def test_head():
+    response = get(wsgi(), 'gzip', method='HEAD')
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Length'] == str(len(BODY))
+
+
+def test_streamed():
+    produced = []
+
+    def chunks():
+        for i in range(0, len(BODY), 600):
+            produced.append(i)
+            yield BODY[i:i + 600]
+
+    environ = EnvironBuilder(headers={'Accept-Encoding': 'gzip'}).get_environ()
+    output = iter(wsgi(body=chunks())(environ, lambda status, headers, exc_info=None: None))
+    first = next(output)
+    # Compressed as it goes, not after reading the whole body
+    assert first and len(produced) < len(range(0, len(BODY), 600))
+    assert gzip.decompress(first + b''.join(output)) == BODY
+
+
+def test_cached_pages_compressed_once(client, seller, add_listings):
+    add_listings(seller, 30)
+    response = client.get('/explore', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/')
+    assert len(json.loads(gzip.decompress(response.data))['properties']) == 24
+
+    etag = response.headers['ETag']
+    response = client.get('/explore', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
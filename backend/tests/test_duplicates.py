@@ -0,0 +1,104 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+import duplicates
+from test_jobs import photo_url, process
+
+# A listing uploaded again, its text lightly edited or its photos re-encoded,
+# is flagged as a duplicate of the first; unrelated listings aren't.
+
+TEXT = ('Spacious three bedroom villa with a private garden and covered parking, ten minutes from the '
+        'metro station, close to schools and the city hospital, with water and power backup all day. '
+        'The living room opens onto a wide terrace facing the hills, the kitchen is fitted with granite '
+        'counters and a chimney, and every bedroom has its own bathroom and built in wardrobes. '
+        'Gated society with security, a clubhouse and a swimming pool')
+EDITED = TEXT.replace('ten minutes', 'five minutes')
+OTHER = ('Agricultural land on the highway with a borewell, mango trees and a farmhouse, clear title '
+         'and approved for conversion, good road access and fencing on every side of the plot')
+
+
+def flagged(app, listing):
+    import auth
+    with app.app_context():
+        return auth.db.session.get(auth.Property, listing).duplicate_of_id
+
+
+def test_signature():
+    assert duplicates.similarity(duplicates.signature('Villa', 'Pune', TEXT),
+                                 duplicates.signature('Villa', 'Pune', EDITED)) >= duplicates.TEXT_SIMILARITY
+    assert duplicates.similarity(duplicates.signature('Villa', 'Pune', TEXT),
+                                 duplicates.signature('Farm', 'Nashik', OTHER)) < 0.2
+    assert duplicates.signature('2 BHK', 'Pune', 'Flat for sale') is None  # Too short to tell
+
+
+def test_edited_text(app, seller, add_listings):
+    original, = add_listings(seller, 1, name='Villa', address='Baner, Pune', description=TEXT)
+    edited, other = add_listings(seller, 2, name=lambda i: ['Villa', 'Farm'][i],
+                                 address=lambda i: ['Baner, Pune', 'Nashik Road'][i],
+                                 description=lambda i: [EDITED, OTHER][i])
+    assert flagged(app, original) is None
+    assert flagged(app, edited) == original
+    assert flagged(app, other) is None
+
+    # Edited until it isn't the same listing any more
+    import auth
+    with app.app_context():
+        listing = auth.db.session.get(auth.Property, edited)
+        listing.name, listing.address, listing.description = 'Farm', 'Nashik Road', OTHER.replace('mango', 'coconut')
+        auth.db.session.commit()
+    assert flagged(app, edited) == other
+
+
+def photo(seed, scale=1.0, format='PNG'):
+    """A noisy test photo, the same for a seed; scaled and re-encoded, it still looks the same."""
+    rnd = random.Random(seed)
+    small = Image.new('L', (8, 8))
+    small.putdata([rnd.randrange(256) for _ in range(64)])
+    image = small.resize((int(320 * scale), int(240 * scale)), Image.Resampling.BICUBIC).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(app):
+    import auth
+    return auth.image_store
+
+
+def test_same_photos(app, db, seller, add_listings, store):
+    # Texts too short to compare, so only the photos can tell
+    original, = add_listings(seller, 1, description='Plot',
+                             images=[photo_url(photo(1), store), photo_url(photo(2), store)])
+    copy, other = add_listings(seller, 2, description='Land for sale', images=lambda i: [
+        [photo_url(photo(1, 0.5, 'JPEG'), store), photo_url(photo(3), store)],
+        [photo_url(photo(4), store)],
+    ][i])
+    assert flagged(app, copy) is None  # Until the worker has hashed the photos
+    process(app)
+    assert flagged(app, copy) == original
+    assert flagged(app, other) is None
+
+
+def test_writes_go_to_the_primary(app, db, seller, add_listings):
+    import auth
+    with app.app_context():
+        engines = [engine for key, engine in auth.db.engines.items() if key is not None]
+    if not engines:
+        pytest.skip('Reads go to the primary')
+    on_readers = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        on_readers.append(statement)
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        add_listings(seller, 2, description=lambda i: TEXT)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+    assert not [statement for statement in on_readers if 'duplicate_bucket' in statement]
@@ -0,0 +1,83 @@
+import pytest
+
+import fuzzy
+
+# Typo-tolerant search: misspellings and alternate names find the listings
+# the words as typed would miss, and never widen a search that already
+# matches something.
+
+
+@pytest.mark.parametrize('a, b, expected', [
+    ('mumbai', 'mumbay', True),  # Replace
+    ('andheri', 'andehri', True),  # Swap
+    ('bangalore', 'bangalor', True),  # Delete
+    ('pune', 'puune', True),  # Insert
+    ('pune', 'pune', False),
+    ('pune', 'pnu', False),
+    ('mumbai', 'nambai', False),
+])
+def test_one_edit_apart(a, b, expected):
+    assert fuzzy.one_edit_apart(a, b) == expected
+    assert fuzzy.one_edit_apart(b, a) == expected
+
+
+def test_vocabulary_spelling():
+    vocabulary = fuzzy.Vocabulary([('mumbai', 10), ('mumbra', 2), ('pune', 4), ('road', 9), ('1200', 3)],
+                                  [('bombay', 'mumbai'), ('rd', 'road')])
+    assert next(iter(vocabulary.similar('mumbay'))) == 'mumbai'  # Most similar first
+    assert vocabulary.similar('1200') == {}  # Numbers aren't in the vocabulary
+    # Aliases work both ways
+    assert vocabulary.spell('bombay').aliases == {'mumbai'}
+    assert vocabulary.spell('mumbai').aliases == {'bombay'}
+    # Short words are matched only as typed, or through their aliases
+    assert vocabulary.spell('rd').alternatives() == ['rd', 'road']
+    assert vocabulary.spell('pn').alternatives() == ['pn']
+
+
+def names(response):
+    assert response.status_code == 200, response.json
+    return sorted(p['name'] for p in response.json['properties'])
+
+
+@pytest.fixture
+def listings(seller, add_listings):
+    add_listings(seller, 1, name='Lake View', location='Bengaluru, Karnataka')
+    add_listings(seller, 1, name='Garden Flat', location='Bangalore, Karnataka')
+    add_listings(seller, 1, name='Station Flat', location='Andheri West, Mumbai')
+    add_listings(seller, 1, name='Metro Flat', location='Andheri W, Mumbai')
+
+
+@pytest.mark.parametrize('path', ['/search', '/explore'])
+def test_aliases(client, listings, path):
+    # Each spelling finds its own listing as typed, and only that
+    assert names(client.get(path, query_string={'q': 'bengaluru', 'fuzzy': '1'})) == ['Lake View']
+    assert names(client.get(path, query_string={'q': 'bangalore', 'fuzzy': '1'})) == ['Garden Flat']
+    # Together they match nothing as typed, so each word takes its alias
+    assert names(client.get(path, query_string={'q': 'bengaluru bangalore', 'fuzzy': '1'})) == ['Garden Flat',
+                                                                                                'Lake View']
+    assert names(client.get(path, query_string={'q': 'bengaluru bangalore'})) == []
+
+    # "w" matches "West" as a prefix; "west" finds "W" only through the alias
+    assert names(client.get(path, query_string={'q': 'andheri w', 'fuzzy': '1'})) == ['Metro Flat', 'Station Flat']
+    assert names(client.get(path, query_string={'q': 'metro andheri west', 'fuzzy': '1'})) == ['Metro Flat']
+    assert names(client.get(path, query_string={'q': 'metro andheri west'})) == []
+
+
+@pytest.mark.parametrize('path', ['/search', '/explore'])
+def test_misspellings(client, listings, path):
+    assert names(client.get(path, query_string={'q': 'andehri station', 'fuzzy': '1'})) == ['Station Flat']
+    assert names(client.get(path, query_string={'q': 'andehri station'})) == []
+
+
+def test_other_processes_aliases(app, client, listings):
+    import auth
+    assert names(client.get('/search', query_string={'q': 'garden bengaluru', 'fuzzy': '1'})) == ['Garden Flat']
+    assert names(client.get('/search', query_string={'q': 'lake silicon', 'fuzzy': '1'})) == []
+
+    # Another worker adds an alias: this one's vocabulary must pick it up
+    with app.app_context():
+        with auth.db.engine.begin() as connection:
+            connection.execute(auth.SearchAlias.__table__.insert().values(alias='silicon', canonical='bengaluru'))
+            auth.listing_changes.bump(connection)
+    auth.explore_cache.clear()
+    assert names(client.get('/search', query_string={'q': 'lake silicon', 'fuzzy': '1'})) == ['Lake View']
@@ -0,0 +1,144 @@
+import pytest
+from itsdangerous import BadSignature, SignatureExpired, TimestampSigner
+
+from identity import Identity, IdentityCache, SessionTokens
+
+# Session tokens name the caller; bad ones make the caller anonymous, which
+# only endpoints needing a login refuse.
+
+
+@pytest.fixture
+def expired_token(app, monkeypatch):
+    """expired_token(role, id): a session token issued two hours ago."""
+    import auth
+
+    def expired_token(role, user_id):
+        now = TimestampSigner.get_timestamp
+        with monkeypatch.context() as m:
+            m.setattr(TimestampSigner, 'get_timestamp', lambda self: now(self) - 2 * auth.session_tokens.max_age)
+            return auth.session_tokens.issue(role, user_id)
+    return expired_token
+
+
+def test_tokens_load():
+    tokens = SessionTokens('secret')
+    token = tokens.issue('buyer', 7)
+    assert tokens.load(token) == ('buyer', 7)
+    with pytest.raises(BadSignature):
+        tokens.load(token[:-2] + ('A' if token[-2] != 'A' else 'B') + token[-1])
+    with pytest.raises(BadSignature):
+        SessionTokens('other secret').load(token)
+
+
+def test_tokens_expire(expired_token):
+    import auth
+    with pytest.raises(SignatureExpired):
+        auth.session_tokens.load(expired_token('buyer', 1))
+
+
+def test_login_required(client, headers, buyer, seller, expired_token):
+    assert client.post('/cart', headers=headers('buyer', buyer)).status_code == 200
+
+    def error(response, status):
+        assert response.status_code == status
+        return response.json['error']
+
+    assert error(client.post('/cart'), 401) == 'Login required'
+    assert error(client.post('/cart', headers={'Authorization': 'Bearer nonsense'}), 401) == 'Invalid session token'
+    expired = {'Authorization': 'Bearer ' + expired_token('buyer', buyer)}
+    assert error(client.post('/cart', headers=expired), 401) == 'Session expired'
+    assert error(client.post('/cart', headers=headers('buyer', buyer + 100)), 401) == 'Unknown user'
+    # A seller is someone, just not a buyer
+    assert error(client.post('/cart', headers=headers('seller', seller)), 403) == 'Only a buyer can do this'
+
+
+def test_public_endpoints_ignore_bad_tokens(client, buyer, expired_token):
+    for token in ['nonsense', expired_token('buyer', buyer)]:
+        response = client.get('/explore', headers={'Authorization': 'Bearer ' + token})
+        assert response.status_code == 200
+        assert response.json['properties'] == []
+
+
+def test_request_body_cannot_name_another_buyer(app, client, headers, buyer, seller, add_listings):
+    import auth
+    listing, = add_listings(seller, 1)
+    with app.app_context():
+        other = auth.Buyer(firebase_uid='other-uid', name='Other', email='other@example.com', phone='9000000001')
+        auth.db.session.add(other)
+        auth.db.session.commit()
+        other = other.id
+
+    response = client.post('/cart/add', json={'property_id': listing, 'buyer_id': other},
+                           headers=headers('buyer', buyer))
+    assert response.status_code == 201
+    with app.app_context():
+        assert [(c.buyer_id, c.property_id) for c in auth.Cart.query] == [(buyer, listing)]
+    assert client.delete(f'/cart/{other}/{listing}', headers=headers('buyer', buyer)).status_code == 403
+
+
+def test_refresh(client, headers, buyer, expired_token):
+    response = client.post('/session/refresh', headers=headers('buyer', buyer))
+    assert response.status_code == 200
+    fresh = {'Authorization': 'Bearer ' + response.json['session_token']}
+    assert client.post('/cart', headers=fresh).status_code == 200
+
+    # Once expired, only logging in again gives a new token
+    response = client.post('/session/refresh', headers={'Authorization': 'Bearer ' + expired_token('buyer', buyer)})
+    assert response.status_code == 401
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_identity_cache():
+    loads = []
+
+    def loader(role, user_id):
+        loads.append((role, user_id))
+        return Identity(role, user_id, f'User {user_id}') if user_id < 100 else None
+
+    clock = Clock()
+    cache = IdentityCache(loader, max_entries=2, ttl=60, clock=clock)
+    assert cache.get('buyer', 1) == Identity('buyer', 1, 'User 1')
+    assert cache.get('buyer', 1) and loads == [('buyer', 1)]
+    assert cache.get('buyer', 100) is None and cache.get('buyer', 100) is None  # Unknown users aren't cached
+    assert loads.count(('buyer', 100)) == 2
+
+    clock.now = 61
+    cache.get('buyer', 1)
+    assert loads.count(('buyer', 1)) == 2
+
+    cache.get('seller', 1)
+    cache.get('buyer', 2)  # Evicts the least recently used
+    assert list(cache.entries) == [('seller', 1), ('buyer', 2)]
+    cache.forget('seller', 1)
+    assert list(cache.entries) == [('buyer', 2)]
+
+
+def test_changed_users_are_forgotten(app, client, headers, buyer):
+    import auth
+    assert client.post('/session/refresh', headers=headers('buyer', buyer)).status_code == 200
+    assert ('buyer', buyer) in auth.identities.entries
+
+    with app.app_context():
+        auth.db.session.get(auth.Buyer, buyer).name = 'Renamed'
+        auth.db.session.flush()
+        auth.db.session.rollback()
+    assert ('buyer', buyer) in auth.identities.entries
+
+    with app.app_context():
+        auth.db.session.get(auth.Buyer, buyer).name = 'Renamed'
+        auth.db.session.commit()
+    assert ('buyer', buyer) not in auth.identities.entries
+
+    assert client.post('/session/refresh', headers=headers('buyer', buyer)).status_code == 200
+    assert auth.identities.entries[('buyer', buyer)][0].name == 'Renamed'
+    with app.app_context():
+        auth.db.session.delete(auth.db.session.get(auth.Buyer, buyer))
+        auth.db.session.commit()
+    assert client.post('/session/refresh', headers=headers('buyer', buyer)).status_code == 401
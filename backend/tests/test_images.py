@@ -0,0 +1,145 @@
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+import images
+from images import DerivativeCache, ImageStore
+
+# Photos in the image store: uploads kept once each under their content's
+# hash, which URLs are ours, and the scaled-down derivatives made on first
+# request and evicted least recently used first.
+
+BASE_URL = 'http://localhost/images'
+
+
+def png(color, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def put(store, data):
+    """Store `data` as an image, as an upload would; returns its name."""
+    name = f'{hashlib.sha256(data).hexdigest()}.png'
+    os.makedirs(os.path.dirname(store.path(name)), exist_ok=True)
+    with open(store.path(name), 'wb') as f:
+        f.write(data)
+    return name
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(str(tmp_path), BASE_URL + '/')
+
+
+def test_stored_name(store):
+    name = 'ab' * 32 + '.jpg'
+    assert store.url(name) == f'{BASE_URL}/{name}'
+    assert store.stored_name(f'{BASE_URL}/{name}') == name
+    assert store.variant_url(f'{BASE_URL}/{name}', 'thumb') == f'{BASE_URL}/{name}/thumb'
+    # The same path on another site, or beside ours, is someone else's photo
+    for url in [f'https://example.com/images/{name}', f'http://localhost/other/images/{name}',
+                f'http://localhost.example.com/images/{name}', f'/images/{name}', f'{BASE_URL}/{name}/thumb']:
+        assert store.stored_name(url) is None
+        assert store.variant_url(url, 'thumb') == url
+
+
+def test_derivatives(store, monkeypatch):
+    made = []
+    derive = images.derive
+    monkeypatch.setattr(images, 'derive', lambda source, width, destination: (made.append(width),
+                                                                               derive(source, width, destination)))
+    cache = DerivativeCache(store)
+    name = put(store, png('red', size=(640, 480)))
+
+    path = cache.get(name, 'thumb')
+    with Image.open(path) as image:
+        assert (image.format, image.size) == ('WEBP', (160, 120))
+    assert cache.get(name, 'thumb') == path and made == [160]  # Made once, then served from disk
+    with Image.open(cache.get(name, 'detail')) as image:
+        assert image.size == (640, 480)  # Never scaled up
+    assert made == [160, 1280]
+
+    assert cache.get(name, 'huge') is None
+    assert cache.get('cd' * 32 + '.png', 'thumb') is None
+
+
+def test_derivatives_evicted_least_recently_used(store):
+    now = 1_000_000_000.0
+    cache = DerivativeCache(store, clock=lambda: now)
+    old, older, newer = (put(store, png(color)) for color in ('red', 'green', 'blue'))
+    paths = {}
+    for age, name in [(3, old), (2, older), (1, newer)]:
+        paths[name] = cache.get(name, 'thumb')
+        os.utime(paths[name], (now - age * images.TOUCH_INTERVAL,) * 2)
+
+    # A hit marks the oldest recently used again
+    assert cache.get(old, 'thumb') == paths[old]
+    assert os.stat(paths[old]).st_mtime > now - images.TOUCH_INTERVAL
+
+    # Full: the next derivative makes room by deleting the least recently used ones
+    cache.max_bytes = sum(os.path.getsize(path) for path in paths.values())
+    latest = put(store, png('white'))
+    assert os.path.exists(cache.get(latest, 'thumb'))
+    assert [name for name, path in paths.items() if os.path.exists(path)] == [old]
+    assert cache.size <= cache.max_bytes * images.EVICT_TO
+    assert cache.get(older, 'thumb') == paths[older]  # Made again when asked for
+
+
+def upload_request(files, truncate=None):
+    """A multipart/form-data request with `files` [(filename, bytes)], its body cut to `truncate` bytes if given."""
+    builder = EnvironBuilder(method='POST', data={'images': [(io.BytesIO(data), name) for name, data in files]})
+    environ = builder.get_environ()
+    if truncate is not None:
+        body = environ['wsgi.input'].read()[:truncate]
+        environ['wsgi.input'], environ['CONTENT_LENGTH'] = io.BytesIO(body), str(len(body))
+    return Request(environ)
+
+
+def stored_files(store):
+    return sorted(name for _, _, names in os.walk(store.root) for name in names)
+
+
+def test_receive(store):
+    red, blue = png('red'), png('blue')
+    names = store.receive(upload_request([('a.png', red), ('b.png', blue), ('again.png', red)]))
+    digest = hashlib.sha256(red).hexdigest()
+    assert names == [f'{digest}.png', f'{hashlib.sha256(blue).hexdigest()}.png', f'{digest}.png']
+    # Named by content, so the same photo is kept once however often it comes
+    assert store.receive(upload_request([('a copy.png', red)])) == [f'{digest}.png']
+    assert stored_files(store) == sorted(set(names))
+    with open(store.path(names[0]), 'rb') as f:
+        assert f.read() == red
+
+
+@pytest.mark.parametrize('files, truncate, error', [
+    ([('a.png', png('red')), ('notes.txt', b'not an image')], None, ValueError),
+    ([('a.png', png('red')), ('b.png', png('blue'))], 400, ValueError),  # Cut off mid-upload
+    ([('a.png', png('red')), ('big.png', b'\x89PNG\r\n\x1a\n' + bytes(2048))], None, RequestEntityTooLarge),
+])
+def test_receive_refused(tmp_path, files, truncate, error):
+    store = ImageStore(str(tmp_path), BASE_URL, max_image_bytes=1024)
+    with pytest.raises(error):
+        store.receive(upload_request(files, truncate))
+    # Nothing kept, not even the files received before the bad one
+    assert stored_files(store) == []
+
+
+def test_upload_images(client, headers, seller):
+    import auth
+    red = png('red')
+    response = client.post('/images', headers=headers('seller', seller),
+                           data={'images': [(io.BytesIO(red), 'a.png')]})
+    assert response.status_code == 201
+    assert response.json['images'] == [auth.image_store.url(f'{hashlib.sha256(red).hexdigest()}.png')]
+
+    response = client.post('/images', headers=headers('seller', seller),
+                           data={'images': [(io.BytesIO(b'%PDF-1.4'), 'plan.pdf')]})
+    assert response.status_code == 400
+    assert response.json['error'] == 'plan.pdf is not a JPEG, PNG, GIF or WebP image'
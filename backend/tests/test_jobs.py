@@ -0,0 +1,82 @@
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import jobs
+from jobs import process_photo
+
+# The photo worker, run as `flask process-images --once` would run it, with
+# a real process pool.
+
+
+def png(color, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def photo_url(data, store=None):
+    """The URL of a photo with content `data`, written to `store` unless None (a photo gone missing)."""
+    name = f'{hashlib.sha256(data).hexdigest()}.png'
+    if store is not None:
+        path = store.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return f'http://localhost/images/{name}'
+
+
+@pytest.fixture
+def store(app):
+    import auth
+    return auth.image_store
+
+
+def job(app, listing):
+    import auth
+    with app.app_context():
+        job = auth.db.session.get(auth.Property, listing).photo_job
+        photos = [(p.width, p.height, p.phash is not None) for p in auth.db.session.get(auth.Property, listing).images]
+        return job.status, job.error, job.done, job.total, job.attempts, photos
+
+
+def process(app):
+    result = app.test_cli_runner().invoke(args=['process-images', '--once', '--processes', '1'])
+    assert result.exit_code == 0, result.output
+
+
+def test_process_images(app, db, seller, add_listings, store):
+    good, corrupt, missing = add_listings(seller, 3, images=lambda i: [
+        [photo_url(png('red'), store), 'https://example.com/elsewhere.jpg'],
+        [photo_url(png('blue'), store), photo_url(b'\x89PNG\r\n\x1a\nnot really', store)],
+        [photo_url(png('green'))],
+    ][i])
+    process(app)
+
+    # Photos hosted elsewhere aren't the worker's to process
+    assert job(app, good) == ('done', None, 1, 1, 1, [(64, 48, True), (None, None, False)])
+    assert job(app, corrupt) == ('failed', "Image can't be decoded", 2, 2, 1, [(64, 48, True), (None, None, False)])
+    assert job(app, missing) == ('failed', "Photo can't be processed", 1, 1, 1, [(None, None, False)])
+
+
+def crash(name):
+    """process_photo for a pool process that dies on the blue photo."""
+    if name == f'{hashlib.sha256(png("blue")).hexdigest()}.png':
+        os._exit(1)
+    return process_photo(name)
+
+
+def test_pool_process_dying(app, db, seller, add_listings, store, monkeypatch):
+    monkeypatch.setattr(jobs, 'process_photo', crash)
+    deadly, = add_listings(seller, 1, images=[photo_url(png('blue'), store)])
+    process(app)
+    # Tried again with a new pool each time, until out of attempts
+    assert job(app, deadly) == ('failed', "Photo can't be processed", 0, 1, jobs.MAX_ATTEMPTS, [(None, None, False)])
+
+    # The worker goes on to later jobs
+    fine, = add_listings(seller, 1, images=[photo_url(png('red'), store)])
+    process(app)
+    assert job(app, fine)[:2] == ('done', None)
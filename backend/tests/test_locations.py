@@ -0,0 +1,95 @@
+from sqlalchemy import select, update
+
+from locations import LocationTrie, normalize
+
+# The location table must count each location's listings as they are added,
+# moved and deleted, and the autocomplete must follow it in every process.
+
+
+def test_normalize():
+    assert normalize('Navi  Mumbai,Maharashtra') == 'navi mumbai maharashtra'
+    assert normalize('  ') == ''
+
+
+def test_trie_prefix_lookup():
+    trie = LocationTrie([('Mumbai, Maharashtra', 5), ('Navi Mumbai, Maharashtra', 9), ('Munnar, Kerala', 2),
+                         ('Pune, Maharashtra', 5)])
+    # Most listings first, then by name
+    assert trie.complete('mu') == [('Navi Mumbai, Maharashtra', 9), ('Mumbai, Maharashtra', 5), ('Munnar, Kerala', 2)]
+    assert trie.complete('MAHA') == [('Navi Mumbai, Maharashtra', 9), ('Mumbai, Maharashtra', 5),
+                                     ('Pune, Maharashtra', 5)]
+    assert trie.complete('navi  mum') == [('Navi Mumbai, Maharashtra', 9)]
+    assert trie.complete('mumbai,maha') == [('Navi Mumbai, Maharashtra', 9), ('Mumbai, Maharashtra', 5)]
+    assert trie.complete('mu', limit=1) == [('Navi Mumbai, Maharashtra', 9)]
+    # Words are matched from their start only
+    assert trie.complete('umbai') == []
+    assert trie.complete('delhi') == []
+
+
+def test_trie_keeps_the_most_popular():
+    trie = LocationTrie([(f'Sector {i}, Noida', i) for i in range(1, 21)])
+    assert [count for _, count in trie.complete('sector')] == list(range(20, 10, -1))
+
+
+def counts(app):
+    import auth
+    with app.app_context():
+        return dict(auth.db.session.execute(select(auth.Location.name, auth.Location.listing_count)).all())
+
+
+def test_counts_follow_inserts_updates_and_deletes(app, db, seller, add_listings):
+    import auth
+    first, second, third = add_listings(seller, 3, location=lambda i: ['Pune', 'Pune', 'Goa'][i])
+    assert counts(app) == {'Pune': 2, 'Goa': 1}
+
+    with app.app_context():
+        auth.db.session.get(auth.Property, first).location = 'Goa'
+        auth.db.session.get(auth.Property, second).location = 'Ooty'
+        auth.db.session.get(auth.Property, third).name = 'Renamed'  # Not a move
+        auth.db.session.commit()
+    assert counts(app) == {'Goa': 2, 'Ooty': 1}
+
+    with app.app_context():
+        auth.db.session.delete(auth.db.session.get(auth.Property, second))
+        auth.db.session.commit()
+    assert counts(app) == {'Goa': 2}
+
+    # A rolled back move leaves the counts as they were
+    with app.app_context():
+        auth.db.session.get(auth.Property, first).location = 'Ooty'
+        auth.db.session.flush()
+        auth.db.session.rollback()
+    assert counts(app) == {'Goa': 2}
+
+
+def test_autocomplete(client, seller, add_listings):
+    add_listings(seller, 2, location='Navi Mumbai, Maharashtra')
+    add_listings(seller, 1, location='Mumbai, Maharashtra')
+
+    response = client.get('/location/autocomplete', query_string={'q': 'mum'})
+    assert response.json['locations'] == [{'name': 'Navi Mumbai, Maharashtra', 'count': 2},
+                                          {'name': 'Mumbai, Maharashtra', 'count': 1}]
+    assert client.get('/location/autocomplete', query_string={'q': 'mum', 'limit': 1}).json['locations'] == [
+        {'name': 'Navi Mumbai, Maharashtra', 'count': 2}]
+    assert client.get('/location/autocomplete', query_string={'q': ' ,'}).status_code == 400
+
+    # Listings added after the trie was built show up
+    add_listings(seller, 3, location='Mumbai, Maharashtra')
+    assert client.get('/location/autocomplete', query_string={'q': 'mum'}).json['locations'][0] == {
+        'name': 'Mumbai, Maharashtra', 'count': 4}
+
+
+def test_other_processes_changes(app, client, seller, add_listings):
+    import auth
+    add_listings(seller, 1, location='Pune, Maharashtra')
+    assert client.get('/location/autocomplete', query_string={'q': 'pu'}).json['locations'] == [
+        {'name': 'Pune, Maharashtra', 'count': 1}]
+
+    # Another worker renames the location: this one's session hooks never see it
+    with app.app_context():
+        with auth.db.engine.begin() as connection:
+            connection.execute(update(auth.Location).values(name='Pune City, Maharashtra'))
+            auth.listing_changes.bump(connection)
+
+    assert client.get('/location/autocomplete', query_string={'q': 'pu'}).json['locations'] == [
+        {'name': 'Pune City, Maharashtra', 'count': 1}]
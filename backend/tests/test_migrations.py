@@ -0,0 +1,41 @@
+from sqlalchemy import text
+
+# Listings from before the amenity and image tables, their amenities and
+# photos comma-joined in one column, keep them through the upgrade.
+
+BEFORE_TABLES = '5d2c8e1f4a7b'
+LISTINGS = [
+    # amenities, images
+    (' Water , Park,Water', 'https://example.com/b.jpg, https://example.com/a.jpg,https://example.com/c.jpg'),
+    ('Park', 'https://example.com/d.jpg'),
+    (None, ''),
+]
+
+
+def test_amenities_and_images(app, db, seller):
+    import auth
+    from flask_migrate import downgrade, upgrade
+
+    with app.app_context():
+        downgrade(revision=BEFORE_TABLES)
+        try:
+            with auth.db.engine.begin() as connection:
+                ids = [connection.execute(text(
+                    'INSERT INTO property (seller_id, name, owner_name, location, address, price_range, negotiable, '
+                    'size, property_type, description, contacts, amenities, images) VALUES (:seller, :name, '
+                    "'Owner', 'Pune, Maharashtra', '1 Main Road', '45 Lakh', false, '1200 sq ft', 'Plots', "
+                    "'A plot', '9000000000', :amenities, :images) RETURNING id"),
+                    {'seller': seller, 'name': f'Plot {i}', 'amenities': amenities, 'images': images}).scalar()
+                    for i, (amenities, images) in enumerate(LISTINGS)]
+        finally:
+            upgrade()
+
+        listings = [auth.db.session.get(auth.Property, id) for id in ids]
+        assert [listing.amenity_names for listing in listings] == [['Park', 'Water'], ['Park'], []]
+        assert [listing.image_urls for listing in listings] == [
+            ['https://example.com/b.jpg', 'https://example.com/a.jpg', 'https://example.com/c.jpg'],
+            ['https://example.com/d.jpg'],
+            [],
+        ]
+        # One row per amenity, shared by the listings that have it
+        assert sorted(auth.db.session.scalars(auth.db.select(auth.Amenity.name))) == ['Park', 'Water']
@@ -0,0 +1,34 @@
+# /explore/near keeps a listing when its great-circle distance is within the
+# radius, however the listings are ordered.
+
+DELHI = (28.6, 77.2)
+
+
+def test_radius_is_great_circle(client, seller, add_listings):
+    # 233.90 km from Delhi, though the equirectangular approximation puts it at 233.27
+    add_listings(seller, 1, name='Jaipur Plot', latitude=26.9, longitude=75.8)
+    add_listings(seller, 1, name='Gurgaon Plot', latitude=28.46, longitude=77.03)
+
+    def near(radius_km):
+        response = client.get('/explore/near', query_string={'lat': DELHI[0], 'lng': DELHI[1], 'radius_km': radius_km})
+        assert response.status_code == 200
+        return [(p['name'], p['distance_km']) for p in response.json['properties']]
+
+    assert near(233.5) == [('Gurgaon Plot', 22.763)]
+    assert near(234) == [('Gurgaon Plot', 22.763), ('Jaipur Plot', 233.903)]
+
+
+def test_cursor_keeps_to_its_area(client, seller, add_listings):
+    add_listings(seller, 3, latitude=lambda i: 28.6 + i / 100, longitude=77.2)
+
+    def near(**args):
+        return client.get('/explore/near', query_string={'lat': DELHI[0], 'lng': DELHI[1], 'radius_km': 50,
+                                                         'limit': 2, **args})
+
+    cursor = near().json['next_cursor']
+    assert len(near(cursor=cursor).json['properties']) == 1
+    # Distances from another center, or another area, would skip or repeat listings
+    for changed in [{'lat': 28.7}, {'lng': 77.3}, {'radius_km': 40}, {'bbox': '77,28,78,29'}]:
+        response = near(cursor=cursor, **changed)
+        assert response.status_code == 400
+        assert response.json['error'] == 'Cursor is for another search'
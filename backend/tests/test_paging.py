@@ -0,0 +1,84 @@
+import base64
+import json
+
+import pytest
+
+# Keyset paging: following next_cursor walks a listing page by page in the
+# sort's order, each listing exactly once even where sort keys tie, and a
+# cursor that wasn't issued for the request is refused.
+
+PRICES = ['45 Lakh', '20 Lakh', '45 Lakh', '1 Cr', '20 Lakh', '45 Lakh', '2 Cr']
+NAMES = ['Plot B', 'Plot A', 'Plot B', 'Plot C', 'Plot A', 'Plot B', 'Plot A']
+
+
+def walk(client, path, **args):
+    """Every listing `path` returns, following next_cursor two at a time, as (id, name, price) in order."""
+    found, cursor = [], None
+    while True:
+        response = client.get(path, query_string={**args, 'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.json
+        found += [(p['id'], p['name'], p['price']) for p in response.json['properties']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return found
+
+
+@pytest.fixture
+def listings(seller, add_listings):
+    """(id, name, price) of listings whose names and prices tie with others'."""
+    ids = add_listings(seller, len(PRICES), name=lambda i: NAMES[i], price_range=lambda i: PRICES[i],
+                       property_type=lambda i: 'Plots' if i % 2 else 'Houses',
+                       description=lambda i: f'Corner plot with a garden, number {i}')
+    return list(zip(ids, NAMES, PRICES))
+
+
+def rupees(price):
+    number, unit = price.split()
+    return float(number) * {'Lakh': 100_000, 'Cr': 10_000_000}[unit]
+
+
+@pytest.mark.parametrize('sort, key, descending', [
+    ('newest', lambda listing: listing[0], True),
+    ('price_asc', lambda listing: (rupees(listing[2]), listing[0]), False),
+    ('price_desc', lambda listing: (rupees(listing[2]), listing[0]), True),
+    ('name', lambda listing: (listing[1], listing[0]), False),
+])
+def test_sorts(client, listings, sort, key, descending):
+    assert walk(client, '/explore', sort=sort) == sorted(listings, key=key, reverse=descending)
+
+
+def test_filtered(client, listings):
+    plots = [listing for i, listing in enumerate(listings) if i % 2]
+    assert walk(client, '/explore', type='Plots') == sorted(plots, reverse=True)
+    assert walk(client, '/explore', type='Plots', sort='price_asc') == sorted(
+        plots, key=lambda listing: (rupees(listing[2]), listing[0]))
+    # Indexed filters page through the bitmap index instead of the table
+    assert walk(client, '/explore', amenities='Water', type='Plots') == sorted(plots, reverse=True)
+
+
+def test_relevance(client, listings):
+    # Equally relevant, so ordered by id alone
+    assert walk(client, '/search', q='corner garden') == sorted(listings)
+
+
+def cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('sort, value', [
+    ('newest', 'not base64 at all!'),
+    ('newest', base64.urlsafe_b64encode(b'not json').decode()),
+    ('newest', cursor('newest', 5)),  # Too short
+    ('price_asc', cursor('newest', 5, 5)),  # Another sort's
+    ('newest', cursor('newest', 5, 'five')),
+    ('newest', cursor('newest', 5, True)),
+    ('newest', cursor('newest', 5, 1 << 70)),
+    ('newest', cursor('newest', {'id': 5}, 5)),
+    ('price_asc', cursor('price_asc', '4500000', 5)),
+    ('name', cursor('name', 5, 5)),
+    ('name', cursor('name', None, 5)),
+])
+def test_bad_cursor(client, listings, sort, value):
+    response = client.get('/explore', query_string={'sort': sort, 'cursor': value})
+    assert response.status_code == 400
+    assert 'ursor' in response.json['error']
@@ -0,0 +1,73 @@
+import pytest
+
+from parsing import parse_price_range, parse_size_sqft
+
+# The free-text price and size sellers type in, as numbers to filter and
+# sort on; text that isn't a price or size is kept but has no number.
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('50,00,000', (5_000_000, 5_000_000)),
+    ('Rs. 35,000', (35_000, 35_000)),
+    ('₹ 75 L', (7_500_000, 7_500_000)),
+    ('45 Lakh', (4_500_000, 4_500_000)),
+    ('45-60 Lakhs', (4_500_000, 6_000_000)),  # The upper bound's unit applies to both
+    ('1.2 Cr to 1.5 Cr', (12_000_000, 15_000_000)),
+    ('2 Crore', (20_000_000, 20_000_000)),
+    ('90 lac – 1.1 cr', (9_000_000, 11_000_000)),
+    ('500k', (500_000, 500_000)),
+    ('Price on request', (None, None)),
+    ('Negotiable', (None, None)),
+    ('45 bitcoin', (None, None)),
+    ('1-2-3 Lakh', (None, None)),
+    ('', (None, None)),
+    (None, (None, None)),
+])
+def test_parse_price_range(text, expected):
+    assert parse_price_range(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1200', 1200),
+    ('1,200 sq ft', 1200),
+    ('1200 sq. ft.', 1200),
+    ('1200 square feet', 1200),
+    ('100 sq m', 1076.39),
+    ('100 m²', 1076.39),
+    ('500 sq. yd', 4500),
+    ('200 gaj', 1800),
+    ('2 acres', 87120),
+    ('1.5 acre', 65340),
+    ('1 hectare', 107639),
+    ('2 bigha', None),
+    ('big', None),
+    ('', None),
+])
+def test_parse_size_sqft(text, expected):
+    assert parse_size_sqft(text) == (None if expected is None else pytest.approx(expected))
+
+
+def test_unpriced_listings(client, headers, seller, add_listings):
+    priced, = add_listings(seller, 1, name='Priced', price_range='45 Lakh')
+    response = client.post('/upload', headers=headers('seller', seller), json={
+        'name': 'Unpriced', 'owner_name': 'Owner', 'location': 'Pune, Maharashtra', 'address': '1 Main Road',
+        'price_range': 'Price on request', 'size': '1200 sq ft', 'type': 'Houses', 'description': 'A house',
+        'contacts': '9000000000',
+    })
+    assert response.status_code == 201, response.json
+    unpriced = response.json['id']
+
+    def names(**args):
+        response = client.get('/explore', query_string=args)
+        assert response.status_code == 200
+        return sorted(p['name'] for p in response.json['properties'])
+
+    assert names() == ['Priced', 'Unpriced']
+    # No price to compare: left out of price filters and price orderings
+    assert names(min_price=0) == names(max_price=10_000_000) == names(sort='price_asc') == ['Priced']
+
+    response = client.put(f'/upload/update/{priced}', headers=headers('seller', seller), json={'price': 'Call me'})
+    assert response.status_code == 200, response.json
+    response = client.put(f'/upload/update/{unpriced}', headers=headers('seller', seller), json={'price': '50 Lakh'})
+    assert response.status_code == 200, response.json
+    assert names(min_price=0) == ['Unpriced']
@@ -0,0 +1,77 @@
+import csv
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+import search
+
+# Paths only PostgreSQL takes: ON CONFLICT upserts, COPY bulk loads and the
+# tsvector and trigram search indexes. Set DATABASE_URL to run them (see
+# conftest.py).
+
+pytestmark = pytest.mark.skipif(make_url(os.environ['DATABASE_URL']).get_backend_name() != 'postgresql',
+                                reason="needs DATABASE_URL set to a PostgreSQL database")
+
+
+def test_cart_batch_skips_saved_listings(client, headers, buyer, seller, add_listings):
+    first, second = add_listings(seller, 2)
+
+    response = client.post('/cart/batch', json={'add': [first]}, headers=headers('buyer', buyer))
+    assert response.json['added'] == [first]
+
+    response = client.post('/cart/batch', json={'add': [first, second]}, headers=headers('buyer', buyer))
+    assert response.status_code == 200
+    assert response.json['added'] == [second]
+    assert response.json['already_saved'] == [first]
+
+    response = client.post('/cart/add', json={'property_id': second}, headers=headers('buyer', buyer))
+    assert response.status_code == 200
+    assert [item['id'] for item in client.post('/cart', headers=headers('buyer', buyer)).json['cart']] == [first, second]
+
+
+def test_import_properties_copies_rows(app, db, seller, tmp_path):
+    path = tmp_path / 'listings.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['seller_id', 'name', 'owner_name', 'location', 'address', 'price_range', 'size',
+                         'property_type', 'description', 'contacts', 'latitude', 'longitude', 'amenities', 'images'])
+        writer.writerow([seller, 'Sea "View" Flat', 'Owner', 'Mumbai, Maharashtra', '4, Marine Drive', '1.2 Cr',
+                         '900 sq ft', 'Flats', 'Two bedrooms,\nsea facing', '9000000000', '18.94', '72.82',
+                         'Water|Parking', 'https://example.com/a.jpg|https://example.com/b.jpg'])
+        writer.writerow([seller, 'Farm Land', 'Owner', 'Pune, Maharashtra', '', 'Price on request',
+                         '2 acres', 'Land', 'Fertile land', '9000000000', '', '', '', ''])
+
+    result = app.test_cli_runner().invoke(args=['import-properties', str(path)])
+    assert result.exit_code == 0, result.output
+
+    import auth
+    with app.app_context():
+        flat, farm = auth.Property.query.order_by(auth.Property.id).all()
+        assert (flat.name, flat.address, flat.description) == ('Sea "View" Flat', '4, Marine Drive',
+                                                              'Two bedrooms,\nsea facing')
+        assert (flat.price_min, flat.latitude) == (12000000, 18.94)
+        assert flat.amenity_names == ['Parking', 'Water']
+        assert flat.image_urls == ['https://example.com/a.jpg', 'https://example.com/b.jpg']
+        assert (farm.address, farm.price_min, farm.latitude, farm.amenity_names) == ('ggez', None, None, [])
+
+
+def test_search_indexes(app, client, seller, add_listings):
+    add_listings(seller, 1, name='Lakeside Villa', location='Bangalore, Karnataka', description='Villa by the lake')
+    add_listings(seller, 1, name='City Flat', location='Mumbai, Maharashtra', description='Flat near the station')
+
+    import auth
+    with app.app_context():
+        indexes = set(auth.db.session.scalars(text("SELECT indexname FROM pg_indexes WHERE tablename = 'property'")))
+        trigrams = auth.db.session.scalar(text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")) > 0
+    # The migration leaves out the trigram indexes where the pg_trgm module isn't installed
+    expected = search.POSTGRES_INDEXES if trigrams else {f'ix_property_{search.TSVECTOR_COLUMN}'}
+    assert expected <= indexes
+
+    response = client.get('/search', query_string={'q': 'lakeside'})
+    assert [p['name'] for p in response.json['properties']] == ['Lakeside Villa']
+
+    # Misspelled words are matched through the tsvector's vocabulary
+    response = client.get('/search', query_string={'q': 'mumbay flat', 'fuzzy': '1'})
+    assert [p['name'] for p in response.json['properties']] == ['City Flat']
@@ -0,0 +1,46 @@
+import pytest
+
+# The list views load a page of listings with a fixed number of statements,
+# however many listings it holds: one for the listings, one each for their
+# amenities and photos, never one per listing.
+
+MAX_STATEMENTS = 3
+
+
+def saved(app, model, buyer_id, property_ids):
+    with app.app_context():
+        import auth
+        auth.db.session.add_all(model(buyer_id=buyer_id, property_id=id) for id in property_ids)
+        auth.db.session.commit()
+
+
+def count_statements(client, statements, method, path, **kwargs):
+    # The signed-in identity is cached after the first request; count a request that finds it there
+    client.open(path, method=method, **kwargs)
+    statements.clear()
+    response = client.open(path, method=method, **kwargs)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('path, model_name', [('/cart', 'Cart'), ('/interest', 'Interested')])
+def test_saved_listings(app, client, statements, headers, buyer, seller, add_listings, path, model_name):
+    import auth
+    model = getattr(auth, model_name)
+    listings = add_listings(seller, 30)
+
+    saved(app, model, buyer, listings[:1])
+    few = count_statements(client, statements, 'POST', path, headers=headers('buyer', buyer))
+    saved(app, model, buyer, listings[1:])
+    many = count_statements(client, statements, 'POST', path, headers=headers('buyer', buyer))
+
+    assert few == many <= MAX_STATEMENTS
+
+
+def test_seller_listings(client, statements, seller, add_listings):
+    add_listings(seller, 1)
+    few = count_statements(client, statements, 'GET', f'/seller/explore/{seller}')
+    add_listings(seller, 30)
+    many = count_statements(client, statements, 'GET', f'/seller/explore/{seller}')
+
+    assert few == many <= MAX_STATEMENTS
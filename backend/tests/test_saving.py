@@ -0,0 +1,74 @@
+import pytest
+
+# Buyers saving listings to their cart and interest list, one at a time or
+# in batches: saving twice keeps one row, and unknown listings are reported.
+
+LISTS = [
+    ('/cart', 'Cart', 'Property added to cart successfully', 'Property already in cart'),
+    ('/interest', 'Interested', 'Added to interest', 'Already added to interest'),
+]
+
+
+def saved(app, model_name, buyer_id):
+    import auth
+    model = getattr(auth, model_name)
+    with app.app_context():
+        return sorted(row.property_id for row in model.query.filter_by(buyer_id=buyer_id))
+
+
+@pytest.mark.parametrize('path, model_name, added, already', LISTS)
+def test_save(app, client, headers, buyer, seller, add_listings, path, model_name, added, already):
+    listing, = add_listings(seller, 1)
+
+    def save(property_id):
+        return client.post(f'{path}/add', json={'property_id': property_id}, headers=headers('buyer', buyer))
+
+    response = save(listing)
+    assert (response.status_code, response.json['message']) == (201, added)
+    response = save(listing)
+    assert (response.status_code, response.json['message']) == (200, already)
+    response = save(listing + 100)
+    assert (response.status_code, response.json['error']) == (404, 'Property not found')
+    assert save(None).status_code == 400
+
+    assert saved(app, model_name, buyer) == [listing]
+
+
+@pytest.mark.parametrize('path, model_name', [(path, model_name) for path, model_name, _, _ in LISTS])
+def test_batch(app, client, headers, buyer, seller, add_listings, path, model_name):
+    a, b, c, d, e = add_listings(seller, 5)
+    missing = e + 100
+
+    def batch(**body):
+        return client.post(f'{path}/batch', json=body, headers=headers('buyer', buyer))
+
+    response = batch(add=[a, b, b])
+    assert response.status_code == 200
+    assert response.json == {'added': [a, b], 'already_saved': [], 'removed': [], 'not_found': []}
+
+    response = batch(add=[b, c, missing, d], remove=[a, e, missing, d])
+    assert response.status_code == 200
+    # d is both added and removed: the removal wins, and it was never saved
+    assert response.json == {'added': [c], 'already_saved': [b], 'removed': [a], 'not_found': [missing]}
+    assert saved(app, model_name, buyer) == [b, c]
+
+    response = batch(add=[c], remove=[c])
+    assert response.json == {'added': [], 'already_saved': [], 'removed': [c], 'not_found': []}
+    assert saved(app, model_name, buyer) == [b]
+
+
+@pytest.mark.parametrize('path', [path for path, _, _, _ in LISTS])
+def test_bad_batch(app, client, headers, buyer, seller, add_listings, path):
+    listing, = add_listings(seller, 1)
+
+    def error(**body):
+        response = client.post(f'{path}/batch', json=body, headers=headers('buyer', buyer))
+        assert response.status_code == 400
+        return response.json['error']
+
+    assert error() == error(add=[], remove=[]) == 'Nothing to add or remove'
+    assert error(add=[listing] * 300, remove=[listing] * 201) == 'At most 500 properties per batch'
+    assert error(add=str(listing)) == error(add=[listing, 'x']) == "'add' must be a list of property IDs"
+    assert error(remove=[True]) == "'remove' must be a list of property IDs"
+    response = client.post(f'{path}/batch', json={'add': [listing] * 500}, headers=headers('buyer', buyer))
+    assert response.json['added'] == [listing]  # At the limit
@@ -0,0 +1,74 @@
+import pytest
+
+# Full-text search: whatever the user types is searched for as words, each
+# matching as a prefix, and ranked the same way on SQLite (bm25) and
+# PostgreSQL (ts_rank_cd).
+
+
+def found(response):
+    """The names of the listings found, in rank order."""
+    assert response.status_code == 200, response.json
+    return [p['name'] for p in response.json['properties']]
+
+
+@pytest.fixture
+def listings(seller, add_listings):
+    add_listings(seller, 1, name='Lakeside Villa', location='Pune, Maharashtra', description='Villa near the lake')
+    add_listings(seller, 1, name='City Flat', location='Mumbai, Maharashtra', description='Flat by the station')
+
+
+@pytest.mark.parametrize('q, expected', [
+    ('"lakeside', ['Lakeside Villa']),  # Unbalanced quote
+    ('"lakeside villa"', ['Lakeside Villa']),
+    ('villa* lake', ['Lakeside Villa']),
+    ('NEAR(villa lake)', ['Lakeside Villa']),  # "near" is just a word, which this listing has
+    ('villa OR flat', []),  # So is "or": every word has to match
+    ('villa AND NOT flat', []),
+    ('-flat', ['City Flat']),
+    ('name:villa', []),  # Not a column filter
+    ('lake:* | flat', []),  # Nor tsquery syntax
+    ('(lake) & villa!', ['Lakeside Villa']),
+    ("flat's  station", ['City Flat']),
+])
+@pytest.mark.parametrize('path', ['/search', '/explore'])
+def test_user_input_is_words(client, listings, path, q, expected):
+    response = client.get(path, query_string={'q': q})
+    assert sorted(found(response)) == expected
+
+
+@pytest.mark.parametrize('q', ['*', '""', ' - ', '&|!'])
+def test_no_words(client, listings, q):
+    assert client.get('/search', query_string={'q': q}).status_code == 400
+    assert len(found(client.get('/explore', query_string={'q': q}))) == 2  # No search to narrow by
+
+
+@pytest.mark.parametrize('q, expected', [
+    ('lakes', ['Lakeside Villa']),
+    ('l', ['Lakeside Villa']),
+    ('mum fla', ['City Flat']),
+    ('side', []),  # Prefixes of words, not any part of them
+    ('lakesides', []),
+])
+def test_prefixes(client, listings, q, expected):
+    assert found(client.get('/search', query_string={'q': q})) == expected
+
+
+def test_ranking(client, seller, add_listings):
+    # The same word in each field in turn: a hit in the name counts most, then the location, address, description
+    add_listings(seller, 1, name='Garden Plot')
+    add_listings(seller, 1, name='Plot B', location='Garden City, Karnataka')
+    add_listings(seller, 1, name='Plot C', address='4 Garden Road')
+    add_listings(seller, 1, name='Plot D', description='Plot with a garden')
+    expected = ['Garden Plot', 'Plot B', 'Plot C', 'Plot D']
+    assert found(client.get('/search', query_string={'q': 'garden'})) == expected
+
+    # Paged by rank too
+    pages, cursor = [], None
+    while True:
+        response = client.get('/search', query_string={'q': 'gar', 'limit': 3,
+                                                       **({'cursor': cursor} if cursor else {})})
+        pages.append(found(response))
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+    assert pages == [expected[:3], expected[3:]]
@@ -0,0 +1,46 @@
+import msgpack
+import pytest
+
+# The API speaks MessagePack to clients that ask for it, and JSON to the rest.
+
+MSGPACK = 'application/msgpack'
+
+
+@pytest.mark.parametrize('mimetype', [MSGPACK, 'application/x-msgpack'])
+def test_explore(client, seller, add_listings, mimetype):
+    add_listings(seller, 3)
+    as_json = client.get('/explore')
+    assert as_json.mimetype == 'application/json'
+
+    response = client.get('/explore', headers={'Accept': mimetype})
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.headers['Vary']
+    assert msgpack.unpackb(response.data) == as_json.json
+    # Each format is cached on its own
+    assert client.get('/explore').json == as_json.json
+    assert client.get('/explore', headers={'Accept': f'application/json, {mimetype};q=0.5'}).json == as_json.json
+
+
+def test_cart_add(client, headers, buyer, seller, add_listings):
+    listing, = add_listings(seller, 1)
+    response = client.post('/cart/add', data=msgpack.packb({'property_id': listing}), content_type=MSGPACK,
+                           headers={'Accept': MSGPACK, **headers('buyer', buyer)})
+    assert response.status_code == 201
+    assert msgpack.unpackb(response.data) == {'message': 'Property added to cart successfully'}
+
+    # A MessagePack body with a JSON answer
+    response = client.post('/cart/add', data=msgpack.packb({'property_id': listing}), content_type=MSGPACK,
+                           headers=headers('buyer', buyer))
+    assert response.json == {'message': 'Property already in cart'}
+
+
+@pytest.mark.parametrize('body', [b'\xc1', b'\x92\x01', b'\x01\x02', b''])
+def test_malformed_body(client, headers, buyer, body):
+    response = client.post('/cart/add', data=body, content_type=MSGPACK, headers=headers('buyer', buyer))
+    assert response.status_code == 400
+
+
+def test_unsupported_body(client, headers, buyer):
+    response = client.post('/cart/add', data='property_id=1', content_type='text/plain',
+                           headers=headers('buyer', buyer))
+    assert response.status_code == 415
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.exc import OperationalError
+
+import storage
+
+# SQLite connections come set up for concurrent use, reads go to the reader
+# pool or a replica until the request writes, and SQLite replicas are
+# refreshed without readers ever seeing a partial copy.
+
+
+@pytest.fixture
+def sqlite_engines(app):
+    import auth
+    with app.app_context():
+        if auth.db.engine.dialect.name != 'sqlite':
+            pytest.skip('SQLite only')
+        engines = auth.db.engine, auth.db.engines[storage.READER_BIND]
+    for engine in engines:
+        engine.dispose()  # So each test sees new connections set up
+    return engines
+
+
+def pragmas(connection):
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name in ('journal_mode', 'busy_timeout', 'foreign_keys', 'synchronous', 'query_only')}
+
+
+def test_sqlite_pragmas(sqlite_engines):
+    writer, reader = sqlite_engines
+    expected = {'journal_mode': 'wal', 'busy_timeout': 5000, 'foreign_keys': 1, 'synchronous': 1}
+    with writer.connect() as connection:
+        assert pragmas(connection) == {**expected, 'query_only': 0}
+    with reader.connect() as connection:
+        assert pragmas(connection) == {**expected, 'query_only': 1}
+
+
+def test_reader_cannot_write(app, db, sqlite_engines):
+    import auth
+    writer, reader = sqlite_engines
+    with reader.connect() as connection:
+        with pytest.raises(OperationalError, match='readonly'):
+            connection.execute(auth.Amenity.__table__.insert().values(name='Pool'))
+    with writer.connect() as connection:
+        assert connection.scalar(select(auth.Amenity.name)) is None
+
+
+def test_reads_follow_writes(app, db, seller):
+    import auth
+    with app.app_context():
+        session = auth.db.session()
+        if session.read_bind() is None:
+            pytest.skip('Reads go to the primary')
+        reader = auth.db.engines[session.read_bind()]
+        assert session.get_bind(clause=select(auth.Property)) is reader
+
+        session.get(auth.Seller, seller).name = 'Renamed'
+        session.flush()
+        # The write isn't committed yet: only the primary's connection can see it
+        assert session.get_bind(clause=select(auth.Seller)) is auth.db.engine
+        assert session.scalar(select(auth.Seller.name)) == 'Renamed'
+
+        # Once committed the reader pool sees it too, so reads go back there
+        session.commit()
+        assert session.get_bind(clause=select(auth.Property)) is reader
+
+
+def test_replica_reads_stay_on_the_primary(app, db, seller):
+    import auth
+    with app.app_context():
+        session = auth.db.session()
+        session.info['read_bind'] = storage.REPLICA_BIND + '0'
+        session.execute(update(auth.Seller).where(auth.Seller.id == seller).values(name='Renamed'))
+        session.commit()
+        # A replica may not have the commit yet
+        assert session.get_bind(clause=select(auth.Seller)) is auth.db.engine
+        assert session.scalar(select(auth.Seller.name)) == 'Renamed'
+
+
+def test_refresh_replicas(tmp_path):
+    primary = str(tmp_path / 'primary.db')
+    with sqlite3.connect(primary) as connection:
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("CREATE TABLE listing (id INTEGER PRIMARY KEY)")
+        connection.execute("INSERT INTO listing VALUES (1)")
+    replica = create_engine('sqlite:///' + str(tmp_path / 'replica.db'))
+    engines = {None: create_engine('sqlite:///' + primary), storage.REPLICA_BIND + '0': replica}
+
+    storage.refresh_replicas(engines)
+    reading = replica.connect()
+    assert reading.scalars(text("SELECT id FROM listing")).all() == [1]
+
+    with sqlite3.connect(primary) as connection:
+        connection.execute("INSERT INTO listing VALUES (2)")
+    storage.refresh_replicas(engines)
+    # A reader already open finishes on the copy it had; new ones get the new copy
+    assert reading.scalars(text("SELECT id FROM listing")).all() == [1]
+    with replica.connect() as connection:
+        assert connection.scalars(text("SELECT id FROM listing")).all() == [1, 2]
+        assert connection.scalar(text("PRAGMA journal_mode")) == 'delete'
+    reading.close()
+    assert [name for name in os.listdir(tmp_path) if name.startswith('replica')] == ['replica.db']
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+from firebase_admin import auth
+
+import tokens
+from tokens import TokenCache
+
+# Verified Firebase ID tokens are answered from the cache until they expire,
+# and the cache stays within its size however many tokens pass through it.
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def verified():
+    """The tokens the fake verifier was asked to check, in order."""
+    return []
+
+
+@pytest.fixture
+def cache(clock, verified):
+    def verifier(id_token):
+        verified.append(id_token)
+        return {'uid': f'uid-{id_token}', 'iat': clock.now, 'exp': clock.now + 3600}
+    return TokenCache(max_entries=2, verifier=verifier, clock=clock)
+
+
+def test_verified_once_until_expiry(cache, clock, verified):
+    claims = cache.verify('token-a')
+    assert cache.verify('token-a') is claims
+    assert verified == ['token-a']
+
+    clock.now += 3599
+    assert cache.verify('token-a') is claims
+    clock.now += 1  # At exp the token is no good
+    assert cache.get('token-a') is None
+    assert cache.verify('token-a') is not claims
+    assert verified == ['token-a', 'token-a']
+
+
+def test_expired_claims_not_cached(cache, clock):
+    cache.put('token-a', {'uid': 'a', 'iat': 0, 'exp': clock.now})
+    assert cache.entries == {}
+
+
+def test_bounded(cache, clock, verified):
+    for i in range(100):
+        cache.verify(f'token-{i}')
+        clock.now += 1
+    assert len(cache.entries) == 2
+    # Keys the LRU dropped don't pile up in the expiry heap
+    assert len(cache.expiry) <= 2 * cache.max_entries + 1
+
+    cache.verify('token-98')
+    cache.verify('token-0')  # Evicts token-99, the least recently used
+    assert verified[-1] == 'token-0' and len(verified) == 101
+    cache.verify('token-98')
+    assert len(verified) == 101
+    cache.verify('token-99')
+    assert len(verified) == 102
+
+
+def test_check_revoked(cache, clock, verified, monkeypatch):
+    users = {'uid-a': SimpleNamespace(disabled=False, tokens_valid_after_timestamp=None)}
+    looked_up = []
+
+    def get_user(uid):
+        looked_up.append(uid)
+        return users[uid]
+    monkeypatch.setattr(tokens.auth, 'get_user', get_user)
+
+    issued = clock.now
+    cache.verify('a', check_revoked=True)
+    cache.verify('a', check_revoked=True)
+    # The signature is checked once; the user record on every call
+    assert verified == ['a'] and looked_up == ['uid-a', 'uid-a']
+
+    users['uid-a'].tokens_valid_after_timestamp = (issued + 1) * 1000
+    with pytest.raises(auth.RevokedIdTokenError):
+        cache.verify('a', check_revoked=True)
+    assert cache.verify('a')['uid'] == 'uid-a'  # Only a check_revoked caller asks
+
+    users['uid-a'] = SimpleNamespace(disabled=True, tokens_valid_after_timestamp=None)
+    with pytest.raises(auth.UserDisabledError):
+        cache.verify('a', check_revoked=True)
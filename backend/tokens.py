@@ -0,0 +1,84 @@
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from firebase_admin import auth
+
+# Cache of verified Firebase ID-token claims. Verifying a token means an RSA
+# signature check (and a certificate fetch when Google rotates keys), so a
+# token seen before is answered from here until its `exp`. Keys are a SHA-256
+# of the token so the raw credential is never held in memory.
+
+
+class TokenCache:
+    def __init__(self, max_entries=1024, verifier=auth.verify_id_token, clock=time.time):
+        self.max_entries = max_entries
+        self.verifier = verifier
+        self.clock = clock
+        self.entries = OrderedDict()  # token hash -> claims, least recently used first
+        self.expiry = []  # heap of (exp, token hash)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(id_token):
+        return hashlib.sha256(id_token.encode()).digest()
+
+    def _evict_expired(self, now):
+        while self.expiry and self.expiry[0][0] <= now:
+            exp, key = heapq.heappop(self.expiry)
+            claims = self.entries.get(key)
+            if claims is not None and claims['exp'] == exp:
+                del self.entries[key]
+
+    def get(self, id_token):
+        key = self.key(id_token)
+        with self.lock:
+            self._evict_expired(self.clock())
+            claims = self.entries.get(key)
+            if claims is not None:
+                self.entries.move_to_end(key)
+            return claims
+
+    def put(self, id_token, claims):
+        key = self.key(id_token)
+        with self.lock:
+            now = self.clock()
+            self._evict_expired(now)
+            if claims['exp'] <= now:
+                return
+            self.entries[key] = claims
+            self.entries.move_to_end(key)
+            heapq.heappush(self.expiry, (claims['exp'], key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            # Keep the heap from filling with keys the LRU already dropped
+            if len(self.expiry) > 2 * self.max_entries:
+                self.expiry = [(cached['exp'], k) for k, cached in self.entries.items()]
+                heapq.heapify(self.expiry)
+
+    def verify(self, id_token, check_revoked=False):
+        """Return the decoded claims for `id_token`, verifying it only on a cache miss.
+
+        With check_revoked, the user's record is fetched on every call (as
+        firebase_admin does) to reject disabled users and tokens issued before
+        a revocation; only the signature check is skipped on a hit.
+        """
+        claims = self.get(id_token)
+        if claims is None:
+            claims = self.verifier(id_token)
+            self.put(id_token, claims)
+
+        if check_revoked:
+            user = auth.get_user(claims['uid'])
+            if user.disabled:
+                raise auth.UserDisabledError('The user record is disabled.')
+            if user.tokens_valid_after_timestamp and claims['iat'] * 1000 < user.tokens_valid_after_timestamp:
+                raise auth.RevokedIdTokenError('The Firebase ID token has been revoked.')
+        return claims
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.expiry = []